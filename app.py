@@ -1,80 +1,75 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+import json
+import os
 import threading
-import time
-from stock_analyzer import StockAnalyzer
-from config import validate_config, DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD
+from datetime import datetime
+from config import (validate_config, DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD, MAX_SWEEP_COMBINATIONS, CHART_DAYS,
+                    CACHE_EXPIRE_TIME, FAST_STARTUP, SNAPSHOT_DIR, SCHEDULE_ENABLED, SEARCH_LIMIT, SEARCH_MAX_LIMIT,
+                    SCAN_CHECKPOINT_DIR)
+from metrics import REGISTRY, stats_metrics
+from snapshot import load_snapshot
+from response_format import ENCODED_CACHE, FormatError, paged_response
+from stock_search import get_search_index
 
 app = Flask(__name__)
 
 # 全局变量
 analyzer = None
-analysis_result = None
-analysis_status = 'idle'  # idle, running, completed, error
-analysis_progress = 0
+job_manager = None
+scheduler = None  # 收盘后定时预计算
+latest_job_id = None  # 最近提交的任务，兼容不带任务ID的状态和结果接口
+snapshot = None  # 启动时从磁盘读取的上次股票列表和扫描结果
+init_lock = threading.Lock()
 
 def initialize_analyzer():
-    """初始化股票分析器"""
-    global analyzer
-    if validate_config():
-        analyzer = StockAnalyzer()
-        return True
-    else:
-        return False
-
-def background_analysis(stock_list, long_period, diff_threshold):
-    """后台分析股票"""
-    global analysis_result, analysis_status, analysis_progress
+    """初始化股票分析器，多个请求同时触发时只初始化一次"""
+    global analyzer, job_manager, scheduler
+
+    with init_lock:
+        if analyzer is not None:
+            return True
+        if not validate_config():
+            return False
+
+        # pandas、tushare等较重的依赖在这里才第一次导入
+        from stock_analyzer import StockAnalyzer
+        from job_manager import JobManager
+        from scheduler import DailyScheduler
+
+        new_analyzer = StockAnalyzer(snapshot_dir=SNAPSHOT_DIR if FAST_STARTUP else None,
+                                     checkpoint_dir=SCAN_CHECKPOINT_DIR)
+        if snapshot is not None:
+            new_analyzer.restore_snapshot(snapshot)
+        job_manager = JobManager(new_analyzer)
+        analyzer = new_analyzer
+
+        if SCHEDULE_ENABLED:
+            scheduler = DailyScheduler(analyzer)
+            scheduler.start()
+
+    # 后台补齐本地存储中缺失的交易日
+    analyzer.fetcher.sync_store(force=True, wait=False)
+    return True
+
+def prewarm():
+    """后台预热：初始化分析器，重新获取股票列表，并按默认参数完成一次全市场扫描"""
+    if not initialize_analyzer():
+        return
 
     try:
-        analysis_status = 'running'
-        analysis_progress = 0
-
-        if analyzer is None:
-            if not initialize_analyzer():
-                raise Exception("无法初始化股票分析器，请检查tushare API token配置")
-
-        # 开始分析
-        total = len(stock_list)
-        results = []
-
-        for i, (_, stock) in enumerate(stock_list.iterrows()):
-            ts_code = stock['ts_code']
-            name = stock['name']
-
-            # 更新进度
-            analysis_progress = int((i + 1) / total * 100)
-
-            # 分析单只股票
-            result = analyzer.calculate_ma_diff(ts_code, long_period)
-
-            if result:
-                result['name'] = name
-                results.append(result)
-
-            # 小延迟，避免API限制
-            time.sleep(0.1)
-
-        # 处理分析结果
-        import pandas as pd
-        df = pd.DataFrame(results)
-
-        if not df.empty:
-            # 筛选差异大于阈值的股票
-            df = df[df['diff_percent'].abs() > diff_threshold]
-
-            # 按差异百分比绝对值从大到小排序
-            df = df.sort_values('diff_percent', key=lambda x: x.abs(), ascending=False)
-
-            # 保留需要的列并排序
-            df = df[['ts_code', 'name', 'diff_percent', 'latest_close', 'long_mean', 'latest_ma5']]
+        if not analyzer.fetcher.get_stock_list(refresh=True).empty:
+            analyzer.save_snapshot()
+        # 快照中的结果仍是最新交易日时任务直接完成，否则在后台重新扫描并写入新快照
+        job_manager.submit(DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD)
+    except Exception as e:
+        print(f"后台预热失败: {e}")
 
-        analysis_result = df
-        analysis_status = 'completed'
+def warm_start():
+    """快速启动：读取磁盘快照后立即返回，分析器的初始化和缓存刷新在后台线程中进行"""
+    global snapshot
 
-    except Exception as e:
-        print(f"分析失败: {e}")
-        analysis_status = 'error'
-        analysis_result = str(e)
+    snapshot = load_snapshot()
+    threading.Thread(target=prewarm, daemon=True).start()
 
 @app.route('/')
 def index():
@@ -85,8 +80,8 @@ def index():
 
 @app.route('/api/configure', methods=['POST'])
 def configure():
-    """配置分析参数并开始分析"""
-    global analysis_result, analysis_status, analysis_progress
+    """配置分析参数并提交筛选任务"""
+    global latest_job_id
 
     try:
         # 获取参数
@@ -110,63 +105,289 @@ def configure():
         if stock_list.empty:
             return jsonify({'success': False, 'message': '无法获取股票列表'})
 
-        # 重置状态
-        analysis_result = None
-        analysis_status = 'running'
-        analysis_progress = 0
+        # 相同参数的任务仍在运行时合并为同一个任务；当前交易日已有缓存结果时任务直接完成。
+        # profile=1时完整扫描一次并记录cProfile报告，通过/api/profile/<任务ID>查看
+        profile = request.form.get('profile') in ('1', 'true')
+        job = job_manager.submit(long_period, diff_threshold, profile=profile)
+        latest_job_id = job.id
 
-        # 启动后台分析线程
-        thread = threading.Thread(target=background_analysis, args=(stock_list, long_period, diff_threshold))
-        thread.daemon = True
-        thread.start()
-
-        return jsonify({'success': True, 'total_stocks': len(stock_list)})
+        return jsonify({'success': True, 'job_id': job.id, 'total_stocks': len(stock_list),
+                        'cached': job.cached})
 
     except Exception as e:
         return jsonify({'success': False, 'message': f'配置失败: {str(e)}'})
 
+@app.route('/api/sweep', methods=['POST'])
+def sweep():
+    """提交参数扫描任务：一次计算多组长期周期和差异阈值的筛选结果，完成后通过/api/results/<任务ID>获取"""
+    global latest_job_id
+
+    try:
+        # 获取参数，多个值用逗号分隔
+        long_periods = [int(v) for v in request.form.get('long_periods', str(DEFAULT_LONG_PERIOD)).split(',') if v.strip()]
+        diff_thresholds = [float(v) for v in request.form.get('diff_thresholds', str(DEFAULT_DIFF_THRESHOLD)).split(',') if v.strip()]
+
+        # 验证参数
+        if not long_periods or any(p < 5 or p > 365 for p in long_periods):
+            return jsonify({'success': False, 'message': '长期周期应在5-365天之间'})
+
+        if not diff_thresholds or any(t < 0 or t > 100 for t in diff_thresholds):
+            return jsonify({'success': False, 'message': '差异阈值应在0-100之间'})
+
+        if len(long_periods) * len(diff_thresholds) > MAX_SWEEP_COMBINATIONS:
+            return jsonify({'success': False, 'message': f'参数组合不能超过{MAX_SWEEP_COMBINATIONS}组'})
+
+        # 初始化分析器
+        if analyzer is None:
+            if not initialize_analyzer():
+                return jsonify({'success': False, 'message': '无法初始化股票分析器，请检查tushare API token配置'})
+
+        # 全市场扫描耗时较长，在任务线程池中执行；参数相同的扫描仍在运行时合并为同一个任务
+        job = job_manager.submit_sweep(long_periods, diff_thresholds)
+        latest_job_id = job.id
+
+        return jsonify({'success': True, 'job_id': job.id})
+
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数格式错误，多个值请用逗号分隔'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'参数扫描失败: {str(e)}'})
+
+@app.route('/api/screen', methods=['POST'])
+def screen():
+    """指标筛选：按任意两个指标的差异筛选，如 pairs=ema_12:sma_60,sma_5:boll_upper，所有指标一次算出"""
+    try:
+        pairs = [tuple(pair.strip().split(':')) for pair in request.form.get('pairs', '').split(',') if pair.strip()]
+        diff_thresholds = [float(v) for v in request.form.get('diff_thresholds', str(DEFAULT_DIFF_THRESHOLD)).split(',') if v.strip()]
+
+        # 验证参数
+        if not pairs or any(len(pair) != 2 for pair in pairs):
+            return jsonify({'success': False, 'message': '指标对格式应为 指标1:指标2，多组用逗号分隔'})
+
+        if not diff_thresholds or any(t < 0 or t > 100 for t in diff_thresholds):
+            return jsonify({'success': False, 'message': '差异阈值应在0-100之间'})
+
+        if len(pairs) * len(diff_thresholds) > MAX_SWEEP_COMBINATIONS:
+            return jsonify({'success': False, 'message': f'参数组合不能超过{MAX_SWEEP_COMBINATIONS}组'})
+
+        # 初始化分析器
+        if analyzer is None:
+            if not initialize_analyzer():
+                return jsonify({'success': False, 'message': '无法初始化股票分析器，请检查tushare API token配置'})
+
+        from indicators import required_history
+        for pair in pairs:
+            for spec in pair:
+                if required_history(spec) > 365:
+                    return jsonify({'success': False, 'message': f'指标 {spec} 需要的历史过长'})
+
+        combinations = analyzer.screen_indicators(pairs, diff_thresholds)
+
+        # 转换为JSON格式
+        data = [{
+            'fast': c['fast'],
+            'slow': c['slow'],
+            'diff_threshold': c['diff_threshold'],
+            'count': len(c['results']),
+            'stocks': c['results'].to_dict('records')
+        } for c in combinations]
+
+        return jsonify({'success': True, 'data': data})
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'参数错误: {str(e)}'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'指标筛选失败: {str(e)}'})
+
+def find_job(job_id):
+    """按ID查找任务，未指定ID时使用最近提交的任务"""
+    job_id = job_id or latest_job_id
+    if job_manager is None or job_id is None:
+        return None
+    return job_manager.get(job_id)
+
 @app.route('/api/status')
-def get_status():
+@app.route('/api/status/<job_id>')
+def get_status(job_id=None):
     """获取分析状态"""
-    global analysis_status, analysis_progress
+    job = find_job(job_id)
+    if job is None:
+        if job_id:
+            return jsonify({'success': False, 'status': 'unknown', 'message': '任务不存在或已过期'}), 404
+        return jsonify({'status': 'idle', 'progress': 0})
+
+    return jsonify(job.to_status())
+
+@app.errorhandler(FormatError)
+def handle_format_error(e):
+    return jsonify({'success': False, 'message': str(e)}), e.status
+
+def get_precomputed_results():
+    """不指定任务、带long_period参数时，直接返回收盘后预计算的结果，不触发扫描"""
+    try:
+        long_period = int(request.args['long_period'])
+        diff_threshold = float(request.args.get('diff_threshold', DEFAULT_DIFF_THRESHOLD))
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数格式错误'})
+
+    if analyzer is None:
+        return jsonify({'success': False, 'message': '预计算结果尚未就绪'})
+
+    result = analyzer.get_cached_results(long_period, diff_threshold)
+    if result is None:
+        return jsonify({'success': False, 'message': '当前交易日还没有该周期的预计算结果，请提交筛选'})
+    if result.empty:
+        return jsonify({'success': False, 'message': '没有找到符合条件的股票'})
+
+    version = ('precomputed', analyzer.fetcher.get_latest_trade_date(), long_period, diff_threshold)
+    return paged_response(request, result, version, list(result.columns))
 
-    return jsonify({
-        'status': analysis_status,
-        'progress': analysis_progress
-    })
+def sweep_data(combinations):
+    """参数扫描结果转换为JSON格式，每个 周期 × 阈值 组合一项"""
+    return [{
+        'long_period': c['long_period'],
+        'diff_threshold': c['diff_threshold'],
+        'count': len(c['results']),
+        'stocks': c['results'].to_dict('records')
+    } for c in combinations]
 
 @app.route('/api/results')
-def get_results():
+@app.route('/api/results/<job_id>')
+def get_results(job_id=None):
     """获取分析结果"""
-    global analysis_result, analysis_status
+    if job_id is None and 'long_period' in request.args:
+        return get_precomputed_results()
 
-    if analysis_status != 'completed':
+    job = find_job(job_id)
+    if job is None:
+        if job_id:
+            return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
         return jsonify({'success': False, 'message': '分析尚未完成'})
 
-    if analysis_result is None or analysis_result.empty:
-        return jsonify({'success': False, 'message': '没有找到符合条件的股票'})
+    if job.status == 'error':
+        return jsonify({'success': False, 'message': f'分析失败: {job.error}'})
+
+    if job.status != 'completed':
+        return jsonify({'success': False, 'message': '分析尚未完成'})
+
+    if job.kind == 'sweep':
+        return jsonify({'success': True, 'data': sweep_data(job.result), 'coverage': job.coverage})
 
-    # 转换为JSON格式
-    results = {
-        'stocks': analysis_result.to_dict('records'),
-        'count': len(analysis_result)
-    }
+    if job.result is None or job.result.empty:
+        return jsonify({'success': False, 'message': '没有找到符合条件的股票'})
 
-    return jsonify({'success': True, 'data': results})
+    # 结果已按差异绝对值排好序，分页时只编码请求的一段；任务结果完成后不再变化，以任务ID作为版本
+    return paged_response(request, job.result, ('job', job.id), list(job.result.columns))
+
+@app.route('/api/scheduler')
+def get_scheduler_status():
+    """收盘后定时预计算的状态：下次运行时间、重试次数和最近的运行记录（含耗时）"""
+    if scheduler is None:
+        return jsonify({'success': False, 'message': '定时预计算未启用或分析器尚未初始化'})
+
+    return jsonify({'success': True, 'data': scheduler.status()})
+
+@app.route('/api/stream/<job_id>')
+def stream_results(job_id):
+    """流式推送任务结果：每只符合条件的股票算出后立即推送，默认为Server-Sent Events，format=ndjson时逐行输出JSON"""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
+
+    ndjson = request.args.get('format') == 'ndjson'
+
+    def generate():
+        for event in job.events():
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"{data}\n" if ndjson else f"data: {data}\n\n"
+
+    mimetype = 'application/x-ndjson' if ndjson else 'text/event-stream'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/leaderboard/<job_id>')
+def get_leaderboard(job_id):
+    """获取任务当前差异最大的前K只股票，扫描进行中也可以查询"""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
+
+    return jsonify({'success': True, 'data': {'stocks': job.top.items(), 'count': len(job.matches),
+                                              **job.to_status()}})
+
+@app.route('/api/profile/<job_id>')
+def get_profile(job_id):
+    """获取以profile=1提交的任务的cProfile报告（纯文本）"""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
+
+    if job.profile_stats is None:
+        message = '任务未开启性能分析' if not job.profile else '分析尚未完成'
+        return jsonify({'success': False, 'message': message})
+
+    return Response(job.profile_stats, mimetype='text/plain')
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Prometheus文本格式的运行指标：接口调用次数/耗时/错误、令牌桶等待、扫描各阶段耗时、缓存命中和任务数量"""
+    extra = []
+    if analyzer is not None:
+        extra += stats_metrics('data_cache', '行情缓存', analyzer.fetcher.get_cache_stats(),
+                               counters=('hits', 'misses', 'evictions', 'expirations', 'coalesced'))
+    if job_manager is not None:
+        extra += stats_metrics('scan_jobs', '筛选任务数量', job_manager.stats())
+    extra += stats_metrics('response_cache', '编码后的结果响应缓存', ENCODED_CACHE.stats(), counters=('hits', 'misses'))
+
+    return Response(REGISTRY.render(extra), mimetype='text/plain; version=0.0.4')
+
+def trade_date_modified(trade_date):
+    """交易日数据的最后修改时间：该交易日收盘数据发布的时间点（CACHE_EXPIRE_TIME）"""
+    hour, minute = map(int, CACHE_EXPIRE_TIME.split(':'))
+    return datetime.strptime(trade_date, '%Y%m%d').replace(hour=hour, minute=minute).astimezone()
+
+def set_trade_date_cache(response, etag, trade_date):
+    """添加ETag、Last-Modified和缓存到下次收盘后的Cache-Control"""
+    from data_cache import next_expire_time
+
+    response.set_etag(etag)
+    response.last_modified = trade_date_modified(trade_date)
+    response.cache_control.public = True
+    response.cache_control.max_age = max(int((next_expire_time() - datetime.now()).total_seconds()), 0)
+    return response
 
 @app.route('/api/stock_details/<ts_code>')
 def get_stock_details(ts_code):
-    """获取股票详细数据"""
+    """获取股票详细数据
+
+    图表数据在下一个交易日之前不会变化，响应带ETag和Last-Modified，浏览器和代理可以缓存到下次收盘后；
+    带If-None-Match或If-Modified-Since的重复请求在读取数据之前就返回304。
+    """
     try:
         if analyzer is None:
             if not initialize_analyzer():
                 return jsonify({'success': False, 'message': '无法初始化股票分析器'})
 
-        details = analyzer.get_stock_details(ts_code, 60)
+        trade_date = analyzer.fetcher.get_latest_trade_date()
+        etag = f"{ts_code}-{trade_date}-{CHART_DAYS}"
+
+        if trade_date is not None:
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and \
+                    request.if_modified_since >= trade_date_modified(trade_date).replace(microsecond=0)
+            if not_modified:
+                return set_trade_date_cache(app.response_class(status=304), etag, trade_date)
+
+        details = analyzer.get_stock_details(ts_code, CHART_DAYS, trade_date)
         if details is None:
             return jsonify({'success': False, 'message': '无法获取股票详情'})
 
-        return jsonify({'success': True, 'data': details})
+        response = jsonify({'success': True, 'data': details})
+        if trade_date is not None:
+            set_trade_date_cache(response, etag, trade_date)
+        return response
 
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取股票详情失败: {str(e)}'})
@@ -175,6 +396,11 @@ def get_stock_details(ts_code):
 def get_stock_list():
     """获取股票列表（用于搜索）"""
     try:
+        # 分析器还在后台初始化时先用快照中的股票列表
+        if analyzer is None and snapshot is not None:
+            return paged_response(request, snapshot['stock_list'], ('snapshot', snapshot['saved_at']),
+                                  ['ts_code', 'name'], nested=False)
+
         if analyzer is None:
             if not initialize_analyzer():
                 return jsonify({'success': False, 'message': '无法初始化股票分析器'})
@@ -183,31 +409,70 @@ def get_stock_list():
         if stock_list.empty:
             return jsonify({'success': False, 'message': '无法获取股票列表'})
 
-        # 转换为JSON格式
-        stocks = stock_list[['ts_code', 'name']].to_dict('records')
-
-        return jsonify({'success': True, 'data': stocks})
+        version = ('stock_list', stock_list.attrs.get('loaded_at', id(stock_list)))
+        return paged_response(request, stock_list, version, ['ts_code', 'name'], nested=False)
 
+    except FormatError:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取股票列表失败: {str(e)}'})
 
+@app.route('/api/stock_search')
+def stock_search():
+    """按代码前缀、名称或拼音首字母搜索股票，只返回排名最靠前的limit只"""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', SEARCH_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+
+    try:
+        # 分析器还在后台初始化时先在快照中的股票列表上搜索
+        if analyzer is None and snapshot is not None:
+            index = get_search_index(snapshot['stock_list'], ('snapshot', snapshot['saved_at']))
+        else:
+            if analyzer is None:
+                if not initialize_analyzer():
+                    return jsonify({'success': False, 'message': '无法初始化股票分析器'})
+
+            stock_list = analyzer.fetcher.get_stock_list()
+            if stock_list.empty:
+                return jsonify({'success': False, 'message': '无法获取股票列表'})
+
+            # 股票列表刷新后版本改变，索引随之重建
+            index = get_search_index(stock_list, ('stock_list', stock_list.attrs.get('loaded_at', id(stock_list))))
+
+        return jsonify({'success': True, 'data': index.search(query, limit)})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'搜索股票失败: {str(e)}'})
+
 @app.route('/api/reset')
-def reset_analysis():
-    """重置分析状态"""
-    global analysis_result, analysis_status, analysis_progress
+@app.route('/api/reset/<job_id>')
+def reset_analysis(job_id=None):
+    """重置分析状态，丢弃指定任务（默认最近提交的任务）的结果"""
+    global latest_job_id
+
+    job_id = job_id or latest_job_id
+    if job_manager is not None and job_id is not None:
+        job_manager.discard(job_id)
 
-    analysis_result = None
-    analysis_status = 'idle'
-    analysis_progress = 0
+    if job_id == latest_job_id:
+        latest_job_id = None
 
     return jsonify({'success': True, 'message': '分析状态已重置'})
 
 if __name__ == '__main__':
-    # 初始化分析器
-    initialize_analyzer()
+    debug = True
+
+    # debug模式下werkzeug重载器的父进程只负责监视文件变化，应用运行在它启动的子进程中（WERKZEUG_RUN_MAIN=true）。
+    # 只在子进程中初始化，否则两个进程各自启动定时预计算并提交预热扫描，重复消耗tushare配额
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # 初始化分析器
+        if FAST_STARTUP:
+            warm_start()
+        else:
+            initialize_analyzer()
 
-    print("A股股票均线差异筛选工具已启动")
-    print("请访问 http://localhost:5000")
-    print("首次使用请在 config.py 中配置您的 tushare API token")
+        print("A股股票均线差异筛选工具已启动")
+        print("请访问 http://localhost:5000")
+        print("首次使用请在 config.py 中配置您的 tushare API token")
 
-    app.run(debug=True)
+    app.run(debug=debug)
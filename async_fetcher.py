@@ -0,0 +1,170 @@
+import asyncio
+import inspect
+import time
+import numpy as np
+import pandas as pd
+from config import FETCH_WORKERS, FETCH_MAX_RETRIES, FETCH_RETRY_BACKOFF
+from fetch_pool import TokenBucket, error_reason, is_retryable_error, retry_delay
+from metrics import RATE_LIMIT_WAIT, record_api_call
+from ma_engine import compute_single_ma_diff
+from compact import CompactBars
+from stock_data import adjust_qfq, prepare_daily
+
+class AsyncStockDataFetcher:
+    """异步股票数据获取器
+
+    pro可以是同步的tushare pro_api（在线程中执行），也可以是方法为协程的异步实现
+    （如fake_tushare.AsyncFakeProApi）。并发数由信号量限制，调用频率由令牌桶限制。
+    """
+
+    def __init__(self, pro, store=None, cache=None, limiter=None, concurrency=FETCH_WORKERS,
+                 max_retries=FETCH_MAX_RETRIES, backoff=FETCH_RETRY_BACKOFF):
+        self.pro = pro
+        self.store = store
+        self.cache = cache
+        self.limiter = limiter or TokenBucket()
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    @classmethod
+    def from_fetcher(cls, fetcher, concurrency=FETCH_WORKERS):
+        """复用同步获取器的pro_api、本地存储、缓存和令牌桶，两者共享同一份调用配额"""
+        return cls(fetcher.pro, store=fetcher.store, cache=fetcher.cache, limiter=fetcher.pool.limiter,
+                   concurrency=concurrency)
+
+    async def call_api(self, api_name, **kwargs):
+        """限流调用tushare接口，频率超限或网络错误时退避重试"""
+        func = getattr(self.pro, api_name)
+
+        for attempt in range(self.max_retries + 1):
+            wait = self.limiter.reserve()
+            RATE_LIMIT_WAIT.observe(wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            start = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(func):
+                    result = await func(**kwargs)
+                else:
+                    result = await asyncio.to_thread(func, **kwargs)
+                record_api_call(api_name, time.perf_counter() - start)
+                return result
+            except Exception as e:
+                record_api_call(api_name, time.perf_counter() - start, error_reason(e))
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = retry_delay(attempt, self.backoff)
+                print(f"API调用失败（{e}），{delay:.1f}秒后第{attempt + 1}次重试")
+                await asyncio.sleep(delay)
+
+    async def fetch_daily_qfq(self, ts_code):
+        """从API获取单只股票的前复权日线（daily + adj_factor两次调用）"""
+        daily = await self.call_api('daily', ts_code=ts_code)
+        if daily.empty:
+            return daily
+
+        factors = await self.call_api('adj_factor', ts_code=ts_code, fields='trade_date,adj_factor')
+        return adjust_qfq(daily, factors)
+
+    async def get_stock_list(self):
+        """获取A股股票列表"""
+        try:
+            df = await self.call_api('stock_basic', exchange='', list_status='L', fields='ts_code,name,industry')
+            return df[df['ts_code'].str.startswith(('6', '0', '3'))]  # 只保留沪深股票
+        except Exception as e:
+            print(f"获取股票列表失败: {e}")
+            return pd.DataFrame()
+
+    async def get_recent_bars(self, ts_code, days=30):
+        """获取股票最近N天的紧凑日线（CompactBars），本地存储中的数据足够时直接读取，失败时返回None"""
+        try:
+            return await self.load_recent_bars(ts_code, days)
+        except Exception as e:
+            print(f"获取股票{ts_code}最近{days}天数据失败: {e}")
+            return None
+
+    async def load_recent_bars(self, ts_code, days=30):
+        """同get_recent_bars，但获取失败时抛出异常，没有数据时返回None"""
+        cache_key = f"recent_{ts_code}_{days}"
+        cached = self.cache.get(cache_key) if self.cache is not None else None
+        if cached is not None:
+            return cached
+
+        if self.store is not None and self.store.count_rows(ts_code) >= days:
+            df = self.store.get_history(ts_code).tail(days)
+        else:
+            df = await self.fetch_daily_qfq(ts_code)
+
+        if df.empty:
+            return None
+
+        bars = CompactBars.from_daily(prepare_daily(df, days))
+        if self.cache is not None:
+            self.cache.set(cache_key, bars)
+        return bars
+
+    async def get_recent_data(self, ts_code, days=30):
+        """获取股票最近N天的日线数据，返回包含trade_date、close、ma5的DataFrame"""
+        bars = await self.get_recent_bars(ts_code, days)
+        return bars.to_frame() if bars is not None else pd.DataFrame()
+
+    async def scan(self, stock_list, long_period=20):
+        """流式扫描：在信号量限制下并发获取，每只股票的数据一到就计算均线差异
+
+        异步产出 (已完成数量, 总数, 股票代码, 结果, 错误)：数据不足的股票结果为None，
+        获取失败的股票结果为None、错误为异常对象，调用方可以据此重试。
+        """
+        days_needed = long_period + 10
+        semaphore = asyncio.Semaphore(self.concurrency)
+        total = len(stock_list)
+
+        async def fetch(ts_code, name):
+            try:
+                async with semaphore:
+                    bars = await self.load_recent_bars(ts_code, days_needed)
+            except Exception as e:
+                print(f"获取股票{ts_code}最近{days_needed}天数据失败: {e}")
+                return ts_code, None, e
+
+            if bars is None:
+                return ts_code, None, None
+
+            result = compute_single_ma_diff(bars.closes(), long_period)
+            return ts_code, ({'ts_code': ts_code, 'name': name, **result} if result else None), None
+
+        tasks = [asyncio.create_task(fetch(stock['ts_code'], stock['name']))
+                 for _, stock in stock_list.iterrows()]
+
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                yield (done, total, *await task)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def analyze_stocks(self, stock_list, long_period=20, progress_callback=None, result_callback=None):
+        """运行流式扫描并汇总为未筛选的DataFrame
+
+        progress_callback按已完成数量汇报进度，result_callback在每只股票算出结果时立即调用。
+        """
+        # 结果直接写入按stock_list顺序预分配的数组，不保留逐只的字典
+        position = {ts_code: i for i, ts_code in enumerate(stock_list['ts_code'])}
+        columns = {name: np.full(len(stock_list), np.nan)
+                   for name in ['long_mean', 'latest_ma5', 'diff_percent', 'latest_close']}
+
+        async for done, total, _, result, _ in self.scan(stock_list, long_period):
+            if result:
+                i = position[result['ts_code']]
+                for name, values in columns.items():
+                    values[i] = result[name]
+                if result_callback:
+                    result_callback(result)
+
+            if progress_callback:
+                progress_callback(done, total)
+
+        df = pd.DataFrame({'ts_code': stock_list['ts_code'].to_numpy(), 'name': stock_list['name'].to_numpy(),
+                           **columns})
+        return df[df['diff_percent'].notna()].reset_index(drop=True)
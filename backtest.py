@@ -0,0 +1,153 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from config import DATA_STORE_DIR
+from data_store import OHLCStore
+from indicators import IndicatorEngine
+from ma_engine import compact_order
+
+# 收益分布输出的分位数
+PERCENTILES = (5, 25, 50, 75, 95)
+
+def ma_diff_history(close, long_periods, short_period=5):
+    """一次算出每个交易日、每只股票的均线差异百分比
+
+    close为 行=交易日（升序）、列=股票 的前复权收盘价，停牌日为NaN。某天某只股票的值与当天收盘后
+    运行扫描得到的diff_percent一致：停牌日按列压缩掉，长短期均线取最近的有效交易日。
+    所有周期共享同一份累计和，返回 {long_period: 与close同形状的数组}，停牌日和历史不足的位置为NaN。
+    """
+    close = np.asarray(close, dtype=float)
+    engine = IndicatorEngine(close)
+    order = compact_order(close)
+    short_ma = engine.get(f'sma_{short_period}')
+
+    history = {}
+    for long_period in long_periods:
+        long_mean = engine.get(f'sma_{long_period}')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff_percent = (short_ma - long_mean) / long_mean * 100
+
+        # 从压缩后的顺序放回原来的交易日，压缩到前面的停牌日位置本来就是NaN
+        values = np.empty(close.shape)
+        np.put_along_axis(values, order, diff_percent, axis=0)
+        history[long_period] = values
+    return history
+
+def forward_returns(close, horizon):
+    """以信号当天收盘价买入、持有horizon个交易日后按收盘价卖出的收益率（%）
+
+    到期日停牌时按持有期内最后一个收盘价计算，只向前填充horizon-1天，不会用到买入前的旧价格；
+    持有期内一直停牌（没有可卖出的价格）、信号当天停牌或之后不足horizon个交易日的位置为NaN。
+    """
+    close = np.asarray(close, dtype=float)
+    filled = pd.DataFrame(close).ffill(limit=horizon - 1).to_numpy() if horizon > 1 else close
+
+    returns = np.full(close.shape, np.nan)
+    if horizon < len(close):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns[:-horizon] = (filled[horizon:] / close[:-horizon] - 1) * 100
+    return returns
+
+def summarize(returns):
+    """一组收益率（%）的样本数、均值、胜率和分位数"""
+    summary = {'signals': len(returns)}
+    if len(returns) == 0:
+        return {**summary, 'mean_return': np.nan, 'hit_rate': np.nan, 'std': np.nan,
+                **{f'p{q}': np.nan for q in PERCENTILES}}
+
+    return {
+        **summary,
+        'mean_return': returns.mean(),
+        'hit_rate': (returns > 0).mean() * 100,
+        'std': returns.std(),
+        **dict(zip((f'p{q}' for q in PERCENTILES), np.percentile(returns, PERCENTILES)))
+    }
+
+def backtest(close, long_periods, diff_thresholds, horizons, short_period=5):
+    """回测均线差异信号：差异百分比高于阈值（above）或低于负阈值（below）的股票在之后horizon个交易日的表现
+
+    close为 行=交易日、列=股票 的前复权收盘价面板（DataFrame或二维数组），所有交易日和股票一次向量化计算，
+    不调用任何接口。每个 长期周期 × 阈值 × 方向 × 持有期 输出一行：信号数、出现信号的交易日数、
+    收益率均值、胜率（收益为正的比例，%）、标准差和分位数，以及同期全部股票的平均收益和胜率作为基准，
+    excess_return为信号平均收益减去基准平均收益。相邻交易日的持有期相互重叠，样本并不独立。
+    """
+    close = np.asarray(close, dtype=float)
+    long_periods = sorted(set(long_periods))
+    history = ma_diff_history(close, long_periods, short_period)
+
+    rows = []
+    for horizon in sorted(set(horizons)):
+        returns = forward_returns(close, horizon)
+        has_return = ~np.isnan(returns)
+
+        for long_period in long_periods:
+            diff_percent = history[long_period]
+            valid = has_return & ~np.isnan(diff_percent)
+
+            # 基准只需要均值和胜率，不必取出全部样本求分位数
+            n_valid = np.count_nonzero(valid)
+            baseline_return = np.where(valid, returns, 0).sum() / n_valid if n_valid else np.nan
+            baseline_hit_rate = np.count_nonzero(valid & (returns > 0)) / n_valid * 100 if n_valid else np.nan
+
+            for side, sign in (('above', 1), ('below', -1)):
+                # 先按最小阈值取出候选 (交易日, 股票)，更高的阈值只在候选中继续筛选
+                with np.errstate(invalid='ignore'):
+                    side_day, side_stock = np.nonzero(valid & (sign * diff_percent > min(diff_thresholds)))
+                side_diff = sign * diff_percent[side_day, side_stock]
+                side_returns = returns[side_day, side_stock]
+
+                for diff_threshold in diff_thresholds:
+                    selected = side_diff > diff_threshold
+                    summary = summarize(side_returns[selected])
+                    rows.append({
+                        'long_period': long_period,
+                        'diff_threshold': diff_threshold,
+                        'side': side,
+                        'horizon': horizon,
+                        'signal_days': np.count_nonzero(np.bincount(side_day[selected], minlength=len(close))),
+                        **summary,
+                        'baseline_return': baseline_return,
+                        'baseline_hit_rate': baseline_hit_rate,
+                        'excess_return': summary['mean_return'] - baseline_return
+                    })
+
+    columns = ['long_period', 'diff_threshold', 'side', 'horizon']
+    return pd.DataFrame(rows).sort_values(columns, kind='stable').reset_index(drop=True)
+
+def load_store_panel(start_date=None, end_date=None, root=DATA_STORE_DIR):
+    """从本地行情存储读取前复权收盘价面板（行=交易日、列=股票），不调用接口"""
+    return OHLCStore(root).get_panel('close', start_date, end_date)
+
+def main():
+    parser = argparse.ArgumentParser(description='均线差异信号历史回测（使用本地行情存储，不调用接口）')
+    parser.add_argument('--start', help='起始交易日（YYYYMMDD），默认为存储中的第一天')
+    parser.add_argument('--end', help='结束交易日（YYYYMMDD），默认为存储中的最后一天')
+    parser.add_argument('--periods', default='10,20,30,60', help='长期均值周期，逗号分隔')
+    parser.add_argument('--thresholds', default='3,5,10', help='差异阈值（%%），逗号分隔')
+    parser.add_argument('--horizons', default='1,5,10,20', help='持有交易日数，逗号分隔')
+    parser.add_argument('--store-dir', default=DATA_STORE_DIR, help='本地行情存储目录')
+    parser.add_argument('--output', help='把结果保存为CSV文件')
+    args = parser.parse_args()
+
+    close = load_store_panel(args.start, args.end, args.store_dir)
+    if close.empty:
+        print(f"本地存储 {args.store_dir} 中没有行情数据，请先运行应用同步行情")
+        return
+
+    start = time.perf_counter()
+    df = backtest(close, [int(v) for v in args.periods.split(',')], [float(v) for v in args.thresholds.split(',')],
+                  [int(v) for v in args.horizons.split(',')])
+    elapsed = time.perf_counter() - start
+
+    print(f"回测 {close.index[0]:%Y%m%d}-{close.index[-1]:%Y%m%d}：{close.shape[0]} 个交易日 × "
+          f"{close.shape[1]} 只股票，耗时 {elapsed:.2f} 秒")
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(df.round(3).to_string(index=False))
+
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f"结果已保存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+"""
+性能基准测试 - 使用合成行情数据离线运行，不需要tushare token和网络
+
+用法: python benchmark.py [--stocks 5000] [--days 30] [--long-period 20] [--only ma_engine]
+                         [--latency 0.005] [--rate-limit 500] [--output result.json] [--compare base.json]
+
+--output 把结果保存为JSON，--compare 与之前保存的结果对比，便于发现不同提交之间的性能回退。
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from async_fetcher import AsyncStockDataFetcher
+from backtest import backtest, ma_diff_history
+from compact import CompactBars, CompactPanel, TickerTable, pack_results
+from config import CHART_DAYS, FETCH_WORKERS
+from fake_tushare import AsyncFakeProApi, FakeProApi, generate_market
+from fetch_pool import FetchPool, TokenBucket
+from ma_engine import compute_ma_diff
+from parallel_scan import parallel_ma_diff, shutdown_executor
+from snapshot import save_snapshot
+from stock_analyzer import StockAnalyzer
+from stock_data import StockDataFetcher, prepare_daily
+
+def make_close_panel(n_stocks, n_days, seed=0):
+    """生成 行=交易日、列=股票 的收盘价面板，停牌日为NaN"""
+    market = generate_market(n_stocks=n_stocks, n_days=n_days, seed=seed)
+    return market['daily'].pivot(index='trade_date', columns='ts_code', values='close').sort_index()
+
+def measure(func, items, warmup=True):
+    """对每个item调用一次func，统计吞吐、p50/p99延迟，并单独再跑一次测量峰值内存
+
+    峰值内存用tracemalloc在计时之外单独测量，避免跟踪开销影响耗时。
+    """
+    items = list(items)
+    if warmup and items:
+        func(items[0])
+
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(items[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'calls': len(items),
+        'throughput': len(items) / elapsed if elapsed else float('inf'),
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'peak_memory_mb': peak / 1024 / 1024
+    }
+
+def print_measurements(title, measurements):
+    """以表格形式打印measure的结果"""
+    print(title)
+    print(f"  {'次数':>6}{'吞吐(次/秒)':>12}{'p50(ms)':>10}{'p99(ms)':>10}{'峰值内存(MB)':>12}  操作")
+    for name, m in measurements.items():
+        print(f"  {m['calls']:>8}{m['throughput']:>16.1f}{m['p50_ms']:>10.2f}{m['p99_ms']:>10.2f}"
+              f"{m['peak_memory_mb']:>18.2f}  {name}")
+
+def make_fetcher(market, latency=0.0, rate_limit=None):
+    """基于合成行情创建获取器；设置rate_limit时离线替身按该频率拒绝超限调用，令牌桶也按该频率限流"""
+    limiter = TokenBucket(rate_per_minute=rate_limit or 10 ** 9)
+    api = FakeProApi(market, latency=latency, rate_limit=rate_limit)
+    return StockDataFetcher(pro=api, store=False, pool=FetchPool(limiter=limiter))
+
+def best_of(func, repeat=3):
+    """多次运行取最短耗时，返回 (耗时秒数, 最后一次的结果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def loop_ma_diff(close, long_period):
+    """逐只股票计算均线差异，与StockAnalyzer.calculate_ma_diff的计算过程一致"""
+    days_needed = long_period + 10
+    results = []
+
+    for ts_code in close.columns:
+        df = pd.DataFrame({'close': close[ts_code].dropna()}).tail(days_needed)
+        df['ma5'] = df['close'].rolling(window=5).mean()
+
+        if df.empty or len(df) < long_period:
+            continue
+
+        recent_data = df.tail(long_period)
+        long_mean = recent_data['close'].mean()
+        latest_ma5 = recent_data['ma5'].iloc[-1]
+
+        results.append({
+            'ts_code': ts_code,
+            'long_mean': long_mean,
+            'latest_ma5': latest_ma5,
+            'diff_percent': ((latest_ma5 - long_mean) / long_mean) * 100,
+            'latest_close': recent_data['close'].iloc[-1]
+        })
+
+    return pd.DataFrame(results)
+
+def bench_ma_engine(n_stocks, n_days, long_period, seed=0):
+    """对比逐只计算与向量化引擎的耗时，并校验两者结果一致"""
+    close = make_close_panel(n_stocks, n_days, seed)
+
+    loop_time, expected = best_of(lambda: loop_ma_diff(close, long_period), repeat=1)
+    vector_time, metrics = best_of(lambda: compute_ma_diff(close.to_numpy(), long_period))
+
+    actual = pd.DataFrame({'ts_code': close.columns, **metrics}).dropna(subset=['diff_percent'])
+    merged = expected.merge(actual, on='ts_code', suffixes=('', '_vec'))
+    consistent = len(merged) == len(expected) == len(actual) and all(
+        np.allclose(merged[col], merged[f"{col}_vec"])
+        for col in ['long_mean', 'latest_ma5', 'diff_percent', 'latest_close']
+    )
+
+    print(f"均线差异计算（{n_stocks} 只股票 × {n_days} 个交易日，长期周期 {long_period} 天）")
+    print(f"  逐只计算:   {loop_time * 1000:10.2f} ms")
+    print(f"  向量化引擎: {vector_time * 1000:10.2f} ms")
+    print(f"  加速比:     {loop_time / vector_time:10.1f} x")
+    print(f"  结果一致:   {'是' if consistent else '否'}")
+
+    return {
+        'loop_seconds': loop_time,
+        'vectorized_seconds': vector_time,
+        'speedup': loop_time / vector_time,
+        'consistent': consistent
+    }
+
+def bench_async_scan(n_stocks, n_days, long_period, latency=0.02, seed=0):
+    """对比逐只串行获取与异步流水线的扫描吞吐（模拟每次调用latency秒的网络延迟，不限流）"""
+    n_stocks = min(n_stocks, 300)  # 串行扫描较慢，限制股票数量
+    market = generate_market(n_stocks=n_stocks, n_days=max(n_days, long_period + 10), seed=seed)
+    stock_list = market['stock_basic']
+    unlimited = TokenBucket(rate_per_minute=10 ** 9)
+
+    fetcher = StockDataFetcher(pro=FakeProApi(market, latency=latency), store=False,
+                               pool=FetchPool(limiter=unlimited))
+    analyzer = StockAnalyzer(fetcher)
+
+    def serial_scan():
+        return [analyzer.calculate_ma_diff(ts_code, long_period) for ts_code in stock_list['ts_code']]
+
+    async_fetcher = AsyncStockDataFetcher(AsyncFakeProApi(market, latency=latency), limiter=unlimited,
+                                          concurrency=FETCH_WORKERS)
+
+    serial_time, _ = best_of(serial_scan, repeat=1)
+    async_time, _ = best_of(lambda: asyncio.run(async_fetcher.analyze_stocks(stock_list, long_period)), repeat=1)
+
+    print(f"逐只扫描（{n_stocks} 只股票，每次调用延迟 {latency * 1000:.0f} ms，并发 {FETCH_WORKERS}）")
+    print(f"  串行获取:   {n_stocks / serial_time:10.1f} 只/秒")
+    print(f"  异步流水线: {n_stocks / async_time:10.1f} 只/秒")
+    print(f"  加速比:     {serial_time / async_time:10.1f} x")
+
+    return {
+        'serial_stocks_per_second': n_stocks / serial_time,
+        'async_stocks_per_second': n_stocks / async_time,
+        'speedup': serial_time / async_time
+    }
+
+def bench_parallel_scan(n_stocks, n_days, long_period, seed=0):
+    """多进程分片计算从1个进程扩展到全部CPU核的耗时，并校验与单进程结果一致"""
+    close = make_close_panel(n_stocks, n_days, seed).to_numpy()
+    serial_time, expected = best_of(lambda: compute_ma_diff(close, long_period))
+
+    cpu_count = os.cpu_count() or 1
+    worker_counts = sorted({1, cpu_count} | {2 ** i for i in range(1, cpu_count.bit_length()) if 2 ** i < cpu_count})
+
+    print(f"多进程分片计算（{n_stocks} 只股票 × {n_days} 个交易日，{cpu_count} 个CPU核）")
+    print(f"  单进程（无进程池）: {serial_time * 1000:10.2f} ms")
+
+    results = {'serial_seconds': serial_time, 'workers': {}}
+    for workers in worker_counts:
+        parallel_ma_diff(close, long_period, workers)  # 预热：启动进程池
+        elapsed, (metrics, _) = best_of(lambda: parallel_ma_diff(close, long_period, workers))
+        consistent = all(np.allclose(metrics[name], expected[name], equal_nan=True) for name in expected)
+
+        print(f"  {workers:2d} 个进程:          {elapsed * 1000:10.2f} ms  "
+              f"加速比 {serial_time / elapsed:5.2f} x  结果一致: {'是' if consistent else '否'}")
+        results['workers'][workers] = {'seconds': elapsed, 'speedup': serial_time / elapsed, 'consistent': consistent}
+
+    shutdown_executor()
+    return results
+
+def bench_fetcher(n_stocks, n_days, long_period, latency=0.005, rate_limit=None, seed=0):
+    """单个请求的延迟：获取股票列表、日线数据、均线差异和图表数据（首次获取，不命中缓存）"""
+    market = generate_market(n_stocks=min(n_stocks, 500), n_days=max(n_days, 60), seed=seed)
+    fetcher = make_fetcher(market, latency, rate_limit)
+    analyzer = StockAnalyzer(fetcher)
+    ts_codes = market['stock_basic']['ts_code'].tolist()
+
+    def cold(func):
+        def run(ts_code):
+            fetcher.clear_cache()
+            analyzer.chart_cache.clear()
+            return func(ts_code)
+        return run
+
+    measurements = {
+        'get_stock_list': measure(cold(lambda _: fetcher.get_stock_list()), range(20)),
+        'get_recent_data': measure(cold(lambda ts_code: fetcher.get_recent_data(ts_code, long_period + 10)), ts_codes),
+        'calculate_ma_diff': measure(cold(lambda ts_code: analyzer.calculate_ma_diff(ts_code, long_period)), ts_codes),
+        'get_stock_details': measure(cold(lambda ts_code: analyzer.get_stock_details(ts_code, CHART_DAYS)), ts_codes)
+    }
+
+    # 先预计算所有股票的图表数据，再测量缓存命中时的延迟
+    analyzer.warm_charts(ts_codes)
+    measurements['get_stock_details（缓存命中）'] = measure(
+        lambda ts_code: analyzer.get_stock_details(ts_code, CHART_DAYS), ts_codes)
+
+    print_measurements(f"数据获取（每次调用延迟 {latency * 1000:.0f} ms）", measurements)
+    return measurements
+
+def bench_analyze_stocks(n_stocks, n_days, long_period, latency=0.005, rate_limit=None, seed=0):
+    """全市场扫描的吞吐：逐只获取与按交易日批量获取两种模式，每次都从空缓存和空均线状态开始"""
+    market = generate_market(n_stocks=n_stocks, n_days=max(n_days, long_period + 11), seed=seed)
+    stock_list = market['stock_basic']
+    measurements = {}
+
+    for mode, use_panel in [('逐只获取', False), ('按交易日批量获取', True)]:
+        def scan(_):
+            analyzer = StockAnalyzer(make_fetcher(market, latency, rate_limit), state_dir=tempfile.mkdtemp())
+            return analyzer.analyze_stocks(stock_list, long_period, use_panel=use_panel)
+
+        m = measure(scan, range(3), warmup=False)
+        m['stocks_per_second'] = m['throughput'] * n_stocks
+        measurements[f"analyze_stocks（{mode}）"] = m
+
+    print_measurements(f"全市场扫描（{n_stocks} 只股票，每次调用延迟 {latency * 1000:.0f} ms）", measurements)
+    for name, m in measurements.items():
+        print(f"  {name}: {m['stocks_per_second']:.1f} 只/秒")
+    return measurements
+
+def bench_flask(n_stocks, n_days, long_period, latency=0.005, rate_limit=None, seed=0):
+    """Flask接口的延迟：提交扫描并等待完成、命中结果缓存的重复提交、结果分页和股票详情"""
+    import app
+    from job_manager import JobManager
+
+    market = generate_market(n_stocks=n_stocks, n_days=max(n_days, long_period + 11), seed=seed)
+    ts_codes = market['stock_basic']['ts_code'].tolist()[:200]
+    client = app.app.test_client()
+
+    def setup():
+        app.analyzer = StockAnalyzer(make_fetcher(market, latency, rate_limit), state_dir=tempfile.mkdtemp())
+        app.job_manager = JobManager(app.analyzer)
+
+    def submit(diff_threshold):
+        data = client.post('/api/configure', data={'long_period': long_period,
+                                                   'diff_threshold': diff_threshold}).get_json()
+        return data['job_id']
+
+    def scan(_):
+        setup()
+        job_id = submit(5)
+        client.get(f"/api/stream/{job_id}?format=ndjson").get_data()  # 读到done事件为止
+        return job_id
+
+    measurements = {'POST /api/configure + stream（冷启动）': measure(scan, range(3), warmup=False)}
+    job_id = scan(None)
+
+    measurements.update({
+        'POST /api/configure（缓存命中）': measure(lambda t: submit(t), np.linspace(0, 10, 50)),
+        'GET /api/status/<id>': measure(lambda _: client.get(f"/api/status/{job_id}"), range(200)),
+        'GET /api/results/<id>?limit=100': measure(
+            lambda _: client.get(f"/api/results/{job_id}?limit=100"), range(100)),
+        'GET /api/results/<id>（全部）': measure(lambda _: client.get(f"/api/results/{job_id}"), range(20)),
+        'GET /api/stock_details/<code>': measure(lambda code: client.get(f"/api/stock_details/{code}"), ts_codes)
+    })
+
+    app.job_manager.shutdown()
+    print_measurements(f"Flask接口（{n_stocks} 只股票）", measurements)
+    return measurements
+
+def retained_memory(build):
+    """build()返回的对象保持存活时占用的内存（字节），用tracemalloc统计"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del value
+    return retained
+
+def bench_memory(n_stocks, n_days, long_period, seed=0):
+    """对比原有布局（完整的float64 DataFrame、逐只的字典）与紧凑布局（int32交易日、PRICE_DTYPE收盘价、结构化数组）的内存占用"""
+    market = generate_market(n_stocks=n_stocks, n_days=n_days, seed=seed)
+    api = FakeProApi(market)
+    ts_codes = market['stock_basic']['ts_code'].tolist()
+    names = market['stock_basic']['name'].tolist()
+    daily = {ts_code: api.daily(ts_code=ts_code) for ts_code in ts_codes}
+    close = market['daily'].pivot(index='trade_date', columns='ts_code', values='close').sort_index()
+    close.index = pd.to_datetime(close.index, format='%Y%m%d')
+
+    metrics = compute_ma_diff(close.to_numpy(), long_period)
+    results = pd.DataFrame({'ts_code': close.columns, 'name': names, **metrics}).dropna(subset=['diff_percent'])
+    records = results.to_dict('records')
+
+    layouts = {
+        '逐只日线缓存': (
+            lambda: [prepare_daily(daily[ts_code].copy()) for ts_code in ts_codes],
+            lambda: [CompactBars.from_daily(prepare_daily(daily[ts_code].copy())) for ts_code in ts_codes]
+        ),
+        '全市场面板缓存': (
+            lambda: {'close': close.copy(), 'ma5': close.rolling(window=5).mean()},
+            lambda: CompactPanel.from_frame(close)
+        ),
+        '扫描结果': (
+            lambda: ([dict(record) for record in records], results.copy()),
+            lambda: pack_results(results, TickerTable())
+        )
+    }
+
+    print(f"内存占用（{n_stocks} 只股票 × {n_days} 个交易日）")
+    print(f"  {'原有布局(MB)':>14}{'紧凑布局(MB)':>14}{'压缩比':>10}  数据")
+
+    measurements = {}
+    for name, (original, compact) in layouts.items():
+        original_bytes = retained_memory(original)
+        compact_bytes = retained_memory(compact)
+        measurements[name] = {
+            'original_mb': original_bytes / 1024 / 1024,
+            'compact_mb': compact_bytes / 1024 / 1024,
+            'ratio': original_bytes / compact_bytes
+        }
+        m = measurements[name]
+        print(f"  {m['original_mb']:>16.2f}{m['compact_mb']:>16.2f}{m['ratio']:>12.1f}x  {name}")
+
+    return measurements
+
+# 快速启动：导入app、读取快照、用快照响应第一次/api/stock_list
+FAST_STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.snapshot = app.load_snapshot(sys.argv[1])
+loaded = time.perf_counter()
+response = app.app.test_client().get('/api/stock_list')
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'snapshot_ms': (loaded - imported) * 1000,
+                  'first_response_ms': (served - start) * 1000, 'stocks': len(response.get_json()['data']),
+                  'heavy_modules': [name for name in ('pandas', 'numpy', 'tushare') if name in sys.modules]}))
+'''
+
+# 原有启动方式：导入全部依赖后创建分析器，第一次请求时调用stock_basic获取股票列表
+EAGER_STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app, pandas, stock_analyzer, job_manager
+try:
+    import tushare
+except ImportError:
+    pass
+imported = time.perf_counter()
+from fake_tushare import FakeProApi, generate_market
+api = FakeProApi(generate_market(n_stocks=int(sys.argv[1]), n_days=5), latency=float(sys.argv[2]))
+ready = time.perf_counter()
+analyzer = stock_analyzer.StockAnalyzer(stock_analyzer.StockDataFetcher(pro=api, store=False))
+stocks = len(analyzer.fetcher.get_stock_list())
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'snapshot_ms': 0.0,
+                  'first_response_ms': (imported - start + served - ready) * 1000, 'stocks': stocks,
+                  'heavy_modules': [name for name in ('pandas', 'numpy', 'tushare') if name in sys.modules]}))
+'''
+
+def bench_startup(n_stocks, n_days, long_period, latency=0.2, seed=0, repeat=5):
+    """冷启动耗时：每次在新进程中启动，对比快速启动（延迟导入+磁盘快照）和原有的立即加载方式
+
+    原有方式的第一次请求包含一次stock_basic调用（latency模拟接口延迟），不计生成合成行情的时间。
+    """
+    market = generate_market(n_stocks=n_stocks, n_days=max(n_days, long_period + 11), seed=seed)
+    stock_list = market['stock_basic']
+    close = market['daily'].pivot(index='trade_date', columns='ts_code', values='close').sort_index()
+    metrics = compute_ma_diff(close[stock_list['ts_code']].to_numpy(), long_period)
+
+    root = tempfile.mkdtemp()
+    save_snapshot({column: stock_list[column].tolist() for column in stock_list.columns}, close.index[-1],
+                  {long_period: {'ts_code': stock_list['ts_code'].tolist(), 'name': stock_list['name'].tolist(),
+                                 **{name: values.tolist() for name, values in metrics.items()}}},
+                  root=root)
+    snapshot_kb = os.path.getsize(os.path.join(root, 'snapshot.json')) / 1024
+
+    def run(script, *args):
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', script, *map(str, args)], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        # 各项取中位数
+        summary = {key: float(np.median([r[key] for r in runs])) for key in ('import_ms', 'snapshot_ms', 'first_response_ms')}
+        summary['heavy_modules'] = runs[-1]['heavy_modules']
+        summary['stocks'] = runs[-1]['stocks']
+        return summary
+
+    results = {
+        'fast': run(FAST_STARTUP_SCRIPT, root),
+        'eager': run(EAGER_STARTUP_SCRIPT, n_stocks, latency)
+    }
+    results['snapshot_kb'] = snapshot_kb
+
+    print(f"冷启动耗时（{n_stocks} 只股票，快照 {snapshot_kb:.0f} KB，{repeat} 次取中位数）")
+    print(f"  {'导入(ms)':>10}{'读取快照(ms)':>14}{'首次响应(ms)':>14}  启动方式（已加载的重量级模块）")
+    for name, label in [('fast', '快速启动'), ('eager', f'立即加载，stock_basic延迟 {latency * 1000:.0f} ms')]:
+        r = results[name]
+        print(f"  {r['import_ms']:>12.1f}{r['snapshot_ms']:>16.1f}{r['first_response_ms']:>16.1f}  "
+              f"{label}（{', '.join(r['heavy_modules']) or '无'}）")
+
+    return results
+
+def bench_backtest(n_stocks, n_days, long_period, seed=0, years=3):
+    """全市场历史回测耗时：交易日数取n_days和years年（每年250个交易日）中较多的一个
+
+    同时校验最后一个交易日的信号与扫描器（compute_ma_diff）的结果一致。
+    """
+    n_days = max(n_days, 250 * years)
+    close = make_close_panel(n_stocks, n_days, seed)
+    long_periods, diff_thresholds, horizons = [10, 20, 30, 60], [3, 5, 10], [1, 5, 10, 20]
+
+    seconds, df = best_of(lambda: backtest(close, long_periods, diff_thresholds, horizons), repeat=1)
+
+    history = ma_diff_history(close.to_numpy(), [long_period])[long_period][-1]
+    expected = compute_ma_diff(close.to_numpy()[-(long_period + 10):], long_period)['diff_percent']
+    # 最后一天停牌的股票扫描器仍有结果，回测中为NaN
+    checked = ~np.isnan(expected) & ~np.isnan(close.to_numpy()[-1])
+    consistent = bool(np.allclose(history[checked], expected[checked]))
+
+    print(f"历史回测（{n_stocks} 只股票 × {n_days} 个交易日，{len(df)} 组 周期×阈值×方向×持有期）")
+    print(f"  耗时:       {seconds:10.2f} s")
+    print(f"  吞吐:       {close.size / seconds / 1e6:10.2f} 百万（交易日×股票）/秒")
+    print(f"  与扫描一致: {'是' if consistent else '否'}")
+
+    return {'seconds': seconds, 'combinations': len(df), 'consistent': consistent}
+
+BENCHMARKS = {
+    'ma_engine': bench_ma_engine,
+    'async_scan': bench_async_scan,
+    'parallel_scan': bench_parallel_scan,
+    'fetcher': bench_fetcher,
+    'analyze_stocks': bench_analyze_stocks,
+    'flask': bench_flask,
+    'memory': bench_memory,
+    'startup': bench_startup,
+    'backtest': bench_backtest
+}
+
+def git_commit():
+    """当前代码的git提交号，不在git仓库中时返回None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare_results(base, current):
+    """对比两次运行中相同指标的变化，吞吐下降或延迟上升超过10%时标记为回退"""
+    print(f"与基准结果对比（基准提交 {base['meta'].get('commit')}）")
+
+    def walk(old, new, path):
+        for key, value in new.items():
+            if key not in old:
+                continue
+            if isinstance(value, dict):
+                walk(old[key], value, path + [str(key)])
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and old[key]:
+                change = (value - old[key]) / abs(old[key]) * 100
+                higher_is_better = 'throughput' in key or 'per_second' in key or key == 'speedup'
+                lower_is_better = key.endswith('_ms') or key.endswith('_mb') or key.endswith('seconds')
+                regressed = (higher_is_better and change < -10) or (lower_is_better and change > 10)
+                if higher_is_better or lower_is_better:
+                    flag = '  <- 回退' if regressed else ''
+                    print(f"  {'/'.join(path + [key]):<70}{old[key]:>12.2f} -> {value:>12.2f} ({change:+.1f}%){flag}")
+
+    walk(base['benchmarks'], current['benchmarks'], [])
+
+def main():
+    parser = argparse.ArgumentParser(description='股票均线差异筛选工具性能基准测试')
+    parser.add_argument('--stocks', type=int, default=5000, help='股票数量')
+    parser.add_argument('--days', type=int, default=30, help='交易日数量')
+    parser.add_argument('--long-period', type=int, default=20, help='长期均值周期')
+    parser.add_argument('--only', choices=sorted(BENCHMARKS), action='append', help='只运行指定的基准测试')
+    parser.add_argument('--latency', type=float, help='模拟的每次API调用延迟（秒）')
+    parser.add_argument('--rate-limit', type=int, help='模拟的每个接口每分钟调用次数上限')
+    parser.add_argument('--seed', type=int, default=0, help='合成行情的随机种子')
+    parser.add_argument('--output', help='把结果保存为JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果对比')
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args)
+        },
+        'benchmarks': {}
+    }
+
+    for name in args.only or BENCHMARKS:
+        func = BENCHMARKS[name]
+        params = inspect.signature(func).parameters
+        options = {option: getattr(args, option) for option in ('latency', 'rate_limit')
+                   if option in params and getattr(args, option) is not None}
+        if 'seed' in params:
+            options['seed'] = args.seed
+
+        results['benchmarks'][name] = func(args.stocks, args.days, args.long_period, **options)
+        print()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=float)
+        print(f"结果已保存到 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare_results(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
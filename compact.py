@@ -0,0 +1,144 @@
+import threading
+import numpy as np
+import pandas as pd
+from config import PRICE_DTYPE
+from indicators import series_indicators
+
+# 全市场扫描结果的结构化数组格式：股票用整数编号，价格用PRICE_DTYPE，排序用的差异百分比保留float64
+RESULT_DTYPE = np.dtype([('ticker', np.int32), ('diff_percent', np.float64), ('latest_close', PRICE_DTYPE),
+                         ('long_mean', PRICE_DTYPE), ('latest_ma5', PRICE_DTYPE)])
+
+def dates_to_int(dates):
+    """交易日（YYYYMMDD字符串或datetime）转换为int32数组，如20240105"""
+    dates = pd.Series(dates)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).to_numpy(dtype=np.int32)
+    return dates.astype(str).astype(np.int32).to_numpy()
+
+def int_to_dates(dates):
+    """int32交易日转换为DatetimeIndex"""
+    return pd.to_datetime(np.asarray(dates).astype(str), format='%Y%m%d')
+
+def display_prices(values):
+    """价格转换为float64用于展示：按float32保存时转换会带出 22.670000076293945 这样的尾数，保留4位小数"""
+    values = np.asarray(values)
+    if values.dtype.itemsize < 8:
+        return values.astype(np.float64).round(4)
+    return values.astype(np.float64)
+
+class CompactBars:
+    """单只股票的紧凑日线：int32交易日 + PRICE_DTYPE的前复权收盘价
+
+    只保留扫描和图表用到的收盘价，缓存中每个交易日只占8个字节；
+    需要DataFrame时用to_frame()临时生成，列格式与prepare_daily一致。
+    """
+
+    __slots__ = ('dates', 'close')
+
+    def __init__(self, dates, close):
+        self.dates = np.asarray(dates, dtype=np.int32)
+        self.close = np.asarray(close, dtype=PRICE_DTYPE)
+
+    @classmethod
+    def from_daily(cls, df):
+        """由prepare_daily整理后的日线创建"""
+        return cls(dates_to_int(df['trade_date']), df['close'].to_numpy())
+
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + self.close.nbytes
+
+    @property
+    def empty(self):
+        return len(self.close) == 0
+
+    def __len__(self):
+        return len(self.close)
+
+    def closes(self):
+        """收盘价，转换为float64供计算使用"""
+        return self.close.astype(np.float64)
+
+    def to_frame(self):
+        """转换为包含trade_date、close、ma5的DataFrame"""
+        df = pd.DataFrame({'trade_date': int_to_dates(self.dates), 'close': display_prices(self.close)})
+        df['ma5'] = series_indicators(df['close'], ['sma_5'])['sma_5']
+        return df
+
+class CompactPanel:
+    """紧凑的全市场面板（前复权收盘价或成交量）：int32交易日、股票代码到列号的索引，以及 行=交易日、列=股票 的PRICE_DTYPE数组"""
+
+    __slots__ = ('dates', 'tickers', 'index', 'values')
+
+    def __init__(self, dates, tickers, values):
+        self.dates = np.asarray(dates, dtype=np.int32)
+        self.tickers = list(tickers)
+        self.index = {ts_code: i for i, ts_code in enumerate(self.tickers)}
+        self.values = np.asarray(values, dtype=PRICE_DTYPE)
+
+    @classmethod
+    def from_frame(cls, df):
+        """由行=交易日（DatetimeIndex）、列=股票代码的DataFrame创建"""
+        return cls(dates_to_int(df.index), df.columns, df.to_numpy())
+
+    @property
+    def nbytes(self):
+        # 索引字典按每只股票约100字节估算
+        return self.dates.nbytes + self.values.nbytes + 100 * len(self.tickers)
+
+    def select(self, ts_codes):
+        """按ts_codes的顺序取出float64数组，面板中没有的股票整列为NaN"""
+        columns = np.array([self.index.get(ts_code, -1) for ts_code in ts_codes], dtype=np.int64)
+        values = np.full((len(self.dates), len(columns)), np.nan)
+        found = columns >= 0
+        values[:, found] = self.values[:, columns[found]]
+        return values
+
+class TickerTable:
+    """股票代码和名称到整数编号的映射，多份扫描结果共享同一张表"""
+
+    def __init__(self):
+        self.codes = []
+        self.names = []
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def encode(self, codes, names):
+        """返回股票的整数编号数组，新出现的股票追加到表中，已有股票改名（如戴帽ST）时更新为新名称"""
+        with self.lock:
+            ids = np.empty(len(codes), dtype=np.int32)
+            for i, (ts_code, name) in enumerate(zip(codes, names)):
+                ticker = self.index.get(ts_code)
+                if ticker is None:
+                    ticker = self.index[ts_code] = len(self.codes)
+                    self.codes.append(ts_code)
+                    self.names.append(name)
+                elif self.names[ticker] != name:
+                    self.names[ticker] = name
+                ids[i] = ticker
+            return ids
+
+    def decode(self, ids):
+        """返回 (股票代码数组, 名称数组)"""
+        with self.lock:
+            codes = np.array(self.codes, dtype=object)
+            names = np.array(self.names, dtype=object)
+        return codes[ids], names[ids]
+
+def pack_results(df, tickers):
+    """把未筛选的扫描结果DataFrame压缩为RESULT_DTYPE结构化数组"""
+    packed = np.empty(len(df), dtype=RESULT_DTYPE)
+    packed['ticker'] = tickers.encode(df['ts_code'], df['name'])
+    for field in RESULT_DTYPE.names[1:]:
+        packed[field] = df[field].to_numpy()
+    return packed
+
+def unpack_results(packed, tickers):
+    """由结构化数组还原扫描结果DataFrame，价格列转换回float64，与任务结果中的数值一致"""
+    codes, names = tickers.decode(packed['ticker'])
+    return pd.DataFrame({
+        'ts_code': codes,
+        'name': names,
+        'diff_percent': packed['diff_percent'],
+        **{field: display_prices(packed[field]) for field in RESULT_DTYPE.names[2:]}
+    })
@@ -2,10 +2,69 @@
 # 请在此处配置您的tushare API token
 # 您可以在https://tushare.pro/register免费注册获取
 
+import os
+
 # 默认配置
 DEFAULT_LONG_PERIOD = 20  # 默认长期均值周期（天）
 DEFAULT_DIFF_THRESHOLD = 5  # 默认差异百分比阈值（%）
-API_CALL_DELAY = 0.1  # API调用延迟（秒），避免超过tushare免费版限制
+MAX_SWEEP_COMBINATIONS = 50  # 参数扫描一次最多计算的 周期×阈值 组合数
+API_CALLS_PER_MINUTE = 500  # tushare账户每分钟允许的调用次数（按积分等级设置），所有请求共享
+FETCH_WORKERS = 8  # 并发获取数据的线程数
+FETCH_MAX_RETRIES = 3  # 频率超限或网络错误时的最大重试次数
+FETCH_RETRY_BACKOFF = 2  # 重试退避的基础等待时间（秒），每次重试翻倍
+USE_ASYNC_FETCH = True  # 逐只获取时使用asyncio流水线，数据一到就计算，网络等待与计算重叠
+USE_PANEL_FETCH = True  # 全市场扫描时按交易日批量获取数据（每天一次调用返回全部股票）
+SCAN_WORKERS = 1  # 均线计算使用的进程数，大于1时按股票分片到进程池并行计算（可设为CPU核数）
+PARALLEL_SCAN_MIN_STOCKS = 2000  # 股票数量达到此值才使用多进程计算，数量较少时进程间通信的开销大于收益
+
+# 本地行情存储
+USE_DATA_STORE = True  # 是否启用本地日线存储，重启后只需下载新增交易日
+DATA_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ohlc')  # 存储目录
+STORE_BOOTSTRAP_DAYS = 400  # 首次建库下载的交易日数量（需覆盖最大长期周期+10天）
+STORE_SYNC_INTERVAL = 600  # 检查新交易日的最小间隔（秒）
+STORE_SYNC_RETRY_INTERVAL = 60  # 同步失败后再次尝试的最小间隔（秒），期间读取直接使用存储中已有的数据
+USE_INCREMENTAL_SCAN = True  # 全市场扫描使用持久化的均线状态，每天只需处理新交易日的截面
+MA_STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ma_state')  # 均线状态目录
+FAST_STARTUP = True  # 启动时先用磁盘快照中的股票列表和扫描结果提供服务，分析器在后台初始化并刷新缓存
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshot')  # 启动快照目录
+SCAN_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'scan_checkpoint')  # 逐只扫描的断点目录
+SCAN_CHECKPOINT_BATCH = 200  # 逐只扫描每完成多少只股票写一次断点
+SCAN_RETRY_ROUNDS = 3  # 逐只扫描结束后重新获取失败股票的最多轮数
+SCAN_RETRY_BACKOFF = 5  # 重试轮之间的基础等待时间（秒），每轮翻倍
+
+# 内存缓存
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # 行情缓存的内存上限（字节），超出后淘汰最久未使用的数据
+CACHE_EXPIRE_TIME = '15:30'  # 缓存数据在每天收盘后的这个时间过期，之后重新获取当天行情
+RESULT_CACHE_SIZE = 16  # 最多缓存多少组（交易日, 长期周期）的全市场扫描结果
+# 缓存中价格和成交量的存储精度；float32占用减半，但实测面板、逐只和增量扫描的差异百分比相差约2e-6个百分点，
+# 成交量也会丢失精度，因此默认保留float64（详见README）
+PRICE_DTYPE = 'float64'
+
+# 股票详情图表
+CHART_DAYS = 60  # 图表显示的交易日数
+CHART_MA_PERIODS = (5, 20, 30)  # 图表中的均线周期，计算时多取（最大周期-1）天历史预热，第一天起就有完整均线
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 预计算图表数据的内存上限（字节）
+CHART_PREWARM_SIZE = 20  # 筛选完成后预先计算排名前N只股票的图表数据
+
+# 股票搜索
+SEARCH_LIMIT = 10  # 搜索默认返回的股票数量
+SEARCH_MAX_LIMIT = 50  # 搜索单次最多返回的股票数量
+
+# 分析任务
+JOB_WORKERS = 2  # 同时执行的筛选任务数，其余任务排队等待
+JOB_HISTORY_SIZE = 50  # 最多保留多少个已完成任务的结果
+JOB_RESULT_TTL = 3600  # 已完成任务结果的保留时间（秒）
+TOP_K_SIZE = 50  # 扫描过程中实时维护的差异最大股票排行数量
+STREAM_HEARTBEAT = 15  # 流式接口没有新结果时发送心跳的间隔（秒）
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 编码（和压缩）后的结果响应缓存的内存上限（字节）
+COMPRESS_MIN_BYTES = 1024  # 响应体达到此大小才按Accept-Encoding压缩
+
+# 收盘后定时预计算
+SCHEDULE_ENABLED = True  # 是否在应用进程中每天收盘后自动预计算全市场扫描结果
+SCHEDULE_TIME = '16:00'  # 每天开始预计算的时间，应晚于CACHE_EXPIRE_TIME
+SCHEDULE_LONG_PERIODS = (10, 20, 30, 60)  # 预计算的长期周期，按最长周期获取一次数据全部算出
+SCHEDULE_RETRY_INTERVAL = 600  # 预计算失败（如当天行情尚未发布）后的重试间隔（秒）
+SCHEDULE_MAX_RETRIES = 6  # 当天最多重试次数，仍失败则等到下一天
 
 # 用户需要配置的参数
 TUSHARE_TOKEN = ''  # 请在此处填入您的tushare API token
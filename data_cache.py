@@ -0,0 +1,206 @@
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import pandas as pd
+from config import CACHE_MAX_BYTES, CACHE_EXPIRE_TIME
+
+def estimate_size(value):
+    """估算缓存值占用的内存字节数，DataFrame按实际内存占用计算，字典和列表递归计入其中的元素"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        # sys.getsizeof只计算指针数组，图表数据等列表的元素（浮点数、字符串）要逐个计入
+        return sum(estimate_size(v) for v in value) + sys.getsizeof(value)
+    if hasattr(value, 'nbytes'):
+        # numpy数组和compact模块中的紧凑结构
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+def next_expire_time(now=None, expire_time=CACHE_EXPIRE_TIME):
+    """下一个收盘后的过期时间点：当天收盘前写入的数据在当天expire_time过期，之后写入的在次日过期"""
+    now = now or datetime.now()
+    hour, minute = map(int, expire_time.split(':'))
+    expires_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if now >= expires_at:
+        expires_at += timedelta(days=1)
+    return expires_at
+
+class _Call:
+    """SingleFlight中一次进行中的加载"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """合并对同一个键的并发加载
+
+    同一时间每个键只有一个调用真正执行func，其余调用等待它完成并共享同一个结果；
+    func抛出异常时，等待中的调用也收到同一个异常。
+    """
+
+    def __init__(self):
+        self.calls = {}  # key -> 进行中的_Call
+        self.coalesced = 0  # 等待其他调用结果而没有自己加载的次数
+        self.lock = threading.Lock()
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+class DataCache:
+    """按内存预算淘汰的LRU缓存
+
+    总占用超过max_bytes时淘汰最久未使用的条目；所有条目在下一个收盘后的时间点过期，
+    保证收盘后能拿到当天最新的行情。统计命中、未命中、淘汰和过期次数。
+    所有操作都是线程安全的，get_or_load对同一个键的并发未命中只加载一次。
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, expire_time=CACHE_EXPIRE_TIME):
+        self.max_bytes = max_bytes
+        self.expire_time = expire_time
+        self.entries = OrderedDict()  # key -> (value, 字节数, 过期时间)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.flight = SingleFlight()
+        self.lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """读取缓存，命中时把条目移到最近使用的位置"""
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and datetime.now() >= entry[2]:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_load(self, key, loader, refresh=False):
+        """读取缓存，未命中时调用loader()加载并写入缓存，loader返回None时不缓存
+
+        多个线程同时未命中同一个键时只有一个线程调用loader，其余线程等待并共享结果。
+        refresh为True时跳过缓存直接加载（并发的刷新同样只加载一次）。
+        """
+        if not refresh:
+            value = self.get(key)
+            if value is not None:
+                return value
+
+        def load():
+            # 排队期间上一次加载可能刚刚写入缓存
+            if not refresh:
+                with self.lock:
+                    entry = self.entries.get(key)
+                    if entry is not None and datetime.now() < entry[2]:
+                        return entry[0]
+
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+            return value
+
+        return self.flight.do(key, load)
+
+    def set(self, key, value):
+        """写入缓存，超出内存预算时淘汰最久未使用的条目；单个条目超过预算时不缓存"""
+        size = estimate_size(value)
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (value, size, next_expire_time(expire_time=self.expire_time))
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            return self._remove(key)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """缓存统计信息"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'coalesced': self.flight.coalesced,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and datetime.now() < entry[2]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _remove(self, key):
+        value, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        return value
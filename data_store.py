@@ -0,0 +1,180 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from config import DATA_STORE_DIR
+
+class OHLCStore:
+    """本地列式日线数据存储
+
+    每个字段一个float64二进制文件，行=交易日、列=股票，通过np.memmap按需读取。
+    新交易日的全市场截面直接追加到文件末尾，只产生当天数据量的磁盘I/O；
+    meta.json记录已存储的交易日、股票代码和列容量，最后写入，保证中断后数据一致。
+    价格按未复权存储，读取时用adj_factor换算为前复权。
+    """
+
+    FIELDS = ['open', 'high', 'low', 'close', 'vol', 'amount', 'adj_factor']
+    PRICE_FIELDS = ['open', 'high', 'low', 'close']
+
+    def __init__(self, root=DATA_STORE_DIR, capacity=8192):
+        self.root = root
+        self.lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+        meta = self._read_meta()
+        self.dates = meta.get('dates', [])
+        self.tickers = meta.get('tickers', [])
+        self.capacity = meta.get('capacity', capacity)
+        self.ticker_index = {code: i for i, code in enumerate(self.tickers)}
+        self._maps = {}
+
+    def last_date(self):
+        """最后一个已存储的交易日（YYYYMMDD），空库返回None"""
+        return self.dates[-1] if self.dates else None
+
+    def first_date(self):
+        """第一个已存储的交易日（YYYYMMDD），空库返回None"""
+        return self.dates[0] if self.dates else None
+
+    def has_ticker(self, ts_code):
+        return ts_code in self.ticker_index
+
+    def append(self, trade_date, df):
+        """追加一个交易日的全市场截面数据，df需包含ts_code列和FIELDS中的字段"""
+        with self.lock:
+            if self.dates and trade_date <= self.dates[-1]:
+                return False
+
+            for code in df['ts_code']:
+                if code not in self.ticker_index:
+                    self.ticker_index[code] = len(self.tickers)
+                    self.tickers.append(code)
+
+            if len(self.tickers) > self.capacity:
+                self._resize(max(self.capacity * 2, len(self.tickers)))
+
+            # 先释放内存映射，Windows下映射中的文件无法截断
+            self._maps.clear()
+            columns = df['ts_code'].map(self.ticker_index).to_numpy()
+            row_bytes = self.capacity * 8
+
+            for field in self.FIELDS:
+                row = np.full(self.capacity, np.nan)
+                if field in df.columns:
+                    row[columns] = df[field].to_numpy(dtype=float)
+
+                path = self._field_path(field)
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    # 丢弃上次中断写入的残留数据
+                    f.seek(len(self.dates) * row_bytes)
+                    f.truncate()
+                    f.write(row.tobytes())
+
+            self.dates.append(trade_date)
+            self._write_meta()
+            return True
+
+    def read_field(self, field, start_date=None, end_date=None):
+        """读取字段的日期区间切片，返回 (交易日列表, 行=交易日 列=股票 的数组视图)"""
+        with self.lock:
+            if not self.dates:
+                return [], np.empty((0, 0))
+
+            data = self._map(field)
+            start = np.searchsorted(self.dates, start_date) if start_date else 0
+            end = np.searchsorted(self.dates, end_date, side='right') if end_date else len(self.dates)
+            return self.dates[start:end], data[start:end, :len(self.tickers)]
+
+    def get_panel(self, field='close', start_date=None, end_date=None):
+        """读取前复权面板，返回行=交易日、列=股票代码的DataFrame"""
+        dates, values = self.read_field(field, start_date, end_date)
+        _, factors = self.read_field('adj_factor', start_date, end_date)
+
+        if not dates:
+            return pd.DataFrame()
+
+        values = np.array(values)
+        if field in self.PRICE_FIELDS:
+            values = values * self._qfq_ratio(np.array(factors))
+
+        return pd.DataFrame(values, index=pd.to_datetime(dates, format='%Y%m%d'),
+                            columns=self.tickers[:values.shape[1]])
+
+    def get_history(self, ts_code, start_date=None, end_date=None):
+        """读取单只股票的前复权日线，停牌日不返回，列格式与pro.daily一致"""
+        with self.lock:
+            if ts_code not in self.ticker_index:
+                return pd.DataFrame()
+
+            column = self.ticker_index[ts_code]
+            dates, _ = self.read_field('close', start_date, end_date)
+            data = {field: np.array(self.read_field(field, start_date, end_date)[1][:, column])
+                    for field in self.FIELDS}
+
+            # 前复权以全部已存储数据中最新的复权因子为基准
+            all_factors = self._map('adj_factor')[:len(self.dates), column]
+            latest = all_factors[~np.isnan(all_factors)]
+
+        ratio = data['adj_factor'] / latest[-1] if len(latest) else np.ones(len(dates))
+        ratio = np.where(np.isnan(ratio), 1.0, ratio)
+
+        df = pd.DataFrame({'ts_code': ts_code, 'trade_date': pd.to_datetime(dates, format='%Y%m%d')})
+        for field in self.FIELDS[:-1]:
+            df[field] = data[field] * ratio if field in self.PRICE_FIELDS else data[field]
+
+        return df[df['close'].notna()].reset_index(drop=True)
+
+    def count_rows(self, ts_code):
+        """单只股票已存储的有效交易日数量"""
+        with self.lock:
+            if ts_code not in self.ticker_index:
+                return 0
+            column = self._map('close')[:len(self.dates), self.ticker_index[ts_code]]
+            return int(np.count_nonzero(~np.isnan(column)))
+
+    def _qfq_ratio(self, factors):
+        """复权系数：当日复权因子 / 区间内最新复权因子，缺失时按1处理"""
+        latest = pd.DataFrame(factors).ffill().iloc[-1].to_numpy() if len(factors) else factors
+        ratio = factors / latest
+        return np.where(np.isnan(ratio), 1.0, ratio)
+
+    def _resize(self, capacity):
+        """扩充列容量，需要重写全部字段文件（仅在新增股票超过容量时发生）"""
+        for field in self.FIELDS:
+            path = self._field_path(field)
+            data = np.full((len(self.dates), capacity), np.nan)
+            if self.dates and os.path.exists(path):
+                data[:, :self.capacity] = self._map(field)[:len(self.dates)]
+            self._maps.pop(field, None)
+
+            tmp_path = path + '.tmp'
+            data.tofile(tmp_path)
+            os.replace(tmp_path, path)
+
+        self.capacity = capacity
+        self._maps.clear()
+        self._write_meta()
+
+    def _map(self, field):
+        if field not in self._maps:
+            self._maps[field] = np.memmap(self._field_path(field), dtype=np.float64, mode='r',
+                                          shape=(len(self.dates), self.capacity))
+        return self._maps[field]
+
+    def _field_path(self, field):
+        return os.path.join(self.root, f"{field}.bin")
+
+    def _read_meta(self):
+        path = os.path.join(self.root, 'meta.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        path = os.path.join(self.root, 'meta.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'dates': self.dates, 'tickers': self.tickers, 'capacity': self.capacity}, f)
+        os.replace(tmp_path, path)
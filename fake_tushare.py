@@ -0,0 +1,211 @@
+"""
+离线tushare替身 - 用合成行情数据模拟 tushare pro_api
+
+不需要token和网络，可直接注入 StockDataFetcher(pro=FakeProApi()) 做功能测试。
+"""
+
+import asyncio
+import threading
+import time
+from collections import Counter, defaultdict, deque
+import numpy as np
+import pandas as pd
+
+def generate_market(n_stocks=50, n_days=120, seed=0, end_date=None, suspend_rate=0.02):
+    """生成合成的A股行情数据
+
+    价格为几何随机游走，少量股票在区间内发生除权（复权因子跳变），
+    并按 suspend_rate 随机删除部分交易日模拟停牌。
+    返回包含 stock_basic、daily、adj_factor、trade_dates 的字典。
+    """
+    rng = np.random.default_rng(seed)
+
+    end = pd.Timestamp(end_date) if end_date else pd.Timestamp.today().normalize()
+    dates = pd.bdate_range(end=end, periods=n_days)
+    trade_dates = dates.strftime('%Y%m%d').tolist()
+
+    # 依次轮流生成沪市主板、深市主板和创业板代码
+    boards = [(600000, 'SH'), (1, 'SZ'), (300001, 'SZ')]
+    codes = []
+    for i in range(n_stocks):
+        base, exchange = boards[i % len(boards)]
+        codes.append(f"{base + i // len(boards):06d}.{exchange}")
+
+    stock_basic = pd.DataFrame({
+        'ts_code': codes,
+        'name': [f"股票{i:04d}" for i in range(n_stocks)],
+        'industry': [['银行', '医药', '电子', '汽车'][i % 4] for i in range(n_stocks)]
+    })
+
+    # 前复权价格走势
+    returns = rng.normal(0.0005, 0.02, size=(n_days, n_stocks))
+    qfq_close = 10 * rng.uniform(0.5, 5, size=n_stocks) * np.exp(np.cumsum(returns, axis=0))
+
+    # 复权因子：约三分之一的股票在随机一天除权
+    adj_factor = np.ones((n_days, n_stocks))
+    for j in np.flatnonzero(rng.random(n_stocks) < 0.3):
+        day = rng.integers(1, n_days)
+        adj_factor[day:, j] = rng.uniform(1.05, 1.5)
+
+    # 未复权价格 = 前复权价格 * 最新复权因子 / 当日复权因子
+    close = qfq_close * adj_factor[-1] / adj_factor
+    open_ = close * (1 + rng.normal(0, 0.005, size=close.shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, size=close.shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, size=close.shape)))
+    vol = rng.uniform(1e4, 1e6, size=close.shape)
+
+    daily = pd.DataFrame({
+        'ts_code': np.tile(codes, n_days),
+        'trade_date': np.repeat(trade_dates, n_stocks),
+        'open': open_.ravel().round(2),
+        'high': high.ravel().round(2),
+        'low': low.ravel().round(2),
+        'close': close.ravel().round(2),
+        'vol': vol.ravel().round(2),
+        'amount': (vol * close / 10).ravel().round(3)
+    })
+    daily['pre_close'] = daily.groupby('ts_code')['close'].shift(1)
+    daily['change'] = daily['close'] - daily['pre_close']
+    daily['pct_chg'] = daily['change'] / daily['pre_close'] * 100
+
+    adj = pd.DataFrame({
+        'ts_code': daily['ts_code'],
+        'trade_date': daily['trade_date'],
+        'adj_factor': adj_factor.ravel()
+    })
+
+    # 随机停牌：停牌日没有日线数据（最早一天保留，保证每只股票都有行情）
+    suspended = rng.random(len(daily)) < suspend_rate
+    suspended[:n_stocks] = False
+    daily = daily[~suspended].reset_index(drop=True)
+
+    return {
+        'stock_basic': stock_basic,
+        'daily': daily,
+        'adj_factor': adj,
+        'trade_dates': trade_dates
+    }
+
+class FakeProApi:
+    """模拟 tushare pro_api 的离线实现，接口参数和返回格式与tushare保持一致"""
+
+    def __init__(self, market=None, latency=0.0, rate_limit=None, **kwargs):
+        self.market = market or generate_market(**kwargs)
+        self.latency = latency  # 每次调用模拟的网络延迟（秒）
+        self.rate_limit = rate_limit  # 每个接口每分钟允许的调用次数，超出时与tushare一样抛出异常
+        self.call_counts = Counter()  # 各接口的调用次数
+        self.rejected_counts = Counter()  # 因频率超限被拒绝的调用次数
+        self._calls = defaultdict(deque)  # 各接口最近一分钟内的调用时间
+        self._lock = threading.Lock()
+        self._groups = {}  # 按股票代码/交易日预先分组，避免每次调用都扫描全表
+
+    def _record(self, api_name):
+        if self.rate_limit:
+            self._check_rate(api_name)
+        self.call_counts[api_name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _check_rate(self, api_name):
+        """按滑动一分钟窗口统计调用次数，超出rate_limit时抛出与tushare相同文案的异常"""
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls[api_name]
+            while calls and now - calls[0] >= 60:
+                calls.popleft()
+
+            if len(calls) >= self.rate_limit:
+                self.rejected_counts[api_name] += 1
+                raise Exception(f"抱歉，您每分钟最多访问该接口{self.rate_limit}次，"
+                                f"权限的具体详情访问：https://tushare.pro/document/1?doc_id=108。")
+            calls.append(now)
+
+    def stock_basic(self, exchange='', list_status='L', fields=None):
+        self._record('stock_basic')
+        return self._select(self.market['stock_basic'], fields)
+
+    def trade_cal(self, exchange='SSE', start_date=None, end_date=None, is_open=None):
+        self._record('trade_cal')
+        start = pd.Timestamp(start_date) if start_date else pd.Timestamp(self.market['trade_dates'][0])
+        end = pd.Timestamp(end_date) if end_date else pd.Timestamp(self.market['trade_dates'][-1])
+        open_dates = set(self.market['trade_dates'])
+
+        cal_dates = pd.date_range(start, end).strftime('%Y%m%d')
+        df = pd.DataFrame({
+            'exchange': exchange,
+            'cal_date': cal_dates,
+            'is_open': [1 if d in open_dates else 0 for d in cal_dates]
+        })
+
+        if is_open is not None:
+            df = df[df['is_open'] == int(is_open)]
+
+        return df.sort_values('cal_date', ascending=False).reset_index(drop=True)
+
+    def daily(self, ts_code=None, trade_date=None, start_date=None, end_date=None, fields=None, **kwargs):
+        # 与tushare一致，pro.daily没有复权参数，adj等其他参数被忽略，总是返回未复权行情
+        self._record('daily')
+        df = self._filter(self.market['daily'], ts_code, trade_date, start_date, end_date)
+        return self._select(df, fields)
+
+    def adj_factor(self, ts_code=None, trade_date=None, start_date=None, end_date=None, fields=None):
+        self._record('adj_factor')
+        df = self._filter(self.market['adj_factor'], ts_code, trade_date, start_date, end_date)
+        return self._select(df, fields)
+
+    def _filter(self, df, ts_code, trade_date, start_date, end_date):
+        """按股票代码和日期过滤，并按交易日降序排列（与tushare一致）"""
+        if ts_code:
+            df = self._group(df, 'ts_code', ts_code)
+        if trade_date:
+            df = self._group(df, 'trade_date', trade_date)
+        if start_date:
+            df = df[df['trade_date'] >= start_date]
+        if end_date:
+            df = df[df['trade_date'] <= end_date]
+        return df.sort_values('trade_date', ascending=False).reset_index(drop=True)
+
+    def _group(self, df, column, value):
+        """取出df中column等于value的行，行情表首次访问时按column建立分组"""
+        tables = [name for name in ('daily', 'adj_factor') if self.market.get(name) is df]
+        if not tables:
+            return df[df[column] == value]
+
+        key = (tables[0], column)
+        if key not in self._groups:
+            self._groups[key] = {k: g for k, g in df.groupby(column)}
+        return self._groups[key].get(value, df.iloc[0:0])
+
+    def _select(self, df, fields):
+        """只返回fields中指定的列"""
+        if fields:
+            df = df[[f for f in fields.split(',') if f in df.columns]]
+        return df.copy()
+
+class AsyncFakeProApi:
+    """FakeProApi的异步版本，接口为协程，用于离线测量异步获取流水线的吞吐"""
+
+    def __init__(self, market=None, latency=0.0, rate_limit=None, **kwargs):
+        self.api = FakeProApi(market, rate_limit=rate_limit, **kwargs)
+        self.latency = latency
+
+    @property
+    def call_counts(self):
+        return self.api.call_counts
+
+    async def _call(self, api_name, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return getattr(self.api, api_name)(**kwargs)
+
+    async def stock_basic(self, **kwargs):
+        return await self._call('stock_basic', **kwargs)
+
+    async def trade_cal(self, **kwargs):
+        return await self._call('trade_cal', **kwargs)
+
+    async def daily(self, **kwargs):
+        return await self._call('daily', **kwargs)
+
+    async def adj_factor(self, **kwargs):
+        return await self._call('adj_factor', **kwargs)
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import API_CALLS_PER_MINUTE, FETCH_WORKERS, FETCH_MAX_RETRIES, FETCH_RETRY_BACKOFF
+from metrics import RATE_LIMIT_WAIT, record_api_call
+
+# tushare超过频率限制时返回的错误信息片段
+RATE_LIMIT_MESSAGES = ('每分钟最多访问', '最多访问该接口')
+
+class TokenBucket:
+    """令牌桶限流器，按每分钟调用次数匀速发放令牌，多个线程共享同一个桶"""
+
+    def __init__(self, rate_per_minute=API_CALLS_PER_MINUTE, capacity=None):
+        self.rate = rate_per_minute / 60.0  # 每秒发放的令牌数
+        self.capacity = capacity or max(1, int(self.rate))  # 最多允许的突发调用数
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """预占令牌，返回调用方还需等待的秒数（0表示可以立即调用）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens=1):
+        """阻塞直到拿到令牌"""
+        wait = self.reserve(tokens)
+        RATE_LIMIT_WAIT.observe(wait)
+        if wait > 0:
+            time.sleep(wait)
+
+def is_rate_limit_error(error):
+    message = str(error)
+    return any(text in message for text in RATE_LIMIT_MESSAGES)
+
+def is_retryable_error(error):
+    """频率超限和网络错误可以重试，其余错误（如参数错误、权限不足）直接抛出"""
+    return isinstance(error, OSError) or is_rate_limit_error(error)
+
+def error_reason(error):
+    """指标中记录的失败原因"""
+    return 'rate_limit' if is_rate_limit_error(error) else type(error).__name__
+
+def instrument_api(api_name, func):
+    """包装接口函数，每次调用（包括重试）都记录耗时、次数和失败原因"""
+    def call(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            record_api_call(api_name, time.perf_counter() - start, error_reason(e))
+            raise
+        record_api_call(api_name, time.perf_counter() - start)
+        return result
+    return call
+
+def retry_delay(attempt, backoff=FETCH_RETRY_BACKOFF):
+    """第attempt次重试前的退避时间：backoff * 2^attempt，带随机抖动避免多个请求同时重试"""
+    return backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+class FetchPool:
+    """并发数据获取池
+
+    所有API调用先从共享的令牌桶拿令牌，遇到频率超限或网络错误时指数退避重试；
+    批量任务在有界线程池中并发执行，整体速度只受账户配额限制。
+    """
+
+    def __init__(self, limiter=None, max_workers=FETCH_WORKERS, max_retries=FETCH_MAX_RETRIES,
+                 backoff=FETCH_RETRY_BACKOFF):
+        self.limiter = limiter or TokenBucket()
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch',
+                                           initializer=self._mark_worker)
+
+    def _mark_worker(self):
+        self.local.is_worker = True
+
+    def call(self, func, *args, **kwargs):
+        """限流调用一次API，可重试的错误按指数退避后重试"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = retry_delay(attempt, self.backoff)
+                print(f"API调用失败（{e}），{delay:.1f}秒后第{attempt + 1}次重试")
+                time.sleep(delay)
+
+    def map(self, func, items, *args, ordered=False):
+        """在线程池中并发执行 func(item, *args)，产出 (item, 结果)
+
+        默认按完成顺序产出，ordered=True时按输入顺序产出；
+        调用方提前停止迭代时，尚未开始的任务会被取消。
+        """
+        items = list(items)
+
+        # 在工作线程内再次提交任务并等待会占满线程池导致死锁，此时直接串行执行
+        if getattr(self.local, 'is_worker', False):
+            for item in items:
+                yield item, func(item, *args)
+            return
+
+        futures = [self.executor.submit(func, item, *args) for item in items]
+
+        try:
+            if ordered:
+                for item, future in zip(items, futures):
+                    yield item, future.result()
+            else:
+                index = {future: item for item, future in zip(items, futures)}
+                for future in as_completed(futures):
+                    yield index[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,229 @@
+import re
+import numpy as np
+from ma_engine import compact_order
+
+# 指标注册表：名称 -> Indicator
+INDICATORS = {}
+
+# 面板输入：收盘价（必需）和成交量（可选，vol_ma等成交量指标需要）
+INPUTS = ('close', 'vol')
+
+class Indicator:
+    """一个可在面板上批量计算的指标
+
+    deps(*params)返回计算所需的其他指标、中间量或输入（close、vol）的名称，func(*依赖的数组, *params)
+    返回与面板同形状的二维数组（累计和类中间量多一行首行0）。history(*params)是得到稳定结果所需的交易日数。
+    前periods个参数是窗口周期（交易日数），必须是正整数，省略时所有参数都是周期。
+    """
+
+    def __init__(self, name, func, deps, defaults=(), history=None, description='', periods=None):
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.defaults = tuple(defaults)
+        self.periods = len(self.defaults) if periods is None else periods
+        self.history = history or (lambda *params: max([1, *params]))
+        self.description = description
+
+def register(name, deps, defaults=(), history=None, description='', periods=None):
+    """注册指标的装饰器；以下划线开头的名称是共享的中间量，不对外列出"""
+    def decorator(func):
+        INDICATORS[name] = Indicator(name, func, deps, defaults, history, description, periods)
+        return func
+    return decorator
+
+def parse_spec(spec):
+    """解析用户请求的指标名，如 'sma_20'、'macd_12_26_9'、'boll_upper'（省略的参数取默认值），返回 (Indicator, 参数元组)
+
+    只接受public_indicators()中的指标，以下划线开头的中间量（如累计和，比面板多一行）不能直接请求。
+    """
+    indicator, params = _resolve_spec(spec)
+    if indicator.name.startswith('_'):
+        raise ValueError(f"未知的指标: {spec}，可用指标: {', '.join(public_indicators())}")
+    return indicator, params
+
+def _resolve_spec(spec):
+    """解析指标名，包括中间量，用于按deps计算依赖"""
+    match = re.fullmatch(r'([a-z_]+?)((?:_\d+(?:\.\d+)?)*)', spec)
+    indicator = INDICATORS.get(match.group(1)) if match else None
+    if indicator is None:
+        raise ValueError(f"未知的指标: {spec}，可用指标: {', '.join(public_indicators())}")
+
+    given = [float(p) if '.' in p else int(p) for p in match.group(2).split('_')[1:]]
+    if len(given) > len(indicator.defaults):
+        raise ValueError(f"指标 {spec} 的参数过多，最多 {len(indicator.defaults)} 个")
+    for period in given[:indicator.periods]:
+        if not isinstance(period, int) or period < 1:
+            raise ValueError(f"指标 {spec} 的周期应为正整数")
+    return indicator, tuple(given) + indicator.defaults[len(given):]
+
+def required_inputs(specs):
+    """一组指标（递归地包括它们依赖的指标和中间量）需要的面板输入，如 {'close', 'vol'}"""
+    inputs = set()
+    pending = list(specs)
+    seen = set()
+    while pending:
+        spec = pending.pop()
+        if spec in seen:
+            continue
+        seen.add(spec)
+        if spec in INPUTS:
+            inputs.add(spec)
+            continue
+        indicator, params = _resolve_spec(spec)
+        pending.extend(indicator.deps(*params))
+    return inputs
+
+def required_history(spec):
+    """计算指标需要的交易日数，输入（如close）为1"""
+    if spec in INPUTS:
+        return 1
+    indicator, params = parse_spec(spec)
+    return indicator.history(*params)
+
+def public_indicators():
+    return {name: indicator for name, indicator in INDICATORS.items() if not name.startswith('_')}
+
+def _window_sum(cumsum, k):
+    """由首行补0的累计和得到每个位置向前k行的窗口和，前k-1行为NaN"""
+    result = np.full((cumsum.shape[0] - 1, cumsum.shape[1]), np.nan)
+    if k <= result.shape[0]:
+        result[k - 1:] = cumsum[k:] - cumsum[:-k]
+    return result
+
+def _prefix_cumsum(values):
+    return np.vstack([np.zeros((1, values.shape[1])), np.nancumsum(values, axis=0)])
+
+def ema(values, n):
+    """按列计算指数移动平均（alpha=2/(n+1)，以每列第一个有效值为初值），逐日递推、各列同时计算"""
+    alpha = 2 / (n + 1)
+    result = np.full(values.shape, np.nan)
+    previous = np.full(values.shape[1], np.nan)
+    # 面板已压缩掉停牌日，NaN只出现在每列开头，第一个有效值之后不会再中断
+    for i, row in enumerate(values):
+        previous = np.where(np.isnan(previous), row, alpha * row + (1 - alpha) * previous)
+        result[i] = previous
+    return result
+
+# 共享的中间量：收盘价和成交量的累计和、有效值计数，各周期的均线和标准差都由它们相减得到
+
+@register('_close_sum', deps=lambda: ['close'])
+def _close_sum(close):
+    return _prefix_cumsum(close)
+
+@register('_close_sq_sum', deps=lambda: ['close'])
+def _close_sq_sum(close):
+    return _prefix_cumsum(close ** 2)
+
+@register('_count', deps=lambda: ['close'])
+def _count(close):
+    return _prefix_cumsum((~np.isnan(close)).astype(float))
+
+@register('_vol_sum', deps=lambda: ['vol'])
+def _vol_sum(vol):
+    return _prefix_cumsum(vol)
+
+@register('_vol_count', deps=lambda: ['vol'])
+def _vol_count(vol):
+    return _prefix_cumsum((~np.isnan(vol)).astype(float))
+
+def _mean(total, count, n):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(_window_sum(count, n) >= n, _window_sum(total, n) / n, np.nan)
+
+@register('sma', deps=lambda n: ['_close_sum', '_count'], defaults=(20,), description='收盘价简单移动平均')
+def sma(close_sum, count, n):
+    return _mean(close_sum, count, n)
+
+@register('ema', deps=lambda n: ['close'], defaults=(12,), history=lambda n: 3 * n,
+          description='收盘价指数移动平均')
+def _ema(close, n):
+    return ema(close, n)
+
+@register('macd', deps=lambda fast, slow, signal: [f'ema_{fast}', f'ema_{slow}'], defaults=(12, 26, 9),
+          history=lambda fast, slow, signal: 3 * slow + signal, description='MACD快线（DIF）')
+def macd(ema_fast, ema_slow, fast, slow, signal):
+    return ema_fast - ema_slow
+
+@register('macd_signal', deps=lambda fast, slow, signal: [f'macd_{fast}_{slow}_{signal}'], defaults=(12, 26, 9),
+          history=lambda fast, slow, signal: 3 * slow + signal, description='MACD信号线（DEA）')
+def macd_signal(dif, fast, slow, signal):
+    return ema(dif, signal)
+
+@register('macd_hist', deps=lambda fast, slow, signal: [f'macd_{fast}_{slow}_{signal}',
+                                                        f'macd_signal_{fast}_{slow}_{signal}'],
+          defaults=(12, 26, 9), history=lambda fast, slow, signal: 3 * slow + signal,
+          description='MACD柱（2×(DIF-DEA)）')
+def macd_hist(dif, dea, fast, slow, signal):
+    return 2 * (dif - dea)
+
+@register('_std', deps=lambda n: ['_close_sum', '_close_sq_sum', '_count'], defaults=(20,))
+def _std(close_sum, close_sq_sum, count, n):
+    mean = _mean(close_sum, count, n)
+    mean_sq = _mean(close_sq_sum, count, n)
+    return np.sqrt(np.maximum(mean_sq - mean ** 2, 0))
+
+@register('boll_mid', deps=lambda n, k: [f'sma_{n}'], defaults=(20, 2), history=lambda n, k: n,
+          description='布林带中轨', periods=1)
+def boll_mid(mid, n, k):
+    return mid
+
+@register('boll_upper', deps=lambda n, k: [f'sma_{n}', f'_std_{n}'], defaults=(20, 2), history=lambda n, k: n,
+          description='布林带上轨（中轨+k倍标准差）', periods=1)
+def boll_upper(mid, std, n, k):
+    return mid + k * std
+
+@register('boll_lower', deps=lambda n, k: [f'sma_{n}', f'_std_{n}'], defaults=(20, 2), history=lambda n, k: n,
+          description='布林带下轨（中轨-k倍标准差）', periods=1)
+def boll_lower(mid, std, n, k):
+    return mid - k * std
+
+@register('vol_ma', deps=lambda n: ['_vol_sum', '_vol_count'], defaults=(5,), description='成交量移动平均')
+def vol_ma(vol_sum, vol_count, n):
+    return _mean(vol_sum, vol_count, n)
+
+class IndicatorEngine:
+    """在 行=交易日、列=股票 的面板上按依赖关系计算指标
+
+    停牌日（收盘价为NaN）先按列压缩掉，与逐只获取的日线口径一致；成交量按收盘价的顺序一起压缩。
+    每个指标和中间量只计算一次，多个指标共享同一份累计和，所有股票在同一次向量化计算中完成。
+    """
+
+    def __init__(self, close, vol=None):
+        close = np.asarray(close, dtype=float)
+        if close.ndim == 1:
+            close = close[:, None]
+        order = compact_order(close)
+
+        self.values = {'close': np.take_along_axis(close, order, axis=0)}
+        if vol is not None:
+            vol = np.asarray(vol, dtype=float).reshape(close.shape)
+            self.values['vol'] = np.take_along_axis(vol, order, axis=0)
+
+    def get(self, spec):
+        """计算（或取出已计算的）指标，返回与面板同形状的二维数组，最后一行为最新交易日"""
+        if spec in self.values:
+            return self.values[spec]
+        if spec in INPUTS:
+            raise ValueError(f"面板中没有{spec}数据，无法计算依赖它的指标")
+
+        # 按带全部参数的规范名缓存，相同指标的不同写法（如 'sma' 和 'sma_20'）共享计算结果
+        indicator, params = _resolve_spec(spec)
+        key = '_'.join([indicator.name, *map(str, params)])
+        if key not in self.values:
+            inputs = [self.get(dep) for dep in indicator.deps(*params)]
+            self.values[key] = indicator.func(*inputs, *params)
+        return self.values[key]
+
+    def evaluate(self, specs):
+        """计算一组指标，返回 {指标名: 二维数组}"""
+        return {spec: self.get(spec) for spec in specs}
+
+    def latest(self, specs):
+        """各指标在最新交易日的值，返回 {指标名: 每只股票一个值的一维数组}"""
+        return {spec: values[-1] for spec, values in self.evaluate(specs).items()}
+
+def series_indicators(values, specs):
+    """计算单只股票按日期升序的一维序列的指标，返回 {指标名: 一维数组}"""
+    engine = IndicatorEngine(np.asarray(values, dtype=float)[:, None])
+    return {spec: series[:, 0] for spec, series in engine.evaluate(specs).items()}
@@ -0,0 +1,343 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import JOB_WORKERS, JOB_HISTORY_SIZE, JOB_RESULT_TTL, STREAM_HEARTBEAT, CHART_PREWARM_SIZE
+from stock_analyzer import RESULT_COLUMNS
+from top_k import TopKHeap
+
+class ScanJob:
+    """一次筛选任务的状态和结果
+
+    扫描过程中每只符合条件的股票一算出就追加到matches并加入前K名排行，
+    events()按到达顺序把这些结果推送给流式接口。
+    """
+
+    kind = 'scan'
+
+    def __init__(self, long_period, diff_threshold, profile=False):
+        self.id = uuid.uuid4().hex
+        self.long_period = long_period
+        self.diff_threshold = diff_threshold
+        self.status = 'queued'  # queued, running, completed, error
+        self.progress = 0
+        self.result = None  # 完成后为筛选结果DataFrame
+        self.error = None
+        self.cached = False
+        self.coverage = None  # 扫描覆盖率报告，命中结果缓存时为None
+        self.profile = profile  # 是否用cProfile记录这次扫描
+        self.profile_stats = None  # 完成后为按累计耗时排序的cProfile报告
+        self.created_at = time.time()
+        self.finished_at = None
+        self.matches = []  # 已算出的符合条件的股票，按到达顺序
+        self.top = TopKHeap()
+        self.condition = threading.Condition()
+
+    @property
+    def key(self):
+        return (self.long_period, self.diff_threshold)
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'error')
+
+    def execute(self, analyzer, progress_callback):
+        """在任务线程中执行扫描，返回筛选结果DataFrame"""
+        return analyzer.analyze_market(self.long_period, self.diff_threshold, progress_callback=progress_callback,
+                                       result_callback=self.add_result, refresh=self.profile)
+
+    def set_result(self, result):
+        """记录最终结果，调用时需持有condition"""
+        # 命中结果缓存时扫描没有逐只推送结果，直接用最终结果补齐
+        if not self.matches:
+            for record in result.to_dict('records'):
+                self.add_result(record)
+        self.result = result
+        self.coverage = result.attrs.get('coverage')
+
+    def chart_codes(self, limit=CHART_PREWARM_SIZE):
+        """完成后值得预热图表数据的股票：排名最靠前的limit只"""
+        if self.result is None or self.result.empty:
+            return []
+        return self.result['ts_code'].head(limit)
+
+    def add_result(self, record):
+        """接收一只股票的扫描结果，超过阈值的加入结果列表和排行"""
+        if not abs(record['diff_percent']) > self.diff_threshold:
+            return
+
+        match = {column: record[column] for column in RESULT_COLUMNS}
+        self.top.push(match)
+        with self.condition:
+            self.matches.append(match)
+            self.condition.notify_all()
+
+    def set_progress(self, progress):
+        with self.condition:
+            if progress != self.progress:
+                self.progress = progress
+                self.condition.notify_all()
+
+    def events(self, heartbeat=STREAM_HEARTBEAT):
+        """按到达顺序产出任务事件：stock（新的符合条件的股票）、progress、heartbeat，最后是done"""
+        sent = 0
+        progress = None
+
+        while True:
+            with self.condition:
+                if sent == len(self.matches) and progress == self.progress and not self.finished:
+                    self.condition.wait(heartbeat)
+                matches = self.matches[sent:]
+                current = self.progress
+                finished = self.finished
+
+            sent += len(matches)
+            for match in matches:
+                yield {'type': 'stock', 'stock': match}
+
+            if current != progress:
+                progress = current
+                yield {'type': 'progress', 'progress': progress, 'matched': sent}
+            elif not matches and not finished:
+                yield {'type': 'heartbeat'}
+
+            if finished:
+                yield {'type': 'done', **self.to_status(), 'count': sent, 'top': self.top.items()}
+                return
+
+    def to_status(self):
+        """任务状态，用于/api/status接口"""
+        status = {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'matched': len(self.matches),
+            'long_period': self.long_period,
+            'diff_threshold': self.diff_threshold,
+            'cached': self.cached
+        }
+        if self.coverage:
+            status['coverage'] = self.coverage
+        if self.error:
+            status['message'] = self.error
+        return status
+
+class SweepJob(ScanJob):
+    """一次参数扫描任务：多组 长期周期 × 差异阈值 共用一次数据获取
+
+    完成后result为组合列表，每个组合一项：{'long_period', 'diff_threshold', 'results': 筛选后的DataFrame}。
+    扫描不逐只推送结果，流式接口只有进度和完成事件。
+    """
+
+    kind = 'sweep'
+
+    def __init__(self, long_periods, diff_thresholds):
+        super().__init__(None, None)
+        self.long_periods = sorted(set(long_periods))
+        self.diff_thresholds = list(diff_thresholds)
+
+    @property
+    def key(self):
+        return ('sweep', tuple(self.long_periods), tuple(self.diff_thresholds))
+
+    def execute(self, analyzer, progress_callback):
+        combinations, self.coverage = analyzer.sweep(self.long_periods, self.diff_thresholds,
+                                                     progress_callback=progress_callback)
+        return combinations
+
+    def set_result(self, result):
+        self.result = result
+
+    def chart_codes(self, limit=CHART_PREWARM_SIZE):
+        return []
+
+    def to_status(self):
+        status = super().to_status()
+        del status['long_period'], status['diff_threshold'], status['matched']
+        status.update(kind=self.kind, long_periods=self.long_periods, diff_thresholds=self.diff_thresholds)
+        return status
+
+class JobManager:
+    """筛选任务管理器
+
+    每个请求得到一个任务ID；参数相同且仍在排队或运行的请求合并为同一个任务。
+    任务在固定大小的线程池中排队执行，所有任务共享分析器的令牌桶和缓存。
+    已完成的任务最多保留max_finished个，超过数量或保留时间后按完成顺序淘汰。
+    """
+
+    def __init__(self, analyzer, max_workers=JOB_WORKERS, max_finished=JOB_HISTORY_SIZE, ttl=JOB_RESULT_TTL):
+        self.analyzer = analyzer
+        self.max_finished = max_finished
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan-job')
+        self.jobs = {}  # job_id -> ScanJob
+        self.active = {}  # ScanJob.key -> 排队或运行中的任务
+        self.finished = OrderedDict()  # job_id -> None，按完成顺序排列
+        self.prewarms = []  # 仍在运行的图表预热线程
+        self.lock = threading.Lock()
+
+    def submit(self, long_period, diff_threshold, profile=False):
+        """提交筛选任务，返回ScanJob；当前交易日已有缓存结果时任务直接完成
+
+        profile为True时不合并、不使用结果缓存，完整扫描一次并记录cProfile报告。
+        """
+        key = (long_period, diff_threshold)
+
+        if profile:
+            job = ScanJob(long_period, diff_threshold, profile=True)
+            with self.lock:
+                self.jobs[job.id] = job
+                self.executor.submit(self._run, job)
+            return job
+
+        with self.lock:
+            job = self.active.get(key)
+            if job is not None:
+                return job
+
+        cached = self.analyzer.get_cached_results(long_period, diff_threshold)
+
+        with self.lock:
+            # 查询缓存期间可能已有相同参数的任务提交
+            job = self.active.get(key)
+            if job is not None:
+                return job
+
+            job = ScanJob(long_period, diff_threshold)
+            self.jobs[job.id] = job
+
+            if cached is not None:
+                job.cached = True
+                self._finish(job, result=cached)
+            else:
+                self.active[key] = job
+                self.executor.submit(self._run, job)
+
+        return job
+
+    def submit_sweep(self, long_periods, diff_thresholds):
+        """提交参数扫描任务，返回SweepJob；参数相同且仍在排队或运行的扫描合并为同一个任务"""
+        job = SweepJob(long_periods, diff_thresholds)
+
+        with self.lock:
+            active = self.active.get(job.key)
+            if active is not None:
+                return active
+
+            self.jobs[job.id] = job
+            self.active[job.key] = job
+            self.executor.submit(self._run, job)
+
+        return job
+
+    def get(self, job_id):
+        """按ID查询任务，不存在或已被淘汰时返回None"""
+        with self.lock:
+            self._evict()
+            return self.jobs.get(job_id)
+
+    def discard(self, job_id):
+        """丢弃已完成的任务结果，排队或运行中的任务不受影响"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or not job.finished:
+                return False
+
+            del self.jobs[job_id]
+            self.finished.pop(job_id, None)
+            return True
+
+    def stats(self):
+        """各状态的任务数量"""
+        with self.lock:
+            counts = {'queued': 0, 'running': 0, 'completed': 0, 'error': 0}
+            for job in self.jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        if wait:
+            for thread in list(self.prewarms):
+                thread.join()
+
+    def _run(self, job):
+        job.status = 'running'
+
+        def update_progress(done, total):
+            job.set_progress(int(done / total * 100))
+
+        profiler = cProfile.Profile() if job.profile else None
+
+        try:
+            if profiler:
+                profiler.enable()
+            result = job.execute(self.analyzer, update_progress)
+        except Exception as e:
+            print(f"分析失败: {e}")
+            with self.lock:
+                self._finish(job, error=str(e))
+            return
+        finally:
+            if profiler:
+                profiler.disable()
+                job.profile_stats = self._format_profile(profiler)
+
+        with self.lock:
+            self._finish(job, result=result)
+
+        # 结果已经可以查询，在独立的后台线程中预热排名靠前股票的图表数据，任务线程立即空出给排队的任务
+        codes = job.chart_codes()
+        if len(codes):
+            thread = threading.Thread(target=self._warm_charts, args=(list(codes),), name='chart-prewarm', daemon=True)
+            with self.lock:
+                self.prewarms = [t for t in self.prewarms if t.is_alive()] + [thread]
+            thread.start()
+
+    def _warm_charts(self, ts_codes):
+        try:
+            self.analyzer.warm_charts(ts_codes)
+        except Exception as e:
+            print(f"预热图表数据失败: {e}")
+
+    @staticmethod
+    def _format_profile(profiler, limit=50):
+        """按累计耗时排序的前limit个函数；只包含任务线程，线程池中并发获取数据的耗时体现为等待"""
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def _finish(self, job, result=None, error=None):
+        """记录任务结果并淘汰过多的已完成任务，调用时需持有锁"""
+        with job.condition:
+            if result is not None:
+                job.set_result(result)
+            job.error = error
+            job.progress = 100 if error is None else job.progress
+            job.finished_at = time.time()
+            job.status = 'completed' if error is None else 'error'
+            job.condition.notify_all()
+
+        if self.active.get(job.key) is job:
+            del self.active[job.key]
+
+        self.finished[job.id] = None
+        self._evict()
+
+    def _evict(self):
+        """淘汰超过保留时间或超出数量上限的已完成任务，调用时需持有锁"""
+        now = time.time()
+
+        while self.finished:
+            oldest = next(iter(self.finished))
+            job = self.jobs.get(oldest)
+            expired = job is None or now - job.finished_at > self.ttl
+            if not expired and len(self.finished) <= self.max_finished:
+                break
+
+            self.finished.popitem(last=False)
+            self.jobs.pop(oldest, None)
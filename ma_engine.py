@@ -0,0 +1,116 @@
+import numpy as np
+
+def compact_order(close):
+    """每列把NaN排到前面、有效值保持时间顺序排到后面的行下标，可用np.take_along_axis应用到同形状的其他面板"""
+    # 稳定排序：NaN（False）排到前面，有效值保持原有时间顺序排到后面
+    return np.argsort(~np.isnan(close), axis=0, kind='stable')
+
+def compact_valid(close):
+    """把每列的有效值（非NaN）按时间顺序移到底部
+
+    停牌日在面板中为NaN，压缩后每列最后k行就是该股票最近k个交易日的收盘价，
+    与逐只获取的日线数据（不含停牌日）口径一致。
+    返回 (压缩后的数组, 每列有效值数量)。
+    """
+    return np.take_along_axis(close, compact_order(close), axis=0), (~np.isnan(close)).sum(axis=0)
+
+def right_align(series_list, length):
+    """把长度不一的收盘价序列右对齐为 行=交易日、列=股票 的二维数组，不足部分补NaN"""
+    close = np.full((length, len(series_list)), np.nan)
+    for j, values in enumerate(series_list):
+        values = np.asarray(values, dtype=float)[-length:]
+        if len(values):
+            close[-len(values):, j] = values
+    return close
+
+def compute_ma_diff(close, long_period=20, short_period=5):
+    """批量计算全部股票的均线差异
+
+    close为 行=交易日（升序）、列=股票 的二维数组，停牌日为NaN。
+    返回 long_mean、latest_ma5、diff_percent、latest_close 四个一维数组，
+    有效数据不足long_period天的股票对应位置为NaN。
+    """
+    close = np.asarray(close, dtype=float)
+    n_stocks = close.shape[1] if close.ndim == 2 else 0
+
+    if close.shape[0] < long_period or n_stocks == 0:
+        empty = np.full(n_stocks, np.nan)
+        return {'long_mean': empty, 'latest_ma5': empty.copy(),
+                'diff_percent': empty.copy(), 'latest_close': empty.copy()}
+
+    compacted, counts = compact_valid(close)
+    enough = counts >= long_period
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        long_mean = np.where(enough, compacted[-long_period:].mean(axis=0), np.nan)
+        latest_ma5 = np.where(enough, compacted[-short_period:].mean(axis=0), np.nan)
+        diff_percent = (latest_ma5 - long_mean) / long_mean * 100
+
+    return {
+        'long_mean': long_mean,
+        'latest_ma5': latest_ma5,
+        'diff_percent': diff_percent,
+        'latest_close': np.where(enough, compacted[-1], np.nan)
+    }
+
+def compute_single_ma_diff(closes, long_period=20, short_period=5):
+    """计算单只股票的均线差异，closes为按日期升序的收盘价，数据不足long_period天时返回None"""
+    closes = np.asarray(closes, dtype=float)
+    if len(closes) < long_period:
+        return None
+
+    long_mean = closes[-long_period:].mean()
+    latest_ma5 = closes[-short_period:].mean()
+
+    return {
+        'long_mean': long_mean,
+        'latest_ma5': latest_ma5,
+        'diff_percent': ((latest_ma5 - long_mean) / long_mean) * 100,
+        'latest_close': closes[-1]
+    }
+
+def compute_ma_diff_multi(close, long_periods, short_period=5, extra_days=None):
+    """一次计算多个长期周期的均线差异
+
+    压缩停牌日后只做一次累计和，每个周期的窗口和都由两行累计和相减得到，
+    5日均线也复用同一份累计和。返回 {long_period: compute_ma_diff格式的结果}。
+    extra_days不为None时，每个周期只认最近 long_period + extra_days 行内的有效数据是否足够，
+    与单个周期扫描只获取这么多天的口径一致：长期停牌的股票不会因为面板更长而入选。
+    """
+    close = np.asarray(close, dtype=float)
+    n_days, n_stocks = close.shape if close.ndim == 2 else (0, 0)
+    compacted, counts = compact_valid(close)
+
+    # 首行补0，窗口和 = cumsum[-1] - cumsum[-1 - k]
+    cumsum = np.vstack([np.zeros((1, n_stocks)), np.nancumsum(compacted, axis=0)])
+
+    def window_mean(k):
+        return (cumsum[-1] - cumsum[-1 - k]) / k
+
+    results = {}
+    latest_ma5 = window_mean(short_period) if n_days >= short_period else np.full(n_stocks, np.nan)
+    latest_close = compacted[-1] if n_days else np.full(n_stocks, np.nan)
+
+    for long_period in long_periods:
+        if n_days < long_period:
+            results[long_period] = compute_ma_diff(close, long_period, short_period)
+            continue
+
+        if extra_days is None:
+            enough = counts >= long_period
+        else:
+            enough = (~np.isnan(close[-(long_period + extra_days):])).sum(axis=0) >= long_period
+        long_mean = np.where(enough, window_mean(long_period), np.nan)
+        ma5 = np.where(enough, latest_ma5, np.nan)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff_percent = (ma5 - long_mean) / long_mean * 100
+
+        results[long_period] = {
+            'long_mean': long_mean,
+            'latest_ma5': ma5,
+            'diff_percent': diff_percent,
+            'latest_close': np.where(enough, latest_close, np.nan)
+        }
+
+    return results
@@ -0,0 +1,135 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+class RollingMAState:
+    """逐日增量更新的均线状态
+
+    每只股票保存最近long_period个收盘价的环形缓冲区，以及5日和长期窗口的滚动和。
+    新交易日的截面到来时，每只股票只做常数次加减即可更新latest_ma5、long_mean和diff_percent。
+    缓冲区存的是后复权价格（未复权价 * 复权因子），除权不会改变历史值；
+    读取时除以最新复权因子即为前复权口径。停牌的股票当天不更新，与逐只获取的日线口径一致。
+    """
+
+    RESYNC_INTERVAL = 250  # 每隔多少个交易日用缓冲区重新求和，消除浮点累计误差
+
+    def __init__(self, long_period=20, short_period=5):
+        self.long_period = long_period
+        self.short_period = short_period
+        self.window = max(long_period, short_period)
+        self.last_date = None
+        self.updates = 0
+
+        self.tickers = []
+        self.index = {}
+        self.buffer = np.full((0, self.window), np.nan)  # 每行一只股票的环形缓冲区
+        self.pos = np.zeros(0, dtype=np.int64)  # 下一个写入位置
+        self.count = np.zeros(0, dtype=np.int64)  # 已写入的数量（最多window）
+        self.short_sum = np.zeros(0)
+        self.long_sum = np.zeros(0)
+        self.adj_factor = np.zeros(0)  # 最新复权因子
+
+    def update(self, trade_date, df):
+        """喂入一个交易日的截面（ts_code、未复权close、adj_factor），已处理过的交易日直接跳过"""
+        if self.last_date is not None and trade_date <= self.last_date:
+            return False
+
+        df = df[df['close'].notna()]
+        self._add_tickers(df['ts_code'])
+
+        idx = df['ts_code'].map(self.index).to_numpy()
+        adj = df['adj_factor'].to_numpy(dtype=float) if 'adj_factor' in df.columns else np.full(len(df), np.nan)
+        # 缺失复权因子时沿用上一次的值
+        adj = np.where(np.isnan(adj), self.adj_factor[idx], adj)
+        adj = np.where(adj > 0, adj, 1.0)
+        values = df['close'].to_numpy(dtype=float) * adj
+
+        pos = self.pos[idx]
+        count = self.count[idx]
+        leaving_long = np.where(count >= self.long_period, self.buffer[idx, pos], 0.0)
+        leaving_short = np.where(count >= self.short_period,
+                                 self.buffer[idx, (pos - self.short_period) % self.window], 0.0)
+
+        self.long_sum[idx] += values - leaving_long
+        self.short_sum[idx] += values - leaving_short
+        self.buffer[idx, pos] = values
+        self.pos[idx] = (pos + 1) % self.window
+        self.count[idx] = np.minimum(count + 1, self.window)
+        self.adj_factor[idx] = adj
+
+        self.last_date = trade_date
+        self.updates += 1
+        if self.updates % self.RESYNC_INTERVAL == 0:
+            self._resync()
+        return True
+
+    def results(self):
+        """当前每只股票的均线差异（前复权口径），数据不足long_period天的股票不返回"""
+        ready = np.flatnonzero(self.count >= self.long_period)
+        latest = self.buffer[ready, (self.pos[ready] - 1) % self.window]
+        adj = self.adj_factor[ready]
+
+        long_mean = self.long_sum[ready] / self.long_period / adj
+        latest_ma5 = self.short_sum[ready] / self.short_period / adj
+
+        return pd.DataFrame({
+            'ts_code': [self.tickers[i] for i in ready],
+            'long_mean': long_mean,
+            'latest_ma5': latest_ma5,
+            'diff_percent': (latest_ma5 - long_mean) / long_mean * 100,
+            'latest_close': latest / adj
+        })
+
+    def save(self, path):
+        """保存状态到npz文件，先写临时文件再替换，避免中断时损坏"""
+        tmp_path = path + '.tmp'
+        meta = {'long_period': self.long_period, 'short_period': self.short_period,
+                'last_date': self.last_date, 'updates': self.updates, 'tickers': self.tickers}
+
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, buffer=self.buffer, pos=self.pos, count=self.count, short_sum=self.short_sum,
+                     long_sum=self.long_sum, adj_factor=self.adj_factor, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """从npz文件恢复状态，文件不存在时返回None"""
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            state = cls(meta['long_period'], meta['short_period'])
+            state.last_date = meta['last_date']
+            state.updates = meta['updates']
+            state.tickers = meta['tickers']
+            state.index = {code: i for i, code in enumerate(state.tickers)}
+            for name in ['buffer', 'pos', 'count', 'short_sum', 'long_sum', 'adj_factor']:
+                setattr(state, name, data[name])
+
+        return state
+
+    def _add_tickers(self, ts_codes):
+        """为新出现的股票分配空的缓冲区"""
+        new_codes = [code for code in ts_codes if code not in self.index]
+        if not new_codes:
+            return
+
+        for code in new_codes:
+            self.index[code] = len(self.tickers)
+            self.tickers.append(code)
+
+        n = len(new_codes)
+        self.buffer = np.vstack([self.buffer, np.full((n, self.window), np.nan)])
+        self.pos = np.concatenate([self.pos, np.zeros(n, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(n, dtype=np.int64)])
+        self.short_sum = np.concatenate([self.short_sum, np.zeros(n)])
+        self.long_sum = np.concatenate([self.long_sum, np.zeros(n)])
+        self.adj_factor = np.concatenate([self.adj_factor, np.full(n, np.nan)])
+
+    def _resync(self):
+        """按缓冲区中的实际值重新计算滚动和"""
+        self.long_sum = np.nansum(self.buffer, axis=1)
+        offsets = (self.pos[:, None] - np.arange(1, self.short_period + 1)) % self.window
+        self.short_sum = np.nansum(np.take_along_axis(self.buffer, offsets, axis=1), axis=1)
@@ -0,0 +1,174 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 延迟直方图的默认分桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """只增不减的计数器，可按标签分组"""
+
+    type = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}  # 标签值元组 -> 数值
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, _format_labels(self.labels, key), value) for key, value in self.values.items()]
+
+class Gauge(Counter):
+    """可任意设置的仪表"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram:
+    """按固定分桶统计分布的直方图，输出累计分桶计数、总和与次数"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.values = {}  # 标签值元组 -> [各分桶计数, 总和, 次数]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, key, [('le', _format_value(float(bound)))])
+                    samples.append((f"{self.name}_bucket", labels, cumulative))
+                samples.append((f"{self.name}_sum", _format_labels(self.labels, key), total))
+                samples.append((f"{self.name}_count", _format_labels(self.labels, key), count))
+        return samples
+
+class MetricsRegistry:
+    """指标注册表，按Prometheus文本格式输出全部指标"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, buckets)
+
+    def render(self, extra=()):
+        """输出Prometheus文本格式，extra为抓取时临时生成的指标（不注册）"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics + list(extra):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+def stats_metrics(prefix, help_text, stats, counters=()):
+    """把统计字典转换为一组临时指标：counters中的键输出为计数器（加_total后缀），其余数值输出为仪表"""
+    metrics = []
+    for key, value in stats.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if key in counters:
+            metric = Counter(f"{prefix}_{key}_total", f"{help_text}：{key}")
+            metric.inc(value)
+        else:
+            metric = Gauge(f"{prefix}_{key}", f"{help_text}：{key}")
+            metric.set(value)
+        metrics.append(metric)
+    return metrics
+
+REGISTRY = MetricsRegistry()
+
+API_CALLS = REGISTRY.counter('tushare_api_calls_total', 'tushare接口调用次数（含重试）', ['api'])
+API_ERRORS = REGISTRY.counter('tushare_api_errors_total', 'tushare接口调用失败次数', ['api', 'reason'])
+API_LATENCY = REGISTRY.histogram('tushare_api_latency_seconds', 'tushare接口单次调用耗时（秒）', ['api'])
+RATE_LIMIT_WAIT = REGISTRY.histogram('rate_limit_wait_seconds', '调用前在令牌桶等待的时间（秒）')
+SCAN_PHASE_SECONDS = REGISTRY.histogram('scan_phase_seconds', '扫描各阶段耗时（秒）', ['phase'])
+SCAN_ROWS = REGISTRY.counter('scan_rows_total', '扫描各阶段处理的行数', ['phase'])
+SCAN_ROWS_PER_SECOND = REGISTRY.gauge('scan_rows_per_second', '扫描各阶段最近一次的处理速度（行/秒）', ['phase'])
+RESULT_CACHE_LOOKUPS = REGISTRY.counter('scan_result_cache_lookups_total', '全市场扫描结果缓存查询次数', ['result'])
+SCHEDULED_RUN_SECONDS = REGISTRY.histogram('scheduled_scan_seconds', '收盘后定时预计算每次运行的耗时（秒）', ['status'],
+                                           buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+
+def record_api_call(api_name, seconds, error_reason=None):
+    """记录一次接口调用的耗时和结果，error_reason为失败原因（如rate_limit），成功时为None"""
+    API_CALLS.inc(api=api_name)
+    API_LATENCY.observe(seconds, api=api_name)
+    if error_reason is not None:
+        API_ERRORS.inc(api=api_name, reason=error_reason)
+
+@contextmanager
+def timed_phase(phase, rows=None):
+    """统计一个扫描阶段的耗时；rows为处理的行数，也可以在with块内通过 stats['rows'] 设置"""
+    stats = {'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        elapsed = time.perf_counter() - start
+        SCAN_PHASE_SECONDS.observe(elapsed, phase=phase)
+        if stats['rows']:
+            SCAN_ROWS.inc(stats['rows'], phase=phase)
+            if elapsed > 0:
+                SCAN_ROWS_PER_SECOND.set(stats['rows'] / elapsed, phase=phase)
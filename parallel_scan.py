@@ -0,0 +1,94 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from config import SCAN_WORKERS, TOP_K_SIZE
+from ma_engine import compute_ma_diff
+from top_k import top_k_indices
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+def get_executor(workers=SCAN_WORKERS):
+    """获取常驻的进程池，worker数量变化时重建；使用spawn启动，避免在多线程的Flask进程中fork"""
+    global _executor, _executor_workers
+
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown()
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = workers
+        return _executor
+
+def shutdown_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+atexit.register(shutdown_executor)
+
+def _top_columns(diff, k, start=0):
+    """差异绝对值最大的k只股票（跳过NaN）在整个面板中的列号，按排名排列"""
+    valid = np.flatnonzero(~np.isnan(diff))
+    return start + valid[top_k_indices(diff[valid], k)]
+
+def _scan_shard(shm_name, shape, start, end, long_period, k):
+    """在worker进程中计算 [start, end) 列的均线差异，收盘价面板直接从共享内存读取
+
+    返回 (start, 各指标数组, 分片内差异最大的k只股票在整个面板中的列号)。
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        close = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        metrics = compute_ma_diff(close[:, start:end], long_period)
+        del close  # 关闭共享内存前必须释放对缓冲区的引用
+    finally:
+        shm.close()
+
+    return start, metrics, _top_columns(metrics['diff_percent'], k, start)
+
+def parallel_ma_diff(close, long_period=20, workers=SCAN_WORKERS, k=TOP_K_SIZE):
+    """把股票按列分片到多个进程并行计算均线差异
+
+    收盘价面板只复制一次到共享内存，各worker按列号区间读取，不需要序列化整个面板；
+    worker只返回分片的指标数组和分片内的前k名，合并时拼接指标并从各分片前k名中选出全局前k名。
+    返回 (与compute_ma_diff相同的指标字典, 全局前k名的列号数组)。只分得一片时直接在当前进程计算。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n_stocks = close.shape[1]
+    workers = min(workers, n_stocks)
+    if workers <= 1:
+        metrics = compute_ma_diff(close, long_period)
+        return metrics, _top_columns(metrics['diff_percent'], k)
+
+    bounds = np.linspace(0, n_stocks, workers + 1).astype(int)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(close.nbytes, 1))
+    try:
+        shared = np.ndarray(close.shape, dtype=np.float64, buffer=shm.buf)
+        shared[:] = close
+        del shared
+
+        executor = get_executor(workers)
+        futures = [executor.submit(_scan_shard, shm.name, close.shape, start, end, long_period, k)
+                   for start, end in zip(bounds[:-1], bounds[1:])]
+        shards = sorted((future.result() for future in futures), key=lambda shard: shard[0])
+    finally:
+        shm.close()
+        shm.unlink()
+
+    metrics = {name: np.concatenate([shard[1][name] for shard in shards])
+               for name in ['long_mean', 'latest_ma5', 'diff_percent', 'latest_close']}
+
+    # 全局前k名一定在各分片的前k名之中；按列号排序后再选，绝对值相同时与串行计算一样列号小的在前
+    candidates = np.sort(np.concatenate([shard[2] for shard in shards]))
+    top = candidates[top_k_indices(metrics['diff_percent'][candidates], k)]
+
+    return metrics, top
@@ -0,0 +1,199 @@
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from flask import Response
+from config import RESPONSE_CACHE_MAX_BYTES, COMPRESS_MIN_BYTES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # 未安装时只使用gzip压缩
+
+# 可协商的输出格式：json为逐行JSON（默认，兼容原有接口），columns为列式JSON，msgpack和arrow需要安装对应的可选依赖
+FORMATS = {
+    'json': 'application/json',
+    'columns': 'application/json',
+    'msgpack': 'application/x-msgpack',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+class FormatError(ValueError):
+    """请求的格式或游标无效"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class EncodedCache:
+    """编码后响应体的LRU缓存
+
+    键中包含结果版本、格式、分页区间和压缩方式，结果内容变化时版本随之改变，旧条目不再命中。
+    总字节数超过max_bytes时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> 编码后的bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_encode(self, key, encode):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+
+        body = encode()
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old)
+            if len(body) <= self.max_bytes:
+                self.entries[key] = body
+                self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+        return body
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits, 'misses': self.misses}
+
+ENCODED_CACHE = EncodedCache()
+
+def negotiate_format(request):
+    """按format参数或Accept头选择输出格式，未指定时为json"""
+    fmt = request.args.get('format')
+    if fmt is None:
+        mimetype = request.accept_mimetypes.best_match([FORMATS['json'], FORMATS['msgpack'], FORMATS['arrow']],
+                                                       default=FORMATS['json'])
+        fmt = {FORMATS['msgpack']: 'msgpack', FORMATS['arrow']: 'arrow'}.get(mimetype, 'json')
+
+    if fmt not in FORMATS:
+        raise FormatError(f"不支持的格式: {fmt}，可选 {', '.join(FORMATS)}", status=406)
+    return fmt
+
+def negotiate_encoding(request):
+    """按Accept-Encoding选择压缩方式：已安装brotli时优先br，其次gzip，都不接受时不压缩"""
+    accepted = request.accept_encodings
+    if accepted['br'] and brotli is not None:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def encode_cursor(version, offset):
+    """游标：结果版本的短哈希 + 下一页的起始位置，结果更新后旧游标失效"""
+    token = hashlib.sha1(str(version).encode()).hexdigest()[:10]
+    return base64.urlsafe_b64encode(f"{token}:{offset}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, version):
+    try:
+        token, offset = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':')
+        offset = int(offset)
+    except ValueError:
+        raise FormatError('无效的分页游标')
+
+    if offset < 0:
+        raise FormatError('无效的分页游标')
+
+    if token != hashlib.sha1(str(version).encode()).hexdigest()[:10]:
+        raise FormatError('结果已更新，分页游标已失效，请从第一页重新获取', status=409)
+    return offset
+
+def page_columns(source, columns, start, end):
+    """取出 [start, end) 行的各列，source可以是DataFrame或 列名 -> 列表 的字典；值转换为Python原生类型"""
+    if hasattr(source, 'iloc'):
+        page = source.iloc[start:end]
+        return {column: page[column].tolist() for column in columns}
+    return {column: list(source[column][start:end]) for column in columns}
+
+def encode_page(fmt, data, meta, nested):
+    """把一页数据编码为bytes；nested为True时数据放在data.stocks中，否则直接放在data中，分页信息与data并列"""
+    if fmt == 'arrow':
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise FormatError('服务器未安装pyarrow，无法输出Arrow格式', status=406)
+
+        table = pa.table(data).replace_schema_metadata({key: json.dumps(value) for key, value in meta.items()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    if fmt == 'json':
+        items = [dict(zip(data, row)) for row in zip(*data.values())]
+    else:
+        items = data
+        meta = {'columns': list(data), **meta}
+
+    payload = {'success': True, 'data': {'stocks': items, **meta}} if nested else {'success': True, 'data': items, **meta}
+
+    if fmt == 'msgpack':
+        try:
+            import msgpack
+        except ImportError:
+            raise FormatError('服务器未安装msgpack，无法输出msgpack格式', status=406)
+        return msgpack.packb(payload, use_bin_type=True)
+
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def paged_response(request, source, version, columns, nested=True):
+    """按请求协商的格式、分页和压缩方式返回source的一页
+
+    分页参数：cursor（上一页返回的next_cursor），或offset；limit（旧名称top_n）为每页行数，省略时返回剩余全部。
+    同一版本的同一页只编码和压缩一次，之后直接返回缓存的bytes。
+    version标识结果的内容，内容变化时必须改变，如任务ID或交易日。
+    """
+    fmt = negotiate_format(request)
+
+    cursor = request.args.get('cursor')
+    offset = decode_cursor(cursor, version) if cursor else max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        limit = request.args.get('top_n', type=int)
+    if limit is not None and limit <= 0:
+        raise FormatError('每页行数limit应为正整数')
+
+    total = len(source) if hasattr(source, 'iloc') else len(source[columns[0]])
+    start = min(offset, total)
+    end = min(start + limit, total) if limit else total
+    meta = {
+        'count': total,
+        'offset': start,
+        'has_more': end < total,
+        'next_cursor': encode_cursor(version, end) if end < total else None
+    }
+
+    key = (version, fmt, start, end, nested)
+    body = ENCODED_CACHE.get_or_encode(key, lambda: encode_page(fmt, page_columns(source, columns, start, end),
+                                                                meta, nested))
+
+    encoding = negotiate_encoding(request) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        body = ENCODED_CACHE.get_or_encode(key + (encoding,), lambda: compress(body, encoding))
+
+    response = Response(body, mimetype=FORMATS[fmt])
+    response.vary.update(['Accept', 'Accept-Encoding'])
+    response.headers['X-Total-Count'] = str(total)
+    if meta['next_cursor']:
+        response.headers['X-Next-Cursor'] = meta['next_cursor']
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
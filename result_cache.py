@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from compact import TickerTable, pack_results, unpack_results
+from config import RESULT_CACHE_SIZE
+from metrics import RESULT_CACHE_LOOKUPS
+
+class ScanResultCache:
+    """全市场扫描结果缓存
+
+    按 (最新交易日, 长期周期) 保存未按阈值筛选的全量结果，修改阈值或取前N只时直接在缓存上过滤。
+    出现新的交易日后，旧交易日的结果全部失效。结果以结构化数组保存，股票代码和名称只在共享的TickerTable中保存一份。
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (trade_date, long_period) -> 未筛选结果的结构化数组
+        self.tickers = TickerTable()
+        self.latest_date = None
+        self.lock = threading.Lock()
+
+    def get(self, trade_date, long_period):
+        """读取缓存的未筛选结果，未命中或无法确定交易日时返回None"""
+        if trade_date is None:
+            return None
+
+        with self.lock:
+            self._advance(trade_date)
+            packed = self.entries.get((trade_date, long_period))
+            if packed is not None:
+                self.entries.move_to_end((trade_date, long_period))
+
+        RESULT_CACHE_LOOKUPS.inc(result='miss' if packed is None else 'hit')
+        return unpack_results(packed, self.tickers) if packed is not None else None
+
+    def put(self, trade_date, long_period, df):
+        """保存未筛选结果，超过容量时淘汰最久未使用的条目；比已知最新交易日旧的结果不保存"""
+        if trade_date is None:
+            return
+
+        packed = pack_results(df, self.tickers)
+
+        with self.lock:
+            self._advance(trade_date)
+            if trade_date != self.latest_date:
+                return
+
+            self.entries[(trade_date, long_period)] = packed
+            self.entries.move_to_end((trade_date, long_period))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def has(self, trade_date, long_period):
+        """是否已缓存该交易日、该长期周期的结果，不计入命中统计"""
+        with self.lock:
+            return (trade_date, long_period) in self.entries
+
+    def latest(self):
+        """最新交易日和该交易日已缓存的全部结果：(trade_date, {长期周期: DataFrame})"""
+        with self.lock:
+            entries = {long_period: packed for (trade_date, long_period), packed in self.entries.items()
+                       if trade_date == self.latest_date}
+            latest_date = self.latest_date
+        return latest_date, {long_period: unpack_results(packed, self.tickers) for long_period, packed in entries.items()}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _advance(self, trade_date):
+        """遇到更新的交易日时清除旧结果"""
+        if self.latest_date is None or trade_date > self.latest_date:
+            self.latest_date = trade_date
+            self.entries.clear()
@@ -35,7 +35,11 @@ def start_server():
 
     try:
         # 导入并运行Flask应用
-        from app import app
+        from app import app, warm_start
+        from config import FAST_STARTUP
+
+        if FAST_STARTUP:
+            warm_start()
 
         # 自动打开浏览器
         print("服务器将在 http://localhost:5000 启动")
@@ -0,0 +1,110 @@
+import glob
+import json
+import os
+import threading
+from collections import defaultdict
+from config import SCAN_CHECKPOINT_DIR, SCAN_CHECKPOINT_BATCH
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows上只在进程内加锁
+
+# 断点文件名：交易日和长期周期确定一次扫描，换了交易日的断点不再使用
+CHECKPOINT_PATTERN = 'scan_{trade_date}_{long_period}.jsonl'
+
+# 覆盖率报告中最多列出的失败股票数量
+MAX_REPORTED_FAILURES = 50
+
+# 同一断点文件的写入锁：不同阈值的任务可能同时扫描同一个（交易日, 长期周期），整行写入才不会交错
+_FILE_LOCKS = defaultdict(threading.Lock)
+
+class ScanCheckpoint:
+    """逐只扫描的断点
+
+    已完成的股票（包括数据不足、没有结果的）和它们的结果先暂存在内存中，每满batch_size只
+    作为一行JSON追加到断点文件，只产生这一批的磁盘I/O。追加时对文件加锁，同时扫描同一断点的任务整行写入；
+    进程中途退出时最后一行可能不完整，读取时跳过无法解析的行。
+    获取失败的股票不计入已完成，恢复时会重新获取。path为None时只在内存中记录，不写文件。
+    """
+
+    def __init__(self, path=None, batch_size=SCAN_CHECKPOINT_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self.results = {}  # ts_code -> 结果字典，数据不足的股票为None
+        self.pending = {}  # 尚未写入文件的已完成股票
+
+    @classmethod
+    def open(cls, trade_date, long_period, root=SCAN_CHECKPOINT_DIR, resume=True, batch_size=SCAN_CHECKPOINT_BATCH):
+        """打开（交易日, 长期周期）的断点，resume为False时丢弃已有的断点从头开始；同时删除之前交易日的断点
+
+        trade_date为None（交易日历获取失败）时无法判断哪些断点已过期，不删除任何断点。
+        """
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, CHECKPOINT_PATTERN.format(trade_date=trade_date, long_period=long_period))
+
+        if trade_date is not None:
+            for old_path in glob.glob(os.path.join(root, CHECKPOINT_PATTERN.format(trade_date='*', long_period='*'))):
+                if os.path.basename(old_path).split('_')[1] < str(trade_date):
+                    os.remove(old_path)
+
+        checkpoint = cls(path, batch_size)
+        if not resume:
+            if os.path.exists(path):
+                os.remove(path)
+            return checkpoint
+
+        line = ''
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        checkpoint.results.update(json.loads(line))
+                    except ValueError:
+                        continue  # 中断时未写完的一批
+
+            if line and not line.endswith('\n'):
+                # 补上换行，之后追加的批次不会接在未写完的行后面一起无法解析
+                with _FILE_LOCKS[path], open(path, 'a', encoding='utf-8') as f:
+                    f.write('\n')
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"读取扫描断点失败: {e}")
+        return checkpoint
+
+    def __contains__(self, ts_code):
+        return ts_code in self.results
+
+    def add(self, ts_code, result):
+        """记录一只已完成的股票，攒满一批后写入文件"""
+        self.results[ts_code] = result
+        self.pending[ts_code] = result
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.path is not None:
+            line = json.dumps(self.pending, ensure_ascii=False) + '\n'
+            with _FILE_LOCKS[self.path], open(self.path, 'a', encoding='utf-8') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)  # 其他进程（如另一个服务实例）同时追加同一个文件
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending = {}
+
+def coverage_report(total, failed, resumed=0, retried=0):
+    """扫描覆盖率：已完成（成功获取数据，包括数据不足的）股票占全部股票的比例，以及仍然失败的股票"""
+    failed = sorted(failed)
+    return {
+        'total': total,
+        'scanned': total - len(failed),
+        'coverage': (total - len(failed)) / total * 100 if total else 100.0,
+        'resumed': resumed,
+        'retried': retried,
+        'failed_count': len(failed),
+        'failed': failed[:MAX_REPORTED_FAILURES]
+    }
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from config import SCHEDULE_TIME, SCHEDULE_LONG_PERIODS, SCHEDULE_RETRY_INTERVAL, SCHEDULE_MAX_RETRIES
+from metrics import SCHEDULED_RUN_SECONDS
+
+class DailyScheduler:
+    """收盘后定时预计算全市场扫描结果
+
+    每天run_time检查交易日历：当天是交易日且结果尚未发布时，只下载新交易日的行情，
+    按long_periods一次算出各周期的未筛选结果并写入结果缓存（同时更新启动快照），
+    之后的筛选请求直接在缓存上过滤，请求路径上不再扫描。
+    失败时（如当天行情尚未发布）每隔retry_interval秒重试，最多max_retries次；
+    启动时已过当天的运行时间则立即补跑一次。每次运行的结果和耗时保存在history中。
+    """
+
+    def __init__(self, analyzer, run_time=SCHEDULE_TIME, long_periods=SCHEDULE_LONG_PERIODS,
+                 retry_interval=SCHEDULE_RETRY_INTERVAL, max_retries=SCHEDULE_MAX_RETRIES, history_size=30):
+        self.analyzer = analyzer
+        self.run_time = run_time
+        self.long_periods = sorted(set(long_periods))
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.history = deque(maxlen=history_size)  # 最近的运行记录，最新的在最后
+        self.next_run = None
+        self.retries = 0
+        self.running = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def scheduled_time(self, now):
+        """now之后的下一个计划运行时间"""
+        hour, minute = map(int, self.run_time.split(':'))
+        run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+
+    def start(self):
+        """启动调度线程，已启动时不重复启动"""
+        with self.lock:
+            if self.thread is not None:
+                return
+
+            now = datetime.now()
+            # 当天的运行时间已过时立即补跑，结果已发布的话只检查一次交易日历
+            next_run = self.scheduled_time(now)
+            self.next_run = now if next_run.date() > now.date() else next_run
+            self.thread = threading.Thread(target=self._loop, name='daily-scheduler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            delay = (self.next_run - datetime.now()).total_seconds()
+            if delay > 0:
+                # 分段等待，系统时间调整或休眠唤醒后也能按时运行
+                self.stop_event.wait(min(delay, 60))
+                continue
+
+            self.run_once()
+
+    def run_once(self):
+        """执行一次预计算并安排下一次运行，返回本次的运行记录"""
+        record = {'started_at': datetime.now().isoformat(timespec='seconds'), 'attempt': self.retries + 1,
+                  'trade_date': None}
+        self.running = True
+        start = time.perf_counter()
+
+        try:
+            record['trade_date'], record['status'] = self.publish()
+        except Exception as e:
+            print(f"收盘后预计算失败: {e}")
+            record['status'] = 'error'
+            record['error'] = str(e)
+        finally:
+            self.running = False
+
+        record['duration'] = time.perf_counter() - start
+        SCHEDULED_RUN_SECONDS.observe(record['duration'], status=record['status'])
+
+        now = datetime.now()
+        with self.lock:
+            self.history.append(record)
+            if record['status'] == 'error' and self.retries < self.max_retries:
+                self.retries += 1
+                self.next_run = now + timedelta(seconds=self.retry_interval)
+            else:
+                self.retries = 0
+                self.next_run = self.scheduled_time(now)
+
+        return record
+
+    def publish(self):
+        """检查交易日历并计算最新交易日的结果，返回 (交易日, 'published'或'skipped')"""
+        fetcher = self.analyzer.fetcher
+        trade_date = fetcher.get_calendar_trade_date()
+        if trade_date is None:
+            raise RuntimeError('无法获取交易日历')
+
+        result_cache = self.analyzer.result_cache
+        if all(result_cache.has(trade_date, long_period) for long_period in self.long_periods):
+            return trade_date, 'skipped'
+
+        # 只下载本地存储中缺失的交易日
+        fetcher.sync_store(force=True)
+        latest = fetcher.get_latest_trade_date()
+        if latest != trade_date:
+            raise RuntimeError(f"{trade_date} 的行情尚未发布（当前最新 {latest}）")
+
+        print(f"开始预计算 {trade_date} 的扫描结果，长期周期 {self.long_periods}")
+        _, coverage = self.analyzer.sweep(self.long_periods, [])
+
+        # 获取失败的交易日或股票会让结果不完整，抛出异常以便按重试间隔重新预计算
+        if coverage['scanned'] == 0 or coverage['failed_count']:
+            raise RuntimeError(f"{trade_date} 只获取到 {coverage['scanned']}/{coverage['total']} 只股票的数据")
+        if not all(result_cache.has(trade_date, long_period) for long_period in self.long_periods):
+            raise RuntimeError(f"{trade_date} 的扫描结果不完整")
+        return trade_date, 'published'
+
+    def status(self):
+        """调度状态，用于/api/scheduler接口"""
+        with self.lock:
+            return {
+                'run_time': self.run_time,
+                'long_periods': self.long_periods,
+                'running': self.running,
+                'next_run': self.next_run.isoformat(timespec='seconds') if self.next_run else None,
+                'retries': self.retries,
+                'history': list(self.history)
+            }
@@ -0,0 +1,42 @@
+import json
+import os
+import time
+from config import SNAPSHOT_DIR
+
+# 启动快照只依赖标准库，读取时不需要加载pandas和tushare
+SNAPSHOT_FILE = 'snapshot.json'
+
+def save_snapshot(stock_list, trade_date, results, root=SNAPSHOT_DIR):
+    """保存股票列表和最新交易日的全市场扫描结果
+
+    stock_list和results中的每项都是 列名 -> 值列表 的列式字典，results按长期周期分组。
+    先写临时文件再替换，中断时不会留下不完整的快照。
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, SNAPSHOT_FILE)
+    data = {
+        'saved_at': time.time(),
+        'trade_date': trade_date,
+        'stock_list': stock_list,
+        'results': {str(long_period): columns for long_period, columns in results.items()}
+    }
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_snapshot(root=SNAPSHOT_DIR):
+    """读取上次保存的快照，不存在或损坏时返回None；results的键转换回整数长期周期"""
+    path = os.path.join(root, SNAPSHOT_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"读取启动快照失败: {e}")
+        return None
+
+    data['results'] = {int(long_period): columns for long_period, columns in data.get('results', {}).items()}
+    return data
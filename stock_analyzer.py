@@ -1,129 +1,687 @@
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict
+import numpy as np
 import pandas as pd
 from stock_data import StockDataFetcher
+from async_fetcher import AsyncStockDataFetcher
+from config import (USE_PANEL_FETCH, USE_ASYNC_FETCH, USE_INCREMENTAL_SCAN, MA_STATE_DIR, SCAN_WORKERS,
+                    PARALLEL_SCAN_MIN_STOCKS, CHART_DAYS, CHART_MA_PERIODS, CHART_CACHE_MAX_BYTES, SCAN_RETRY_ROUNDS,
+                    SCAN_RETRY_BACKOFF)
+from data_cache import DataCache
+from fetch_pool import retry_delay
+from indicators import IndicatorEngine, required_history, required_inputs, series_indicators
+from ma_engine import compute_ma_diff, compute_ma_diff_multi, compute_single_ma_diff, right_align
+from ma_state import RollingMAState
+from metrics import timed_phase
+from parallel_scan import parallel_ma_diff
+from result_cache import ScanResultCache
+from scan_checkpoint import ScanCheckpoint, coverage_report
+from snapshot import save_snapshot
+from top_k import top_k_rows
+
+# 筛选结果保留的列
+RESULT_COLUMNS = ['ts_code', 'name', 'diff_percent', 'latest_close', 'long_mean', 'latest_ma5']
 
 class StockAnalyzer:
     """股票分析器"""
 
-    def __init__(self, fetcher=None):
+    def __init__(self, fetcher=None, state_dir=MA_STATE_DIR, scan_workers=SCAN_WORKERS, snapshot_dir=None,
+                 checkpoint_dir=None):
         self.fetcher = fetcher or StockDataFetcher()
+        self.state_dir = state_dir  # 增量扫描的均线状态保存目录
+        self.snapshot_dir = snapshot_dir  # 启动快照目录，全市场扫描后写入；为None时不保存
+        self.checkpoint_dir = checkpoint_dir  # 逐只扫描的断点目录；为None时只在内存中记录，不能跨进程恢复
+        self.retry_rounds = SCAN_RETRY_ROUNDS  # 逐只扫描结束后重新获取失败股票的最多轮数
+        self.retry_backoff = SCAN_RETRY_BACKOFF  # 重试轮之间的基础等待时间（秒）
+        # 均线计算的进程数，不超过CPU核数；只有一个核时直接在当前进程串行计算，省去进程间通信的开销
+        self.scan_workers = min(scan_workers, os.cpu_count() or 1)
+        self.state_locks = defaultdict(threading.Lock)
+        self.result_cache = ScanResultCache()  # 按（最新交易日, 长期周期）缓存的全市场未筛选结果
+        self.chart_cache = DataCache(max_bytes=CHART_CACHE_MAX_BYTES)  # 按（股票, 最新交易日, 天数）缓存的图表数据
 
     def calculate_ma_diff(self, ts_code, long_period=20):
         """计算单只股票的均线差异"""
         try:
             # 获取最近足够多的数据
             days_needed = long_period + 10  # 确保有足够数据计算均线
-            df = self.fetcher.get_recent_data(ts_code, days_needed)
+            closes = self.fetcher.get_recent_closes(ts_code, days_needed)
 
-            if df.empty or len(df) < long_period:
+            if len(closes) == 0:
                 return None
 
-            # 计算长期均值（最近long_period天的平均值）
-            recent_data = df.tail(long_period)
-            long_mean = recent_data['close'].mean()
-
-            # 获取最新的短期均值（5日均线）
-            latest_ma5 = recent_data['ma5'].iloc[-1]
-
-            # 计算差异百分比
-            diff_percent = ((latest_ma5 - long_mean) / long_mean) * 100
+            # 长期均值为最近long_period天收盘价的平均值，短期均值为最新的5日均线
+            result = compute_single_ma_diff(closes, long_period)
+            if result is None:
+                return None
 
-            return {
-                'ts_code': ts_code,
-                'long_mean': long_mean,
-                'latest_ma5': latest_ma5,
-                'diff_percent': diff_percent,
-                'latest_close': recent_data['close'].iloc[-1]
-            }
+            return {'ts_code': ts_code, **result}
         except Exception as e:
             print(f"分析股票{ts_code}失败: {e}")
             return None
 
-    def analyze_stocks(self, stock_list=None, long_period=20, diff_threshold=5):
-        """批量分析股票"""
-        if stock_list is None:
-            stock_list = self.fetcher.get_stock_list()
+    def should_use_panel(self, stock_list, long_period=20):
+        """判断按交易日批量获取是否比逐只获取更省API调用"""
+        # 面板模式每个交易日需要daily和adj_factor两次调用，另加一次交易日历
+        panel_calls = 2 * (long_period + 11) + 1
+        return USE_PANEL_FETCH and len(stock_list) > panel_calls
 
-        if stock_list.empty:
-            return pd.DataFrame()
+    def analyze_panel(self, stock_list, long_period=20, progress_callback=None, refresh=False):
+        """基于全市场面板批量计算均线差异，返回未筛选的DataFrame
+
+        df.attrs['last_date']为面板的最后一个交易日，面板获取失败时为None。refresh见get_panel。
+        """
+        days = long_period + 10
+        with timed_phase('fetch', rows=len(stock_list)):
+            panel = self.fetcher.get_panel(days, progress_callback=progress_callback, refresh=refresh)
+
+        if panel is None:
+            close = right_align([[] for _ in range(len(stock_list))], days)
+        else:
+            close = panel.select(stock_list['ts_code'])
+
+        df = self.build_results(stock_list, close, long_period)
+        df.attrs['last_date'] = str(panel.dates[-1]) if panel is not None else None
+        return df
+
+    def load_closes(self, stock_list, days, use_panel=True, progress_callback=None):
+        """获取 行=交易日、列=stock_list顺序 的前复权收盘价数组，停牌日或缺失数据为NaN，返回 (数组, 获取失败的股票)
+
+        use_panel为True时按交易日批量获取全市场面板，否则在线程池中并发逐只获取，
+        逐只获取的各股票数据按最近交易日右对齐。面板获取失败或没有覆盖到最新交易日时全部股票计为失败，
+        逐只获取时只有获取出错的股票计为失败（没有数据的股票不算）。
+        """
+        if use_panel:
+            panel = self.fetcher.get_panel(days, progress_callback=progress_callback)
+            if panel is None:
+                return right_align([[] for _ in range(len(stock_list))], days), stock_list['ts_code'].tolist()
+
+            trade_date = self.fetcher.get_latest_trade_date()
+            stale = trade_date is not None and str(panel.dates[-1]) < trade_date
+
+            # 面板中没有的股票整列为NaN，计算结果同样为NaN
+            return panel.select(stock_list['ts_code']), stock_list['ts_code'].tolist() if stale else []
 
-        results = []
         total = len(stock_list)
+        ts_codes = stock_list['ts_code'].tolist()
+        position = {ts_code: i for i, ts_code in enumerate(ts_codes)}
+        closes = [[] for _ in ts_codes]
+        failed = []
+
+        # 并发获取，进度按已完成的股票数量计算
+        fetched = self.fetcher.fetch_many(self.try_recent_closes, ts_codes, days)
+        for done, (ts_code, (data, error)) in enumerate(fetched, 1):
+            closes[position[ts_code]] = data
+            if error is not None:
+                failed.append(ts_code)
+
+            if done % 10 == 0:
+                print(f"已分析 {done}/{total} 只股票")
+
+            if progress_callback:
+                progress_callback(done, total)
+
+        return right_align(closes, days), failed
+
+    def analyze_incremental(self, stock_list, long_period=20):
+        """用持久化的均线状态增量计算全市场均线差异，返回未筛选的DataFrame，df.attrs['last_date']为状态的最新交易日
+
+        状态记录了上次处理到的交易日，之后每次只需把新交易日的截面喂给状态，
+        每只股票的更新是常数时间；首次运行时用最近long_period+10个交易日建立状态。
+        获取某个交易日的截面失败时，先保存已处理的交易日再抛出异常，下次从失败的交易日继续。
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = os.path.join(self.state_dir, f"ma_state_{long_period}.npz")
+
+        with self.state_locks[path]:
+            state = RollingMAState.load(path) or RollingMAState(long_period)
+
+            updated = 0
+            try:
+                for trade_date, section in self.fetcher.iter_cross_sections(state.last_date, long_period + 10):
+                    if state.update(trade_date, section):
+                        updated += 1
+            finally:
+                if updated:
+                    state.save(path)
+                    print(f"均线状态已更新 {updated} 个交易日，最新交易日 {state.last_date}")
+
+            results = state.results()
+            last_date = state.last_date
+
+        df = stock_list[['ts_code', 'name']].merge(results, on='ts_code')
+        df.attrs['last_date'] = last_date
+        return df
+
+    def build_results(self, stock_list, close, long_period=20):
+        """用向量化引擎计算 行=交易日、列=stock_list顺序 的收盘价数组，去掉数据不足的股票
+
+        股票数量较多且配置了多个进程时，按股票分片到进程池并行计算，
+        此时df.attrs['top_k']为各分片合并出的差异最大的前K只股票代码，按排名排列。
+        """
+        top = None
+        with timed_phase('compute', rows=close.shape[1]):
+            if self.scan_workers > 1 and close.shape[1] >= PARALLEL_SCAN_MIN_STOCKS:
+                metrics, top = parallel_ma_diff(close, long_period, self.scan_workers)
+            else:
+                metrics = compute_ma_diff(close, long_period)
+
+        ts_codes = stock_list['ts_code'].to_numpy()
+        df = pd.DataFrame({
+            'ts_code': ts_codes,
+            'name': stock_list['name'].to_numpy(),
+            **metrics
+        })
+
+        df = df[df['diff_percent'].notna()].reset_index(drop=True)
+        if top is not None:
+            df.attrs['top_k'] = ts_codes[top].tolist()
+        return df
 
-        print(f"开始分析 {total} 只股票...")
+    def try_recent_closes(self, ts_code, days):
+        """获取单只股票最近days天的收盘价，返回 (收盘价数组, 错误)：获取失败时数组为空、错误为异常对象"""
+        try:
+            bars = self.fetcher.load_recent_bars(ts_code, days)
+        except Exception as e:
+            print(f"获取股票{ts_code}数据失败: {e}")
+            return np.empty(0), e
+
+        return (bars.closes() if bars is not None else np.empty(0)), None
+
+    def try_ma_diff(self, ts_code, long_period=20):
+        """计算单只股票的均线差异，返回 (结果, 错误)：数据不足时结果为None，获取失败时错误为异常对象"""
+        try:
+            bars = self.fetcher.load_recent_bars(ts_code, long_period + 10)
+        except Exception as e:
+            print(f"获取股票{ts_code}数据失败: {e}")
+            return None, e
 
-        for i, (_, stock) in enumerate(stock_list.iterrows()):
-            ts_code = stock['ts_code']
-            name = stock['name']
+        result = compute_single_ma_diff(bars.closes(), long_period) if bars is not None else None
+        return result, None
 
-            if (i + 1) % 10 == 0:
-                print(f"已分析 {i + 1}/{total} 只股票")
+    def scan_each(self, stock_list, long_period, handle, progress_callback=None):
+        """逐只获取并计算，每只股票完成时调用 handle(ts_code, 结果, 错误)，结果中包含ts_code和name"""
+        if USE_ASYNC_FETCH:
+            # 异步流水线：有界并发获取，每只股票的数据一到就计算
+            async_fetcher = AsyncStockDataFetcher.from_fetcher(self.fetcher)
 
-            result = self.calculate_ma_diff(ts_code, long_period)
+            async def run():
+                async for done, total, ts_code, result, error in async_fetcher.scan(stock_list, long_period):
+                    handle(ts_code, result, error)
+                    if progress_callback:
+                        progress_callback(done, total)
 
-            if result:
-                result['name'] = name
-                results.append(result)
+            asyncio.run(run())
+            return
 
-        # 转换为DataFrame
-        df = pd.DataFrame(results)
+        names = dict(zip(stock_list['ts_code'], stock_list['name']))
+        fetched = self.fetcher.fetch_many(self.try_ma_diff, list(names), long_period)
+        for done, (ts_code, (result, error)) in enumerate(fetched, 1):
+            handle(ts_code, {'ts_code': ts_code, 'name': names[ts_code], **result} if result else None, error)
 
+            if done % 10 == 0:
+                print(f"已分析 {done}/{len(names)} 只股票")
+
+            if progress_callback:
+                progress_callback(done, len(names))
+
+    def scan_tickers(self, stock_list, long_period=20, progress_callback=None, result_callback=None, resume=True):
+        """逐只扫描全部股票，返回未筛选的DataFrame，df.attrs['coverage']为覆盖率报告
+
+        已完成的股票分批写入（最新交易日, 长期周期）的断点，任务出错、进程重启后再次扫描时从断点继续，
+        只获取剩下的股票；resume为False时从头扫描。获取失败的股票不会当作没有数据丢掉，而是放进重试队列，
+        主扫描结束后按退避间隔最多重试retry_rounds轮；仍然失败的列在覆盖率报告中，下次扫描时再获取。
+        """
+        total = len(stock_list)
+        if self.checkpoint_dir is not None:
+            checkpoint = ScanCheckpoint.open(self.fetcher.get_latest_trade_date(), long_period, self.checkpoint_dir,
+                                             resume)
+        else:
+            checkpoint = ScanCheckpoint()
+
+        finished = stock_list['ts_code'].isin(list(checkpoint.results)).to_numpy()
+        pending = stock_list[~finished]
+        resumed = total - len(pending)
+        if resumed:
+            print(f"从断点恢复 {resumed} 只股票，还需扫描 {len(pending)} 只")
+            if result_callback:
+                for ts_code in stock_list['ts_code'][finished]:
+                    if checkpoint.results[ts_code]:
+                        result_callback(checkpoint.results[ts_code])
+
+        failed = {}  # 重试队列：ts_code -> 最近一次的错误
+        retried = set()
+
+        def handle(ts_code, result, error):
+            if error is not None:
+                failed[ts_code] = error
+                return
+            failed.pop(ts_code, None)
+            checkpoint.add(ts_code, result)
+            if result and result_callback:
+                result_callback(result)
+
+        def update_progress(done, _):
+            if progress_callback:
+                progress_callback(resumed + done, total)
+
+        try:
+            self.scan_each(pending, long_period, handle, update_progress)
+            if progress_callback and pending.empty:
+                progress_callback(total, total)
+
+            for attempt in range(self.retry_rounds):
+                if not failed:
+                    break
+                delay = retry_delay(attempt, self.retry_backoff)
+                print(f"{len(failed)} 只股票获取失败，{delay:.1f}秒后第{attempt + 1}次重试")
+                time.sleep(delay)
+
+                retried.update(failed)
+                self.scan_each(stock_list[stock_list['ts_code'].isin(list(failed))], long_period, handle)
+        finally:
+            checkpoint.flush()
+
+        records = [checkpoint.results.get(ts_code) for ts_code in stock_list['ts_code']]
+        df = pd.DataFrame({
+            'ts_code': stock_list['ts_code'].to_numpy(),
+            'name': stock_list['name'].to_numpy(),
+            **{name: [record[name] if record else np.nan for record in records]
+               for name in ['long_mean', 'latest_ma5', 'diff_percent', 'latest_close']}
+        })
+        df = df[df['diff_percent'].notna()].reset_index(drop=True)
+
+        df.attrs['coverage'] = coverage_report(total, failed, resumed, len(retried))
+        if failed:
+            print(f"扫描覆盖率 {df.attrs['coverage']['coverage']:.1f}%，{len(failed)} 只股票获取失败")
+        return df
+
+    def scan_stocks(self, stock_list, long_period=20, use_panel=None, progress_callback=None,
+                    result_callback=None, resume=True):
+        """计算每只股票的均线差异，返回未按阈值筛选的DataFrame，df.attrs['coverage']为覆盖率报告
+
+        use_panel为None时自动选择：股票数量较多时按交易日批量获取全市场数据（按交易日断点和重试，见scan_panel），
+        否则逐只获取日线数据（可断点续扫，见scan_tickers，resume为False时从头扫描）。
+        progress_callback(done, total) 按已完成的工作量汇报进度；
+        result_callback(record) 在每只股票的结果算出后调用，逐只获取时结果一到就推送，
+        批量计算时在计算完成后逐条推送。
+        """
+        if use_panel is None:
+            use_panel = self.should_use_panel(stock_list, long_period)
+
+        total = len(stock_list)
+
+        with timed_phase('scan', rows=total):
+            if not use_panel:
+                with timed_phase('stream', rows=total):
+                    return self.scan_tickers(stock_list, long_period, progress_callback, result_callback, resume)
+
+            df = self.scan_panel(stock_list, long_period, progress_callback)
+
+        if result_callback:
+            for record in df.to_dict('records'):
+                result_callback(record)
+
+        return df
+
+    def scan_panel(self, stock_list, long_period=20, progress_callback=None):
+        """按交易日批量扫描全部股票，返回未筛选的DataFrame，df.attrs['coverage']为覆盖率报告
+
+        按交易日获取的数据以交易日为断点：本地存储逐日追加，均线状态保存到已处理的最后一个交易日，
+        不使用本地存储时已获取的截面留在缓存中，重试或任务重启后只获取缺少的交易日。
+        获取出错或数据没有覆盖到最新交易日时，按退避间隔最多重试retry_rounds轮；仍不完整时无法确定
+        哪些股票的结果是最新的，全部股票计为失败，结果不缓存，下次扫描时再获取。
+        """
+        total = len(stock_list)
+        trade_date = self.fetcher.get_latest_trade_date()
+        df = None
+        last_date = None
+
+        for attempt in range(self.retry_rounds + 1):
+            if attempt:
+                delay = retry_delay(attempt - 1, self.retry_backoff)
+                print(f"按交易日获取的数据不完整，{delay:.1f}秒后第{attempt}次重试")
+                time.sleep(delay)
+
+            try:
+                if USE_INCREMENTAL_SCAN:
+                    # 只把上次扫描之后的新交易日喂给持久化的均线状态
+                    with timed_phase('incremental', rows=total):
+                        df = self.analyze_incremental(stock_list, long_period)
+                    if progress_callback:
+                        progress_callback(total, total)
+                else:
+                    df = self.analyze_panel(stock_list, long_period, progress_callback, refresh=attempt > 0)
+            except Exception as e:
+                print(f"按交易日扫描失败: {e}")
+                continue
+
+            last_date = df.attrs.get('last_date')
+            if last_date is not None and (trade_date is None or last_date >= trade_date):
+                df.attrs['coverage'] = coverage_report(total, [], retried=total if attempt else 0)
+                return df
+
+        if df is None:
+            df = self.build_results(stock_list, right_align([[] for _ in range(total)], long_period + 10),
+                                    long_period)
+        failed = stock_list['ts_code'].tolist()
+        df.attrs['coverage'] = coverage_report(total, failed, retried=total if self.retry_rounds else 0)
+        print(f"扫描覆盖率 0.0%，数据只到 {last_date}，最新交易日 {trade_date}")
+        return df
+
+    def filter_results(self, df, diff_threshold=5, limit=None, offset=0, columns=RESULT_COLUMNS):
+        """按差异阈值筛选，并按差异百分比绝对值从大到小排序
+
+        指定limit时只返回排名从offset开始的limit只，用部分选择代替全量排序；
+        多进程扫描已合并出前K名（df.attrs['top_k']）且够用时直接从中取，不再扫描全部结果。
+        """
         if df.empty:
             return df
 
-        # 筛选差异大于阈值的股票
-        df = df[df['diff_percent'].abs() > diff_threshold]
+        with timed_phase('filter', rows=len(df)):
+            ranked = self.ranked_rows(df, diff_threshold, limit, offset) if limit is not None else None
+            if ranked is not None:
+                df = ranked
+            else:
+                # 筛选差异大于阈值的股票
+                df = df[df['diff_percent'].abs() > diff_threshold]
 
-        # 按差异百分比绝对值从大到小排序
-        df = df.sort_values('diff_percent', key=lambda x: x.abs(), ascending=False)
+                # 按差异百分比绝对值从大到小排序
+                if limit is None:
+                    df = df.sort_values('diff_percent', key=lambda x: x.abs(), ascending=False).iloc[offset:]
+                else:
+                    df = top_k_rows(df, limit, offset)
 
         # 保留需要的列并排序
-        df = df[['ts_code', 'name', 'diff_percent', 'latest_close', 'long_mean', 'latest_ma5']]
+        return df[columns]
+
+    @staticmethod
+    def ranked_rows(df, diff_threshold, limit, offset=0):
+        """从扫描时合并出的前K名中取排名从offset开始、差异大于阈值的limit只，前K名不够用时返回None"""
+        top = df.attrs.get('top_k')
+        if top is None or not df['ts_code'].is_unique:
+            return None
 
-        print(f"分析完成，找到 {len(df)} 只符合条件的股票")
+        positions = pd.Index(df['ts_code']).get_indexer(top)
+        if (positions < 0).any():
+            return None  # 不是扫描得到的那份结果
+
+        ranked = df.iloc[positions]
+        ranked = ranked[ranked['diff_percent'].abs() > diff_threshold]
+        # 前K名中有未超过阈值的股票时，超过阈值的股票都在前K名之中
+        if offset + limit <= len(ranked) or len(ranked) < len(top):
+            return ranked.iloc[offset:offset + limit]
+        return None
+
+    def analyze_stocks(self, stock_list=None, long_period=20, diff_threshold=5, use_panel=None,
+                       progress_callback=None):
+        """批量分析股票
+
+        use_panel和progress_callback的含义见scan_stocks。
+        """
+        if stock_list is None:
+            stock_list = self.fetcher.get_stock_list()
+
+        if stock_list.empty:
+            return pd.DataFrame()
+
+        print(f"开始分析 {len(stock_list)} 只股票...")
+
+        df = self.filter_results(self.scan_stocks(stock_list, long_period, use_panel, progress_callback),
+                                 diff_threshold)
+
+        if not df.empty:
+            print(f"分析完成，找到 {len(df)} 只符合条件的股票")
 
         return df
 
-    def get_stock_details(self, ts_code, days=60):
-        """获取股票详细数据（用于绘制图表）"""
-        try:
-            df = self.fetcher.get_recent_data(ts_code, days)
+    def get_cached_results(self, long_period=20, diff_threshold=5, limit=None, offset=0):
+        """从结果缓存读取当前交易日的全市场扫描结果并按阈值筛选，未命中时返回None"""
+        scanned = self.result_cache.get(self.fetcher.get_latest_trade_date(), long_period)
+        if scanned is None:
+            return None
 
-            if df.empty:
-                return None
+        return self.filter_results(scanned, diff_threshold, limit, offset)
+
+    def analyze_market(self, long_period=20, diff_threshold=5, limit=None, offset=0, progress_callback=None,
+                       result_callback=None, refresh=False):
+        """全市场扫描，同一交易日、同一长期周期只计算一次，之后只在缓存结果上筛选
+
+        limit和offset见filter_results，result_callback见scan_stocks，命中结果缓存时不调用。
+        refresh为True时忽略已缓存的结果重新扫描。
+        """
+        trade_date = self.fetcher.get_latest_trade_date()
+        scanned = None if refresh else self.result_cache.get(trade_date, long_period)
+
+        if scanned is None:
+            stock_list = self.fetcher.get_stock_list()
+            if stock_list.empty:
+                return pd.DataFrame()
+
+            # 扫描前等待本地存储补齐，结果按同步后的最新交易日缓存
+            self.fetcher.sync_store()
+            trade_date = self.fetcher.get_latest_trade_date()
+
+            print(f"开始分析 {len(stock_list)} 只股票...")
+            scanned = self.scan_stocks(stock_list, long_period, progress_callback=progress_callback,
+                                       result_callback=result_callback, resume=not refresh)
+
+            # 有股票获取失败的结果不缓存，下次请求时从断点只重新获取这些股票
+            if not scanned.attrs['coverage']['failed_count']:
+                self.result_cache.put(trade_date, long_period, scanned)
+                self.save_snapshot()
+        elif progress_callback:
+            progress_callback(1, 1)
+
+        return self.filter_results(scanned, diff_threshold, limit, offset)
+
+    def sweep(self, long_periods, diff_thresholds, stock_list=None, progress_callback=None):
+        """一次扫描计算多组 长期周期 × 差异阈值 的筛选结果
+
+        只按最长的周期获取一次数据，所有周期的均线差异由同一份累计和一次算出，
+        阈值只是对未筛选结果的过滤。返回 (组合列表, 覆盖率报告)，组合列表每个组合一项：
+        {'long_period', 'diff_threshold', 'results': 筛选后的DataFrame}。
+        全市场扫描只有在全部股票都获取成功时才写入结果缓存和启动快照，与analyze_market一致。
+        """
+        # 全市场扫描的结果同时写入结果缓存，之后的单组查询可以直接命中；扫描前等待本地存储补齐
+        if stock_list is None:
+            self.fetcher.sync_store()
+        trade_date = self.fetcher.get_latest_trade_date() if stock_list is None else None
+
+        if stock_list is None:
+            stock_list = self.fetcher.get_stock_list()
+
+        if stock_list.empty:
+            return [], coverage_report(0, [])
+
+        long_periods = sorted(set(long_periods))
+        days_needed = max(long_periods) + 10
+        use_panel = self.should_use_panel(stock_list, max(long_periods))
+
+        print(f"开始参数扫描：{len(stock_list)} 只股票，周期 {long_periods}，阈值 {list(diff_thresholds)}")
+
+        close, failed = self.load_closes(stock_list, days_needed, use_panel, progress_callback)
+        # 每个周期只看最近 周期+10 天，与analyze_market的口径一致，结果才能共用结果缓存
+        metrics = compute_ma_diff_multi(close, long_periods, extra_days=10)
+
+        coverage = coverage_report(len(stock_list), failed)
+        complete = trade_date is not None and not failed
+        if failed:
+            print(f"扫描覆盖率 {coverage['coverage']:.1f}%，{len(failed)} 只股票获取失败，结果不写入缓存")
+
+        combinations = []
+        for long_period in long_periods:
+            df = pd.DataFrame({
+                'ts_code': stock_list['ts_code'].to_numpy(),
+                'name': stock_list['name'].to_numpy(),
+                **metrics[long_period]
+            })
+            df = df[df['diff_percent'].notna()].reset_index(drop=True)
+            df.attrs['coverage'] = coverage
+            if complete:
+                self.result_cache.put(trade_date, long_period, df)
+
+            for diff_threshold in diff_thresholds:
+                combinations.append({
+                    'long_period': long_period,
+                    'diff_threshold': diff_threshold,
+                    'results': self.filter_results(df, diff_threshold)
+                })
+
+        if complete:
+            self.save_snapshot()
+
+        return combinations, coverage
+
+    def screen_indicators(self, pairs, diff_thresholds, stock_list=None, progress_callback=None):
+        """按任意两个指标在最新交易日的差异筛选，如 ('ema_12', 'sma_60')、('sma_5', 'boll_upper')
+
+        差异百分比 = (第一个指标 - 第二个指标) / 第二个指标 × 100。所有指标在同一份面板上
+        一次向量化算出，共享累计和等中间量，不需要每个指标单独扫描一遍。
+        用到成交量指标（如vol_ma）时同时获取成交量面板，此时总是按交易日批量获取。
+        返回每个 指标对 × 阈值 一项的列表：{'fast', 'slow', 'diff_threshold', 'results': 筛选后的DataFrame}。
+        """
+        if stock_list is None:
+            stock_list = self.fetcher.get_stock_list()
+
+        if stock_list.empty:
+            return []
+
+        specs = sorted({spec for pair in pairs for spec in pair})
+        history = max(required_history(spec) for spec in specs)
+        # 逐只获取的缓存只保留收盘价，成交量只能从面板获取
+        use_vol = 'vol' in required_inputs(specs)
+        use_panel = use_vol or self.should_use_panel(stock_list, history)
+
+        print(f"开始指标筛选：{len(stock_list)} 只股票，指标 {specs}")
 
-            # 计算移动平均线
-            df['ma5'] = df['close'].rolling(window=5).mean()
-            df['ma20'] = df['close'].rolling(window=20).mean()
-            df['ma30'] = df['close'].rolling(window=30).mean()
-
-            # 转换为字典格式，方便JSON序列化
-            data = {
-                'trade_dates': df['trade_date'].dt.strftime('%Y-%m-%d').tolist(),
-                'close_prices': df['close'].tolist(),
-                'ma5': df['ma5'].tolist(),
-                'ma20': df['ma20'].tolist(),
-                'ma30': df['ma30'].tolist(),
-                'latest_data': {
-                    'close': df['close'].iloc[-1],
-                    'ma5': df['ma5'].iloc[-1],
-                    'ma20': df['ma20'].iloc[-1],
-                    'ma30': df['ma30'].iloc[-1]
-                }
-            }
+        close, _ = self.load_closes(stock_list, history + 10, use_panel, progress_callback)
+        vol = None
+        if use_vol:
+            panel = self.fetcher.get_panel(history + 10, field='vol')
+            vol = panel.select(stock_list['ts_code']) if panel is not None else np.full(close.shape, np.nan)
 
+        with timed_phase('compute', rows=len(stock_list)):
+            latest = IndicatorEngine(close, vol).latest(specs + ['close'])
+
+        combinations = []
+        for fast, slow in pairs:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                diff_percent = (latest[fast] - latest[slow]) / latest[slow] * 100
+
+            df = pd.DataFrame({
+                'ts_code': stock_list['ts_code'].to_numpy(),
+                'name': stock_list['name'].to_numpy(),
+                'diff_percent': diff_percent,
+                'latest_close': latest['close'],
+                fast: latest[fast],
+                slow: latest[slow]
+            })
+            df = df[df['diff_percent'].notna()]
+            columns = ['ts_code', 'name', 'diff_percent', 'latest_close', *dict.fromkeys([fast, slow])]
+
+            for diff_threshold in diff_thresholds:
+                combinations.append({
+                    'fast': fast,
+                    'slow': slow,
+                    'diff_threshold': diff_threshold,
+                    'results': self.filter_results(df, diff_threshold, columns=columns)
+                })
+
+        return combinations
+
+    def save_snapshot(self):
+        """把股票列表和最新交易日的全市场扫描结果写入启动快照，下次启动时可以立即提供服务"""
+        if self.snapshot_dir is None:
+            return
+
+        try:
+            stock_list = self.fetcher.get_stock_list()
+            trade_date, results = self.result_cache.latest()
+            if stock_list.empty:
+                return
+
+            save_snapshot({column: stock_list[column].tolist() for column in stock_list.columns}, trade_date,
+                          {long_period: {column: df[column].tolist() for column in df.columns}
+                           for long_period, df in results.items()},
+                          root=self.snapshot_dir)
+        except Exception as e:
+            print(f"保存启动快照失败: {e}")
+
+    def restore_snapshot(self, snapshot):
+        """用启动快照填充股票列表缓存和结果缓存；快照中的结果只在交易日仍是最新时才会命中"""
+        stock_list = pd.DataFrame(snapshot['stock_list'])
+        stock_list.attrs['loaded_at'] = snapshot['saved_at']
+        self.fetcher.cache.set('stock_list', stock_list)
+        for long_period, columns in snapshot['results'].items():
+            self.result_cache.put(snapshot['trade_date'], long_period, pd.DataFrame(columns))
+
+    def get_stock_details(self, ts_code, days=CHART_DAYS, trade_date=None):
+        """获取股票详细数据（用于绘制图表）
+
+        结果按（股票, 最新交易日, 天数）缓存，同一交易日内重复查看不再重新获取和计算；
+        trade_date为调用方已查询到的最新交易日，省略时自动查询。
+        """
+        try:
+            trade_date = trade_date or self.fetcher.get_latest_trade_date()
+            cache_key = (ts_code, trade_date, days)
+            cached = self.chart_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            data = self.compute_chart_data(ts_code, days)
+            if data is not None:
+                self.chart_cache.set(cache_key, data)
             return data
         except Exception as e:
             print(f"获取股票{ts_code}详情失败: {e}")
             return None
 
+    def compute_chart_data(self, ts_code, days=CHART_DAYS):
+        """计算最近days天的收盘价和各周期均线
+
+        多取（最大均线周期-1）天历史，在完整序列上计算均线后再截取最近days天，
+        显示的第一天起各条均线就有值，而不是前面若干天为空。历史不足的位置为None。
+        """
+        warmup = max(CHART_MA_PERIODS) - 1
+        df = self.fetcher.get_recent_data(ts_code, days + warmup)
+
+        if df.empty:
+            return None
+
+        # 各周期均线共享同一份累计和，一次算出
+        indicators = series_indicators(df['close'], [f'sma_{period}' for period in CHART_MA_PERIODS])
+        lines = {f'ma{period}': pd.Series(indicators[f'sma_{period}'][-days:]).round(4) for period in CHART_MA_PERIODS}
+        df = df.iloc[-days:]
+
+        # NaN不是合法的JSON，转换为None
+        def to_list(series):
+            return [None if pd.isna(value) else float(value) for value in series]
+
+        data = {
+            'trade_date': df['trade_date'].iloc[-1].strftime('%Y%m%d'),
+            'trade_dates': df['trade_date'].dt.strftime('%Y-%m-%d').tolist(),
+            'close_prices': to_list(df['close']),
+            **{name: to_list(line) for name, line in lines.items()},
+        }
+        data['latest_data'] = {'close': data['close_prices'][-1], **{name: data[name][-1] for name in lines}}
+        return data
+
+    def warm_charts(self, ts_codes, days=CHART_DAYS):
+        """预先计算一批股票的图表数据，用户点开时直接命中缓存"""
+        trade_date = self.fetcher.get_latest_trade_date()
+        for ts_code in ts_codes:
+            self.get_stock_details(ts_code, days, trade_date)
+
     def filter_top_diff_stocks(self, df, top_n=10):
         """筛选差异最大的前N只股票"""
         if df.empty:
             return df
 
-        # 按差异百分比绝对值排序
-        df = df.sort_values('diff_percent', key=lambda x: x.abs(), ascending=False)
-        return df.head(top_n)
+        # 按差异百分比绝对值部分选择前N只，只对这N只排序
+        return top_k_rows(df, top_n)
 
     def get_stock_stats(self, df):
         """获取筛选结果的统计信息"""
@@ -1,77 +1,432 @@
 import time
-import tushare as ts
+import threading
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from config import TUSHARE_TOKEN, API_CALL_DELAY
+from config import (TUSHARE_TOKEN, USE_DATA_STORE, STORE_BOOTSTRAP_DAYS, STORE_SYNC_INTERVAL,
+                    STORE_SYNC_RETRY_INTERVAL, CACHE_EXPIRE_TIME)
+from compact import CompactBars, CompactPanel
+from data_cache import DataCache
+from data_store import OHLCStore
+from fetch_pool import FetchPool, instrument_api
+from indicators import series_indicators
+from metrics import timed_phase
+
+def prepare_daily(df, days=None):
+    """整理pro.daily返回的日线：转换日期格式并按日期升序排列，可只保留最近N天，再计算5日均线"""
+    df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
+    df = df.sort_values('trade_date')
+
+    if days is not None:
+        df = df.tail(days)
+
+    # 计算5日均线
+    df['ma5'] = series_indicators(df['close'], ['sma_5'])['sma_5']
+    return df
+
+def adjust_qfq(daily, factors):
+    """用复权因子把pro.daily返回的单只股票未复权日线换算为前复权
+
+    pro.daily没有复权参数，只返回未复权价格。以区间内最新的复权因子为基准，与面板和本地存储的口径一致；
+    缺少复权因子的交易日沿用相邻交易日的因子，返回按交易日升序排列的日线。
+    """
+    if daily.empty or factors is None or factors.empty:
+        return daily
+
+    daily = daily.sort_values('trade_date')
+    factor = daily['trade_date'].map(factors.set_index('trade_date')['adj_factor']).ffill().bfill()
+    ratio = (factor / factor.iloc[-1]).fillna(1.0)
+
+    for col in ['open', 'high', 'low', 'close', 'pre_close']:
+        if col in daily.columns:
+            daily[col] = daily[col] * ratio
+    return daily
 
 class StockDataFetcher:
     """股票数据获取器"""
 
-    def __init__(self):
-        self.pro = ts.pro_api(TUSHARE_TOKEN)
-        self.cache = {}  # 数据缓存，避免重复API调用
+    def __init__(self, pro=None, store=None, pool=None):
+        # 允许注入自定义的pro_api对象（如fake_tushare.FakeProApi），便于离线测试
+        if pro is None:
+            import tushare as ts  # tushare导入较慢，只在真正连接时加载
+            pro = ts.pro_api(TUSHARE_TOKEN)
+        self.pro = pro
+        self.cache = DataCache()  # 按内存预算淘汰的LRU缓存，当天行情收盘后过期
 
-    def get_stock_list(self):
-        """获取A股股票列表"""
-        try:
-            if 'stock_list' in self.cache:
-                return self.cache['stock_list']
+        # 所有API调用共享同一个令牌桶限流，批量获取在有界线程池中并发执行
+        self.pool = pool or FetchPool()
+
+        # 本地日线存储，优先从这里读取，只从API下载缺失的交易日；store=False时禁用
+        if store is None and USE_DATA_STORE:
+            store = OHLCStore()
+        self.store = store or None
+        self.store_lock = threading.Lock()
+        self.store_synced_at = None
+        self.store_retry_at = None  # 上次同步失败后，到这个时间点之前不再尝试
+        self.sync_thread = None  # 进行中的后台同步线程
+        self.sync_thread_lock = threading.Lock()
+
+    def call_api(self, api_name, **kwargs):
+        """限流调用tushare接口，频率超限或网络错误时自动退避重试"""
+        return self.pool.call(instrument_api(api_name, getattr(self.pro, api_name)), **kwargs)
+
+    def fetch_daily_qfq(self, ts_code, start_date=None, end_date=None):
+        """从API获取单只股票的前复权日线（daily + adj_factor两次调用）"""
+        daily = self.call_api('daily', ts_code=ts_code, start_date=start_date, end_date=end_date)
+        if daily.empty:
+            return daily
+
+        factors = self.call_api('adj_factor', ts_code=ts_code, start_date=start_date, end_date=end_date,
+                                fields='trade_date,adj_factor')
+        return adjust_qfq(daily, factors)
+
+    def fetch_many(self, func, items, *args):
+        """在线程池中并发执行 func(item, *args)，按完成顺序产出 (item, 结果)"""
+        return self.pool.map(func, items, *args)
 
-            time.sleep(API_CALL_DELAY)
-            df = self.pro.stock_basic(exchange='', list_status='L', fields='ts_code,name,industry')
+    def get_stock_list(self, refresh=False):
+        """获取A股股票列表，refresh为True时忽略缓存重新获取（获取失败时保留原有缓存）"""
+        def load():
+            df = self.call_api('stock_basic', exchange='', list_status='L', fields='ts_code,name,industry')
             df = df[df['ts_code'].str.startswith(('6', '0', '3'))]  # 只保留沪深股票
-            self.cache['stock_list'] = df
+            df.attrs['loaded_at'] = time.time()  # 列表版本，编码后的响应按版本缓存
             return df
+
+        try:
+            return self.cache.get_or_load('stock_list', load, refresh=refresh)
         except Exception as e:
             print(f"获取股票列表失败: {e}")
             return pd.DataFrame()
 
     def get_daily_data(self, ts_code, start_date=None, end_date=None):
         """获取股票日线数据"""
-        try:
-            cache_key = f"{ts_code}_{start_date}_{end_date}"
-            if cache_key in self.cache:
-                return self.cache[cache_key]
-
-            time.sleep(API_CALL_DELAY)
-            df = self.pro.daily(ts_code=ts_code, adj='qfq', start_date=start_date, end_date=end_date)
-
-            if df.empty:
-                return pd.DataFrame()
+        def load():
+            # 本地存储覆盖了所需区间时直接读取
+            df = self._read_store(ts_code, start_date=start_date, end_date=end_date)
 
-            # 转换日期格式并排序
-            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-            df = df.sort_values('trade_date')
+            if df is None:
+                df = self.fetch_daily_qfq(ts_code, start_date, end_date)
 
-            # 计算5日均线
-            df['ma5'] = df['close'].rolling(window=5).mean()
+            return prepare_daily(df) if not df.empty else None
 
-            self.cache[cache_key] = df
-            return df
+        try:
+            df = self.cache.get_or_load(f"{ts_code}_{start_date}_{end_date}", load)
+            return df if df is not None else pd.DataFrame()
         except Exception as e:
             print(f"获取股票{ts_code}数据失败: {e}")
             return pd.DataFrame()
 
+    def get_recent_bars(self, ts_code, days=30):
+        """获取股票最近N天的紧凑日线（CompactBars，只含交易日和前复权收盘价），获取失败时返回None"""
+        try:
+            return self.load_recent_bars(ts_code, days)
+        except Exception as e:
+            print(f"获取股票{ts_code}最近{days}天数据失败: {e}")
+            return None
+
+    def load_recent_bars(self, ts_code, days=30):
+        """同get_recent_bars，但获取失败时抛出异常，没有数据时返回None，供扫描区分失败和无数据"""
+        def load():
+            # 本地存储中的数据足够时直接读取
+            df = self._read_store(ts_code, days=days)
+
+            if df is None:
+                df = self.fetch_daily_qfq(ts_code)
+
+            if df.empty:
+                return None
+
+            with timed_phase('parse', rows=len(df)):
+                return CompactBars.from_daily(prepare_daily(df, days))
+
+        return self.cache.get_or_load(f"recent_{ts_code}_{days}", load)
+
     def get_recent_data(self, ts_code, days=30):
-        """获取股票最近N天的日线数据"""
+        """获取股票最近N天的日线数据，返回包含trade_date、close、ma5的DataFrame"""
+        bars = self.get_recent_bars(ts_code, days)
+        return bars.to_frame() if bars is not None else pd.DataFrame()
+
+    def get_recent_closes(self, ts_code, days=30):
+        """获取股票最近N天的前复权收盘价数组（不含停牌日），扫描时直接使用，不生成DataFrame"""
+        bars = self.get_recent_bars(ts_code, days)
+        return bars.closes() if bars is not None else np.empty(0)
+
+    def get_trade_dates(self, n_days=None, end_date=None, start_date=None):
+        """获取截至end_date（默认今天）的交易日，按日期升序返回YYYYMMDD字符串列表
+
+        指定start_date时返回区间内全部交易日，否则返回最近n_days个交易日。
+        """
         try:
-            time.sleep(API_CALL_DELAY)
-            df = self.pro.daily(ts_code=ts_code, adj='qfq')
+            end_date = end_date or datetime.now().strftime('%Y%m%d')
+            if start_date is None:
+                # 按自然日估算查询区间，预留节假日余量
+                start_date = (datetime.strptime(end_date, '%Y%m%d') - timedelta(days=n_days * 2 + 15)).strftime('%Y%m%d')
+
+            df = self.call_api('trade_cal', exchange='SSE', start_date=start_date, end_date=end_date, is_open='1')
 
             if df.empty:
-                return pd.DataFrame()
+                return []
 
-            # 转换日期格式并排序
-            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
-            df = df.sort_values('trade_date').tail(days)
+            trade_dates = sorted(df['cal_date'].astype(str).tolist())
+            return trade_dates[-n_days:] if n_days else trade_dates
+        except Exception as e:
+            print(f"获取交易日历失败: {e}")
+            return []
 
-            # 计算5日均线
-            df['ma5'] = df['close'].rolling(window=5).mean()
+    def get_latest_trade_date(self):
+        """最新一个已收盘且数据可用的交易日（YYYYMMDD），无法确定时返回None
 
-            return df
+        启用本地存储时为存储中的最后一个交易日；需要同步时在后台进行，不等待下载完成。
+        """
+        if self.store is not None:
+            self.sync_store(wait=False)
+            if self.store.last_date():
+                return self.store.last_date()
+
+        return self.get_calendar_trade_date()
+
+    def get_calendar_trade_date(self):
+        """按交易日历最新一个已收盘的交易日（YYYYMMDD），不检查行情是否已经下载，无法确定时返回None"""
+        def load():
+            trade_dates = self.get_trade_dates(2)
+            if not trade_dates:
+                return None
+
+            # 当天的行情在收盘数据发布（CACHE_EXPIRE_TIME）之后才算最终结果
+            now = datetime.now()
+            latest = trade_dates[-1]
+            if latest == now.strftime('%Y%m%d') and now.strftime('%H:%M') < CACHE_EXPIRE_TIME and len(trade_dates) > 1:
+                latest = trade_dates[-2]
+            return latest
+
+        return self.cache.get_or_load('latest_trade_date', load)
+
+    def get_panel(self, n_days, end_date=None, progress_callback=None, field='close', refresh=False):
+        """按交易日批量获取全市场最近N个交易日的面板，field为close（前复权收盘价，默认）或vol（成交量）
+
+        每个交易日只需一次daily和一次adj_factor调用即可拿到当天全部股票的数据，
+        返回CompactPanel（行=交易日、列=股票，停牌日为NaN），获取失败时返回None。
+        启用本地存储时先同步缺失的交易日，再从存储读取。
+        同时请求同一个面板时只获取一次，等待的调用不会收到进度回调。
+        refresh为True时忽略缓存的面板重新组装，已获取的交易日截面仍从缓存读取。
+        """
+        def load():
+            values = self._read_store_panel(n_days, end_date, progress_callback, field)
+
+            if values is None:
+                values = self._fetch_panel(n_days, end_date, progress_callback, field)
+
+            if values is None or values.empty:
+                return None
+
+            return CompactPanel.from_frame(values)
+
+        key = f"panel_{n_days}_{end_date}" if field == 'close' else f"panel_{field}_{n_days}_{end_date}"
+        try:
+            return self.cache.get_or_load(key, load, refresh=refresh)
         except Exception as e:
-            print(f"获取股票{ts_code}最近{days}天数据失败: {e}")
+            print(f"获取最近{n_days}个交易日的{field}面板数据失败: {e}")
+            return None
+
+    def get_cross_section(self, trade_date, fields='ts_code,trade_date,open,high,low,close,vol,amount'):
+        """获取某个交易日全部股票的未复权日线及复权因子，数据尚未发布时返回空DataFrame"""
+        daily = self.call_api('daily', trade_date=trade_date, fields=fields)
+
+        if daily is None or daily.empty:
             return pd.DataFrame()
 
+        adj = self.call_api('adj_factor', trade_date=trade_date, fields='ts_code,trade_date,adj_factor')
+        df = daily.merge(adj, on=['ts_code', 'trade_date'], how='left')
+        return df[df['ts_code'].str.startswith(('6', '0', '3'))]  # 只保留沪深股票
+
+    def get_cached_cross_section(self, trade_date, fields):
+        """获取交易日截面，已发布的截面留在缓存中：面板获取中途失败时，重试只需获取缺少的交易日"""
+        def load():
+            df = self.get_cross_section(trade_date, fields)
+            return None if df.empty else df
+
+        section = self.cache.get_or_load(f"section_{trade_date}_{fields}", load)
+        return section if section is not None else pd.DataFrame()
+
+    def iter_cross_sections(self, after_date=None, n_days=None):
+        """按日期顺序产出 (交易日, 截面)，截面包含ts_code、未复权close和adj_factor
+
+        after_date不为空时只产出其后的交易日，否则产出最近n_days个交易日。
+        启用本地存储时从存储读取，否则从API获取。
+        """
+        if self.store is not None:
+            self.sync_store()
+            dates = [d for d in self.store.dates if after_date is None or d > after_date]
+            if after_date is None:
+                dates = dates[-n_days:]
+
+            if dates:
+                _, close = self.store.read_field('close', dates[0], dates[-1])
+                _, adj = self.store.read_field('adj_factor', dates[0], dates[-1])
+                tickers = self.store.tickers[:close.shape[1]]
+
+                for i, trade_date in enumerate(dates):
+                    yield trade_date, pd.DataFrame({'ts_code': tickers, 'close': close[i], 'adj_factor': adj[i]})
+            return
+
+        if after_date is None:
+            trade_dates = self.get_trade_dates(n_days)
+        else:
+            start_date = (datetime.strptime(after_date, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
+            trade_dates = self.get_trade_dates(start_date=start_date)
+
+        sections = self.pool.map(self.get_cross_section, trade_dates, 'ts_code,trade_date,close', ordered=True)
+        for trade_date, df in sections:
+            # 当天数据尚未发布，后面的交易日也不会有数据
+            if df.empty:
+                break
+            yield trade_date, df
+
+    def update_store(self, progress_callback=None):
+        """把本地存储补齐到最新交易日，只下载最后存储日期之后缺失的交易日
+
+        返回新追加的交易日数量。
+        """
+        if self.store is None:
+            return 0
+
+        with self.store_lock:
+            try:
+                last_date = self.store.last_date()
+
+                if last_date is None:
+                    trade_dates = self.get_trade_dates(STORE_BOOTSTRAP_DAYS)
+                    print(f"本地存储为空，开始下载最近 {len(trade_dates)} 个交易日的数据...")
+                else:
+                    start_date = (datetime.strptime(last_date, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
+                    trade_dates = self.get_trade_dates(start_date=start_date)
+
+                # 并发获取各交易日截面，按日期顺序依次追加
+                appended = 0
+                sections = self.pool.map(self.get_cross_section, trade_dates, ordered=True)
+                for i, (trade_date, df) in enumerate(sections):
+
+                    # 当天数据尚未发布，后面的交易日也不会有数据
+                    if df.empty:
+                        break
+
+                    if self.store.append(trade_date, df):
+                        appended += 1
+
+                    if progress_callback:
+                        progress_callback(i + 1, len(trade_dates))
+
+                self.store_synced_at = time.monotonic()
+                self.store_retry_at = None
+
+                if appended:
+                    # 新交易日到来后，旧的面板缓存失效
+                    for key in self.cache.keys():
+                        if key.startswith(('panel_', 'recent_')):
+                            self.cache.pop(key)
+                    print(f"本地存储已更新 {appended} 个交易日，最新交易日 {self.store.last_date()}")
+
+                return appended
+            except Exception as e:
+                # 接口不可用时不让之后的每次读取都重新尝试
+                self.store_retry_at = time.monotonic() + STORE_SYNC_RETRY_INTERVAL
+                print(f"更新本地存储失败: {e}")
+                return 0
+
+    def sync_store(self, force=False, progress_callback=None, wait=True):
+        """按STORE_SYNC_INTERVAL节流地检查并追加新交易日，同步失败后STORE_SYNC_RETRY_INTERVAL内不再尝试
+
+        wait为False时在后台线程中同步并立即返回0，已有后台同步在进行时不再启动新的；
+        单只股票的读取和交易日查询用这种方式，首次建库下载时也不会阻塞请求。
+        """
+        if self.store is None:
+            return 0
+
+        now = time.monotonic()
+        if not force:
+            if self.store_synced_at is not None and now - self.store_synced_at < STORE_SYNC_INTERVAL:
+                return 0
+            if self.store_retry_at is not None and now < self.store_retry_at:
+                return 0
+
+        if not wait:
+            with self.sync_thread_lock:
+                if self.sync_thread is None or not self.sync_thread.is_alive():
+                    self.sync_thread = threading.Thread(target=self.update_store, daemon=True)
+                    self.sync_thread.start()
+            return 0
+
+        return self.update_store(progress_callback)
+
+    def _read_store(self, ts_code, days=None, start_date=None, end_date=None):
+        """从本地存储读取单只股票日线，存储无法覆盖请求时返回None
+
+        不等待同步：需要同步时在后台进行，这次读取使用存储中已有的数据，存储还没有这只股票时从API获取。
+        """
+        if self.store is None:
+            return None
+
+        self.sync_store(wait=False)
+
+        if not self.store.has_ticker(ts_code):
+            return None
+
+        if days is not None:
+            if self.store.count_rows(ts_code) < days:
+                return None
+            return self.store.get_history(ts_code).tail(days)
+
+        # 未指定起始日期表示全部历史，本地存储只保存了最近一段
+        if start_date is None or start_date < self.store.first_date():
+            return None
+
+        return self.store.get_history(ts_code, start_date, end_date)
+
+    def _read_store_panel(self, n_days, end_date, progress_callback, field='close'):
+        """从本地存储读取面板（价格为前复权），存储的交易日不足时返回None"""
+        if self.store is None:
+            return None
+
+        self.sync_store(progress_callback=progress_callback)
+
+        dates = [d for d in self.store.dates if end_date is None or d <= end_date]
+        if len(dates) < n_days:
+            return None
+
+        return self.store.get_panel(field, dates[-n_days], dates[-1])
+
+    def _fetch_panel(self, n_days, end_date, progress_callback, field='close'):
+        """直接从API按交易日获取面板，价格字段换算为前复权，成交量不复权（与本地存储的口径一致）"""
+        # 多取一天，当天数据尚未发布时仍能凑满N个交易日
+        trade_dates = self.get_trade_dates(n_days + 1, end_date)
+        if not trade_dates:
+            return None
+
+        sections = {}
+        for i, (trade_date, df) in enumerate(self.pool.map(self.get_cached_cross_section, trade_dates,
+                                                             f'ts_code,trade_date,{field}')):
+            if not df.empty:
+                sections[trade_date] = df
+
+            if progress_callback:
+                progress_callback(i + 1, len(trade_dates))
+
+        if not sections:
+            return None
+
+        df = pd.concat([sections[d] for d in sorted(sections)[-n_days:]], ignore_index=True)
+        df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d')
+
+        values = df.pivot(index='trade_date', columns='ts_code', values=field).sort_index()
+        if field not in OHLCStore.PRICE_FIELDS:
+            return values
+
+        factor = df.pivot(index='trade_date', columns='ts_code', values='adj_factor').sort_index()
+
+        # 前复权：以各股票区间内最新的复权因子为基准，与 adj='qfq' 的口径一致
+        factor = factor.ffill().bfill()
+        return values * (factor / factor.iloc[-1]).fillna(1.0)
+
     def clear_cache(self):
         """清除数据缓存"""
         self.cache.clear()
@@ -80,6 +435,10 @@ class StockDataFetcher:
         """获取缓存大小"""
         return len(self.cache)
 
+    def get_cache_stats(self):
+        """获取缓存统计信息：条目数、内存占用、命中/未命中/淘汰/过期次数"""
+        return self.cache.stats()
+
 # 测试用例
 if __name__ == "__main__":
     from config import validate_config
@@ -0,0 +1,164 @@
+import bisect
+import threading
+from itertools import islice, product
+
+try:
+    from pypinyin import Style, pinyin
+except ImportError:
+    pinyin = None  # 未安装时按GB2312的拼音排序推算首字母
+
+# GB2312一级汉字按拼音排序，每个首字母对应的第一个汉字的编码（大端两字节）
+_GB2312_INITIALS = [
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'), (0xB8C1, 'g'),
+    (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'), (0xC4C3, 'n'), (0xC5B6, 'o'),
+    (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'), (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'),
+    (0xD1B9, 'y'), (0xD4D1, 'z')
+]
+_GB2312_BOUNDS = [code for code, _ in _GB2312_INITIALS]
+_GB2312_LAST = 0xD7F9
+
+# 股票名称中常见的多音字：GB2312只给出一个读音，另外的读音也建立索引
+_HETERONYMS = {'行': 'hx', '重': 'zc', '长': 'cz', '厦': 'sx', '藏': 'cz', '乐': 'ly', '朝': 'zc'}
+
+# 每只股票最多索引的首字母组合数，多音字较多的名称只取前几种
+MAX_INITIALS_VARIANTS = 8
+
+# 名称和首字母按不超过这个长度的前缀、子串建立倒排表，更长的查询取前这么多个字符的候选再逐个核对
+MAX_INDEXED_SUBSTRING = 6
+
+def _char_initials(char):
+    """单个字符可能的首字母：字母和数字为其本身（小写），汉字取各读音的首字母，其他字符不参与匹配"""
+    if char.isascii():
+        return char.lower() if char.isalnum() else ''
+
+    if pinyin is not None:
+        initials = ''.join(p[0] for p in pinyin(char, style=Style.FIRST_LETTER, heteronym=True)[0]
+                           if p[:1].isascii() and p[:1].isalpha())
+    else:
+        try:
+            code = int.from_bytes(char.encode('gb2312'), 'big')
+        except UnicodeEncodeError:
+            code = 0
+        # 二级汉字按部首排序，无法推算首字母
+        in_range = _GB2312_BOUNDS[0] <= code <= _GB2312_LAST
+        initials = _GB2312_INITIALS[bisect.bisect_right(_GB2312_BOUNDS, code) - 1][1] if in_range else ''
+
+    return ''.join(dict.fromkeys(initials.lower() + _HETERONYMS.get(char, '')))
+
+def name_initials(name):
+    """名称的拼音首字母，多音字的各种读音组合都返回，如 '平安银行' -> ['payh', 'payx']"""
+    letters = [initials for initials in map(_char_initials, name) if initials]
+    return [''.join(combination) for combination in islice(product(*letters), MAX_INITIALS_VARIANTS)]
+
+class _TextIndex:
+    """一组文本（每只股票可有多个写法）的前缀和子串倒排表，倒排表中的股票编号按代码排序"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.prefixes = {}
+        self.substrings = {}
+        for i, variants in enumerate(texts):
+            prefixes = {text[:j] for text in variants for j in range(1, min(MAX_INDEXED_SUBSTRING, len(text)) + 1)}
+            substrings = {text[k:j] for text in variants for k in range(len(text))
+                          for j in range(k + 1, min(k + MAX_INDEXED_SUBSTRING, len(text)) + 1)}
+            for key in prefixes:
+                self.prefixes.setdefault(key, []).append(i)
+            for key in substrings:
+                self.substrings.setdefault(key, []).append(i)
+
+    def _lookup(self, index, query, matches):
+        candidates = index.get(query[:MAX_INDEXED_SUBSTRING], ())
+        if len(query) <= MAX_INDEXED_SUBSTRING:
+            return iter(candidates)
+        # 超过索引长度的查询用前缀子串的倒排表取候选，再逐个核对
+        return (i for i in candidates if any(matches(text, query) for text in self.texts[i]))
+
+    def with_prefix(self, query):
+        return self._lookup(self.prefixes, query, str.startswith)
+
+    def containing(self, query):
+        return self._lookup(self.substrings, query, str.__contains__)
+
+class StockSearchIndex:
+    """股票列表的内存搜索索引
+
+    代码（含不带交易所后缀的数字代码）排序后按前缀二分查找；名称和拼音首字母的前缀、子串建立倒排表。
+    查询时按匹配方式的排名依次从各倒排表取候选，凑满limit只就停止，耗时只与limit有关，与股票总数无关。
+    stock_list可以是DataFrame或 列名 -> 列表 的字典（如启动快照中的股票列表），version标识列表版本。
+    """
+
+    def __init__(self, stock_list, version=None):
+        self.version = version
+        codes = list(stock_list['ts_code'])
+        names = list(stock_list['name'])
+
+        order = sorted(range(len(codes)), key=lambda i: codes[i])
+        self.codes = [codes[i] for i in order]
+        self.names = [names[i] for i in order]
+
+        # 代码：同时按 '600000.sh' 和 '600000' 查找
+        keys = sorted((key, i) for i, ts_code in enumerate(self.codes)
+                      for key in {ts_code.lower(), ts_code.split('.')[0].lower()})
+        self.code_keys = [key for key, _ in keys]
+        self.code_ids = [i for _, i in keys]
+        self.exact_codes = {}
+        for key, i in keys:
+            self.exact_codes.setdefault(key, []).append(i)
+
+        self.exact_names = {}
+        for i, name in enumerate(self.names):
+            self.exact_names.setdefault(name.lower(), []).append(i)
+
+        self.name_index = _TextIndex([[name.lower()] for name in self.names])
+        self.initials_index = _TextIndex([name_initials(name) for name in self.names])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _code_prefix(self, query):
+        position = bisect.bisect_left(self.code_keys, query)
+        while position < len(self.code_keys) and self.code_keys[position].startswith(query):
+            yield self.code_ids[position]
+            position += 1
+
+    def _candidates(self, query):
+        """按匹配方式的排名依次产出 (匹配方式, 股票编号)"""
+        yield from (('code', i) for i in self.exact_codes.get(query, ()))
+        yield from (('code_prefix', i) for i in self._code_prefix(query))
+        yield from (('name', i) for i in self.exact_names.get(query, ()))
+        yield from (('name_prefix', i) for i in self.name_index.with_prefix(query))
+        yield from (('pinyin_prefix', i) for i in self.initials_index.with_prefix(query))
+        yield from (('name_contains', i) for i in self.name_index.containing(query))
+        yield from (('pinyin_contains', i) for i in self.initials_index.containing(query))
+
+    def search(self, query, limit=10):
+        """按代码前缀、名称子串或拼音首字母搜索，返回最多limit项 {'ts_code', 'name', 'match'}，排名靠前的在前"""
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+        for match, i in self._candidates(query):
+            if i in seen:
+                continue
+            seen.add(i)
+            results.append({'ts_code': self.codes[i], 'name': self.names[i], 'match': match})
+            if len(results) >= limit:
+                break
+        return results
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_search_index(stock_list, version):
+    """返回stock_list对应版本的索引，列表刷新（版本变化）后自动重建，同一版本只建立一次"""
+    global _index
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = StockSearchIndex(stock_list, version)
+        return _index
@@ -93,6 +93,1003 @@ def test_stock_details(stock_list):
         print("✗ 获取股票详情失败")
         return False
 
+def test_panel_offline():
+    """离线测试：按交易日批量获取的结果与逐只获取一致"""
+    print("\n测试面板模式（离线数据）...")
+    from fake_tushare import FakeProApi
+
+    import tempfile
+    api = FakeProApi(n_stocks=10, n_days=60)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    stock_list = analyzer.fetcher.get_stock_list()
+
+    per_stock = analyzer.analyze_stocks(stock_list, DEFAULT_LONG_PERIOD, 0, use_panel=False)
+    panel = analyzer.analyze_stocks(stock_list, DEFAULT_LONG_PERIOD, 0, use_panel=True)
+
+    merged = per_stock.merge(panel, on='ts_code', suffixes=('', '_panel'))
+    max_error = (merged['diff_percent'] - merged['diff_percent_panel']).abs().max()
+
+    if len(merged) == len(per_stock) and max_error < 1e-6:
+        print(f"✓ 面板模式结果一致（{len(merged)} 只股票，API调用 {dict(api.call_counts)}）")
+        return True
+    else:
+        print(f"✗ 面板模式结果不一致，最大误差 {max_error}")
+        return False
+
+def test_store_offline():
+    """离线测试：本地存储的读取结果与API一致，重启后只下载新增交易日；单只股票的读取不等待首次建库，
+    同步失败后一段时间内不再重试"""
+    print("\n测试本地存储（离线数据）...")
+    import tempfile
+    import threading
+    import time
+    from fake_tushare import FakeProApi, generate_market
+    from data_store import OHLCStore
+    from fetch_pool import FetchPool
+
+    class SlowSectionProApi(FakeProApi):
+        """按交易日获取截面时等待release（模拟耗时的首次建库），broken为True时直接失败"""
+
+        def __init__(self, *args, broken=False, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.release = threading.Event()
+            self.broken = broken
+
+        def daily(self, ts_code=None, trade_date=None, **kwargs):
+            if trade_date is not None:
+                if self.broken:
+                    raise ConnectionError('网络中断')
+                self.release.wait(10)
+            return super().daily(ts_code=ts_code, trade_date=trade_date, **kwargs)
+
+    root = tempfile.mkdtemp()
+    market = generate_market(n_stocks=10, n_days=60)
+
+    # 先只发布前59个交易日，模拟昨天建好的本地存储
+    yesterday = dict(market, trade_dates=market['trade_dates'][:-1])
+    StockDataFetcher(pro=FakeProApi(yesterday), store=OHLCStore(root)).update_store()
+
+    api = FakeProApi(market)
+    fetcher = StockDataFetcher(pro=api, store=OHLCStore(root))
+    appended = fetcher.update_store()
+
+    ts_code = market['stock_basic'].iloc[0]['ts_code']
+    stored = fetcher.get_recent_data(ts_code, 30)
+    expected = StockDataFetcher(pro=api, store=False).get_recent_data(ts_code, 30)
+    max_error = (stored['close'].to_numpy() - expected['close'].to_numpy()).max()
+
+    # 首次建库在后台进行，期间单只股票直接从API获取
+    slow = SlowSectionProApi(market)
+    fetcher = StockDataFetcher(pro=slow, store=OHLCStore(tempfile.mkdtemp()))
+    start = time.perf_counter()
+    during_bootstrap = fetcher.get_recent_data(ts_code, 30)
+    non_blocking = time.perf_counter() - start < 5 and len(during_bootstrap) == 30
+    slow.release.set()
+    fetcher.sync_thread.join()
+
+    # 同步失败后，之后的读取不再每次都尝试下载
+    broken = SlowSectionProApi(market, broken=True)
+    fetcher = StockDataFetcher(pro=broken, store=OHLCStore(tempfile.mkdtemp()), pool=FetchPool(max_retries=0))
+    fetcher.sync_store()
+    calls = broken.call_counts['trade_cal']
+    fetcher.get_recent_data(ts_code, 30)
+    fetcher.sync_store()
+    throttled = calls > 0 and broken.call_counts['trade_cal'] == calls and fetcher.sync_thread is None
+
+    if appended == 1 and api.call_counts['daily'] == 2 and abs(max_error) < 1e-6 and non_blocking and throttled:
+        print(f"✓ 本地存储增量更新 {appended} 个交易日，读取结果与API一致，建库和同步失败时读取不被阻塞")
+        return True
+    else:
+        print(f"✗ 本地存储异常：新增 {appended} 个交易日，最大误差 {max_error}，读取不等待建库 {non_blocking}，"
+              f"同步失败后节流 {throttled}")
+        return False
+
+def test_rate_limit_offline():
+    """离线测试：令牌桶按配额匀速放行调用，频率超限和网络错误退避后重试，其他错误直接抛出"""
+    print("\n测试令牌桶限流和重试（离线）...")
+    import time
+    from fetch_pool import FetchPool, TokenBucket
+
+    # 每秒20个令牌、最多突发2次：12次调用中后10次需要等待约0.5秒
+    pool = FetchPool(TokenBucket(rate_per_minute=1200, capacity=2), max_workers=4, backoff=0.01)
+    start = time.perf_counter()
+    results = [value for _, value in pool.map(lambda x: pool.call(lambda: x * 2), range(12), ordered=True)]
+    elapsed = time.perf_counter() - start
+
+    attempts = []
+
+    def flaky():
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            raise Exception("抱歉，您每分钟最多访问该接口500次")
+        if len(attempts) == 2:
+            raise ConnectionError("网络抖动")
+        return 'ok'
+
+    retried = pool.call(flaky)
+
+    invalid_calls = []
+
+    def invalid():
+        invalid_calls.append(1)
+        raise ValueError("参数错误")
+
+    try:
+        pool.call(invalid)
+        raised = False
+    except ValueError:
+        raised = True
+
+    if results == [x * 2 for x in range(12)] and 0.45 <= elapsed < 2 and retried == 'ok' and len(attempts) == 3 \
+            and raised and len(invalid_calls) == 1:
+        print(f"✓ 限流和重试正常（12 次调用耗时 {elapsed:.2f} 秒，重试 {len(attempts) - 1} 次后成功）")
+        return True
+    else:
+        print(f"✗ 限流或重试异常：耗时 {elapsed:.2f} 秒，调用 {len(attempts)} 次，参数错误调用 {len(invalid_calls)} 次")
+        return False
+
+def test_async_offline():
+    """离线测试：异步流水线的并发数不超过上限，结果与同步逐只获取一致"""
+    print("\n测试异步获取流水线（离线数据）...")
+    import asyncio
+    from fake_tushare import AsyncFakeProApi
+    from async_fetcher import AsyncStockDataFetcher
+    from fetch_pool import TokenBucket
+    from ma_engine import compute_single_ma_diff
+
+    api = AsyncFakeProApi(n_stocks=40, n_days=60, latency=0.01)
+    in_flight = peak = 0
+    daily = api.daily
+
+    async def counted_daily(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            return await daily(**kwargs)
+        finally:
+            in_flight -= 1
+
+    api.daily = counted_daily
+    fetcher = AsyncStockDataFetcher(api, limiter=TokenBucket(rate_per_minute=60000, capacity=100), concurrency=4)
+    stock_list = api.api.market['stock_basic']
+    df = asyncio.run(fetcher.analyze_stocks(stock_list, DEFAULT_LONG_PERIOD))
+
+    sync_fetcher = StockDataFetcher(pro=api.api, store=False)
+    max_error = 0.0
+    for stock in df.itertuples():
+        expected = compute_single_ma_diff(sync_fetcher.get_recent_closes(stock.ts_code, DEFAULT_LONG_PERIOD + 10),
+                                          DEFAULT_LONG_PERIOD)
+        max_error = max(max_error, abs(stock.diff_percent - expected['diff_percent']))
+
+    if len(df) == len(stock_list) and 1 < peak <= 4 and max_error < 1e-9:
+        print(f"✓ 异步流水线正常（{len(df)} 只股票，最多 {peak} 个并发请求）")
+        return True
+    else:
+        print(f"✗ 异步流水线异常：{len(df)} 只股票，最多 {peak} 个并发请求，最大误差 {max_error}")
+        return False
+
+def test_data_cache_offline():
+    """离线测试：缓存超出字节预算时淘汰最久未使用的条目，条目在收盘后的时间点过期"""
+    print("\n测试行情缓存淘汰和过期（离线）...")
+    import numpy as np
+    from datetime import datetime, timedelta
+    from data_cache import DataCache, next_expire_time
+
+    block = np.zeros(1000)  # 8000字节
+    cache = DataCache(max_bytes=3 * block.nbytes)
+    for key in 'abc':
+        cache.set(key, block.copy())
+    cache.get('a')  # a变为最近使用，超出预算时先淘汰b
+    cache.set('d', block.copy())
+    evicted_ok = cache.keys() == ['c', 'a', 'd'] and cache.stats()['bytes'] <= cache.max_bytes
+    oversized_ok = cache.set('huge', np.zeros(4000)) is None and 'huge' not in cache
+
+    # 收盘前写入的数据当天过期，收盘后写入的数据次日过期
+    morning = datetime(2024, 1, 2, 10, 0)
+    evening = datetime(2024, 1, 2, 16, 0)
+    expire_ok = next_expire_time(morning, '15:30') == datetime(2024, 1, 2, 15, 30) \
+        and next_expire_time(evening, '15:30') == datetime(2024, 1, 3, 15, 30)
+
+    # 把a的过期时间改到过去，模拟已经过了收盘时间
+    value, size, _ = cache.entries['a']
+    cache.entries['a'] = (value, size, datetime.now() - timedelta(seconds=1))
+    expired_ok = cache.get('a') is None and cache.stats()['expirations'] == 1 and 'a' not in cache.keys()
+
+    if evicted_ok and oversized_ok and expire_ok and expired_ok:
+        print(f"✓ 缓存淘汰和过期正常（{cache.stats()}）")
+        return True
+    else:
+        print(f"✗ 缓存淘汰或过期异常：淘汰 {evicted_ok}，超大条目 {oversized_ok}，"
+              f"过期时间 {expire_ok}，过期 {expired_ok}")
+        return False
+
+def test_vectorized_offline():
+    """离线测试：向量化引擎与原来逐只股票的循环计算结果一致（含停牌日和数据不足的股票）"""
+    print("\n测试向量化均线引擎（离线数据）...")
+    import numpy as np
+    from fake_tushare import generate_market
+    from ma_engine import compute_ma_diff, compute_ma_diff_multi
+
+    market = generate_market(n_stocks=30, n_days=40, suspend_rate=0.1)
+    close = market['daily'].pivot(index='trade_date', columns='ts_code', values='close').sort_index()
+    close.iloc[:-15, 0] = np.nan  # 上市不足20天的新股
+
+    def loop_ma_diff(long_period):
+        """原来的逐只计算：每只股票的有效日线取最近long_period天的均值和最新的5日均线"""
+        expected = np.full(close.shape[1], np.nan)
+        for j, ts_code in enumerate(close.columns):
+            series = close[ts_code].dropna()
+            if len(series) < long_period:
+                continue
+            long_mean = series.tail(long_period).mean()
+            latest_ma5 = series.rolling(window=5).mean().iloc[-1]
+            expected[j] = (latest_ma5 - long_mean) / long_mean * 100
+        return expected
+
+    multi = compute_ma_diff_multi(close.to_numpy(), [10, DEFAULT_LONG_PERIOD, 30])
+    max_error = 0.0
+    for long_period in [10, DEFAULT_LONG_PERIOD, 30]:
+        expected = loop_ma_diff(long_period)
+        for values in (compute_ma_diff(close.to_numpy(), long_period)['diff_percent'],
+                       multi[long_period]['diff_percent']):
+            if not np.array_equal(np.isnan(values), np.isnan(expected)):
+                print(f"✗ {long_period}日周期数据不足的股票不一致")
+                return False
+            max_error = max(max_error, np.nanmax(np.abs(values - expected)))
+
+    # 参数扫描按最长周期取面板，每个周期只认最近 周期+10 天，长期停牌的股票与单个周期扫描一样不入选
+    suspended = close.to_numpy().copy()
+    suspended[-12:, 1] = np.nan
+    windowed = compute_ma_diff_multi(suspended, [10, DEFAULT_LONG_PERIOD], extra_days=10)
+    for long_period in [10, DEFAULT_LONG_PERIOD]:
+        expected = compute_ma_diff(suspended[-(long_period + 10):], long_period)['diff_percent']
+        values = windowed[long_period]['diff_percent']
+        if not np.array_equal(np.isnan(values), np.isnan(expected)) or not np.isnan(values[1]):
+            print(f"✗ {long_period}日周期按窗口判断数据是否足够的结果与单个周期扫描不一致")
+            return False
+        max_error = max(max_error, np.nanmax(np.abs(values - expected)))
+
+    if max_error < 1e-9:
+        print(f"✓ 向量化结果与逐只计算一致（{close.shape[1]} 只股票，最大误差 {max_error:.2e}）")
+        return True
+    else:
+        print(f"✗ 向量化结果不一致，最大误差 {max_error}")
+        return False
+
+def test_parallel_scan_offline():
+    """离线测试：SCAN_WORKERS>1时分片并行计算的指标、合并出的前K名和分页结果与串行扫描一致"""
+    print("\n测试多进程分片扫描（离线数据）...")
+    import numpy as np
+    import pandas as pd
+    from config import PARALLEL_SCAN_MIN_STOCKS
+    from fake_tushare import FakeProApi
+    from ma_engine import compute_ma_diff
+    from parallel_scan import parallel_ma_diff, shutdown_executor
+    from top_k import top_k_indices
+
+    rng = np.random.default_rng(0)
+    n_stocks = PARALLEL_SCAN_MIN_STOCKS
+    close = 10 + rng.standard_normal((40, n_stocks)).cumsum(axis=0) * 0.1
+    close[rng.random(close.shape) < 0.05] = np.nan  # 停牌日
+    close[:-15, :5] = np.nan  # 数据不足的新股
+    close[:, 10:13] = close[:, [20]]  # 差异相同的股票，检查跨分片并列时的排名
+    stock_list = pd.DataFrame({'ts_code': [f'{i:06d}.SZ' for i in range(n_stocks)],
+                               'name': [f'股票{i}' for i in range(n_stocks)]})
+
+    try:
+        expected = compute_ma_diff(close, DEFAULT_LONG_PERIOD)
+        metrics, top = parallel_ma_diff(close, DEFAULT_LONG_PERIOD, workers=3, k=50)
+        valid = np.flatnonzero(~np.isnan(expected['diff_percent']))
+        expected_top = valid[top_k_indices(expected['diff_percent'][valid], 50)]
+        metrics_ok = all(np.array_equal(metrics[name], expected[name], equal_nan=True) for name in expected)
+        top_ok = np.array_equal(top, expected_top)
+
+        fetcher = StockDataFetcher(pro=FakeProApi(n_stocks=10, n_days=10), store=False)
+        serial = StockAnalyzer(fetcher, scan_workers=1)
+        parallel = StockAnalyzer(fetcher, scan_workers=1)
+        parallel.scan_workers = 3  # 绕过CPU核数上限，单核机器上也经过进程池
+        serial_df = serial.build_results(stock_list, close, DEFAULT_LONG_PERIOD)
+        parallel_df = parallel.build_results(stock_list, close, DEFAULT_LONG_PERIOD)
+        pages_ok = 'top_k' in parallel_df.attrs and all(
+            parallel.filter_results(parallel_df, threshold, limit, offset).equals(
+                serial.filter_results(serial_df, threshold, limit, offset))
+            for threshold in (0, 1, 3) for limit, offset in ((20, 0), (20, 40), (200, 0)))
+    finally:
+        shutdown_executor()
+
+    if metrics_ok and top_ok and pages_ok:
+        print(f"✓ 多进程扫描结果与串行一致（{n_stocks} 只股票，3 个进程）")
+        return True
+    else:
+        print(f"✗ 多进程扫描结果不一致：指标 {metrics_ok}，前K名 {top_ok}，分页 {pages_ok}")
+        return False
+
+def test_incremental_offline():
+    """离线测试：均线状态逐日增量更新后与全量计算一致，且每天只获取新交易日的截面"""
+    print("\n测试增量均线扫描（离线数据）...")
+    import tempfile
+    from fake_tushare import FakeProApi, generate_market
+
+    market = generate_market(n_stocks=20, n_days=70, suspend_rate=0.05)
+    stock_list = market['stock_basic']
+    state_dir = tempfile.mkdtemp()
+
+    # 先用前65个交易日建立状态，再逐日发布剩下的交易日
+    for published in range(65, 71):
+        api = FakeProApi(dict(market, trade_dates=market['trade_dates'][:published]))
+        analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=state_dir)
+        incremental = analyzer.scan_stocks(stock_list, DEFAULT_LONG_PERIOD, use_panel=True)
+
+    full = StockAnalyzer(StockDataFetcher(pro=FakeProApi(market), store=False))
+    expected = full.scan_stocks(stock_list, DEFAULT_LONG_PERIOD, use_panel=False)
+
+    merged = expected.merge(incremental, on='ts_code', suffixes=('', '_incremental'))
+    max_error = (merged['diff_percent'] - merged['diff_percent_incremental']).abs().max()
+
+    if len(merged) == len(expected) and max_error < 1e-6 and api.call_counts['daily'] == 1:
+        print(f"✓ 增量扫描结果一致（{len(merged)} 只股票，最后一天只调用 {dict(api.call_counts)}）")
+        return True
+    else:
+        print(f"✗ 增量扫描结果不一致，最大误差 {max_error}")
+        return False
+
+def test_sweep_offline():
+    """离线测试：参数扫描每个 长期周期 × 阈值 组合的结果与单独扫描该组合一致，且只获取一次数据"""
+    print("\n测试多参数扫描（离线数据）...")
+    import tempfile
+    import numpy as np
+    from fake_tushare import FakeProApi
+
+    api = FakeProApi(n_stocks=40, n_days=60)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    stock_list = analyzer.fetcher.get_stock_list()
+
+    combinations, _ = analyzer.sweep([10, DEFAULT_LONG_PERIOD], [1, 3], stock_list)
+    sweep_calls = api.call_counts['daily']
+
+    mismatched = []
+    for cell in combinations:
+        expected = analyzer.analyze_stocks(stock_list, cell['long_period'], cell['diff_threshold'], use_panel=False)
+        actual = cell['results']
+        same = actual['ts_code'].tolist() == expected['ts_code'].tolist() and \
+            np.allclose(actual['diff_percent'], expected['diff_percent'], rtol=0, atol=1e-9)
+        if not same:
+            mismatched.append((cell['long_period'], cell['diff_threshold']))
+
+    # 通过任务管理器提交全市场扫描：相同参数合并为同一个任务，完成后写入的结果缓存与单独扫描一致
+    from job_manager import JobManager
+    manager = JobManager(StockAnalyzer(StockDataFetcher(pro=FakeProApi(n_stocks=40, n_days=60, latency=0.01),
+                                                        store=False), state_dir=tempfile.mkdtemp()), max_workers=1)
+    job = manager.submit_sweep([DEFAULT_LONG_PERIOD, 10], [1, 3])
+    coalesced = manager.submit_sweep([10, DEFAULT_LONG_PERIOD], [1, 3]) is job
+    manager.shutdown()
+    status = job.to_status()
+    if not coalesced or status['status'] != 'completed' or status['long_periods'] != [10, DEFAULT_LONG_PERIOD] \
+            or len(job.result) != 4 or job.coverage['failed_count']:
+        print(f"✗ 参数扫描任务异常：{status}")
+        return False
+    for cell in job.result:
+        cached = manager.analyzer.get_cached_results(cell['long_period'], cell['diff_threshold'])
+        if cached is None or cached['ts_code'].tolist() != cell['results']['ts_code'].tolist():
+            mismatched.append(('cache', cell['long_period'], cell['diff_threshold']))
+
+    if len(combinations) == 4 and not mismatched and sweep_calls == len(stock_list):
+        print(f"✓ 参数扫描结果与单独扫描一致（{len(combinations)} 个组合，daily 调用 {sweep_calls} 次）")
+        return True
+    else:
+        print(f"✗ 参数扫描结果不一致：{mismatched}，daily 调用 {sweep_calls} 次")
+        return False
+
+def test_result_memo_offline():
+    """离线测试：同一交易日只改阈值时直接在缓存的全量结果上筛选，不再获取数据；换了长期周期时重新扫描；
+    有股票获取失败的参数扫描不写入结果缓存"""
+    print("\n测试扫描结果缓存（离线数据）...")
+    import tempfile
+    from fake_tushare import FakeProApi
+    from fetch_pool import FetchPool
+    from metrics import RESULT_CACHE_LOOKUPS
+
+    class BrokenProApi(FakeProApi):
+        """第一只股票的日线一直获取失败"""
+
+        def daily(self, ts_code=None, **kwargs):
+            if ts_code == '000001.SZ':
+                raise ConnectionError('网络中断')
+            return super().daily(ts_code=ts_code, **kwargs)
+
+    api = FakeProApi(n_stocks=40, n_days=60)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    stock_list = analyzer.fetcher.get_stock_list()
+
+    analyzer.analyze_market(DEFAULT_LONG_PERIOD, 1)
+    calls = api.call_counts['daily']
+    hits = RESULT_CACHE_LOOKUPS.get(result='hit')
+    cached = analyzer.analyze_market(DEFAULT_LONG_PERIOD, 3)
+    memo_ok = api.call_counts['daily'] == calls and RESULT_CACHE_LOOKUPS.get(result='hit') == hits + 1
+
+    expected = analyzer.analyze_stocks(stock_list, DEFAULT_LONG_PERIOD, 3, use_panel=False)
+    same = cached['ts_code'].tolist() == expected['ts_code'].tolist()
+
+    calls = api.call_counts['daily']
+    analyzer.analyze_market(DEFAULT_LONG_PERIOD + 10, 3)
+    rescanned = api.call_counts['daily'] > calls
+
+    broken = StockAnalyzer(StockDataFetcher(pro=BrokenProApi(n_stocks=40, n_days=60), store=False,
+                                            pool=FetchPool(max_retries=0)), state_dir=tempfile.mkdtemp())
+    _, coverage = broken.sweep([DEFAULT_LONG_PERIOD], [3])
+    partial_ok = coverage['failed'] == ['000001.SZ'] and broken.get_cached_results(DEFAULT_LONG_PERIOD, 3) is None
+
+    if memo_ok and same and rescanned and partial_ok:
+        print(f"✓ 只改阈值时命中结果缓存（{len(cached)} 只股票符合条件，没有新的接口调用）")
+        return True
+    else:
+        print(f"✗ 结果缓存异常：命中 {memo_ok}，结果一致 {same}，换周期重新扫描 {rescanned}，"
+              f"不完整的扫描未缓存 {partial_ok}")
+        return False
+
+def test_jobs_offline():
+    """离线测试：相同参数的并发请求合并为同一个任务，结果按任务ID查询"""
+    print("\n测试筛选任务管理（离线数据）...")
+    import tempfile
+    import threading
+    from fake_tushare import FakeProApi
+    from job_manager import JobManager
+
+    api = FakeProApi(n_stocks=50, n_days=60, latency=0.01)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    manager = JobManager(analyzer, max_workers=2)
+
+    first = manager.submit(DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD)
+    second = manager.submit(DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD)
+    other = manager.submit(DEFAULT_LONG_PERIOD + 10, DEFAULT_DIFF_THRESHOLD)
+    manager.shutdown()
+
+    jobs_ok = first is second and other is not first and manager.get(first.id).status == 'completed'
+    # 扫描过程中维护的排行与最终排序结果的前K名一致
+    top = [stock['ts_code'] for stock in first.top.items()]
+    top_ok = top == first.result['ts_code'].head(len(top)).tolist()
+
+    # 图表预热在独立线程中进行：预热卡住时任务线程也已空出，只有一个线程的任务池仍能接着执行下一个任务
+    release = threading.Event()
+
+    class SlowChartAnalyzer(StockAnalyzer):
+        def warm_charts(self, ts_codes, days=None):
+            release.wait(10)
+
+    slow = JobManager(SlowChartAnalyzer(analyzer.fetcher, state_dir=tempfile.mkdtemp()), max_workers=1)
+    slow.submit(DEFAULT_LONG_PERIOD, 0)
+    queued = slow.submit(DEFAULT_LONG_PERIOD + 10, 0)
+    with queued.condition:
+        queued.condition.wait_for(lambda: queued.finished, timeout=5)
+    prewarm_ok = queued.status == 'completed'
+    release.set()
+    slow.shutdown()
+
+    if jobs_ok and top_ok and prewarm_ok and other.status == 'completed':
+        print(f"✓ 任务合并正常（{len(first.result)} 只股票符合条件）")
+        return True
+    else:
+        print(f"✗ 任务状态异常: {first.to_status()} {other.to_status()}，预热不占任务线程 {prewarm_ok}")
+        return False
+
+def test_top_k_offline():
+    """离线测试：部分选择的前K名和分页与全量排序一致，扫描中维护的排行按差异绝对值排序"""
+    print("\n测试前K名选择和排行（离线数据）...")
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    import app as web
+    from fake_tushare import FakeProApi
+    from job_manager import JobManager
+    from top_k import TopKHeap, top_k_indices
+
+    rng = np.random.default_rng(0)
+    values = np.round(rng.normal(0, 5, 1000), 1)  # 保留一位小数，制造绝对值相同的并列
+    ranked = np.argsort(-np.abs(values), kind='stable')
+    pages_ok = all(np.array_equal(top_k_indices(values, 20, offset), ranked[offset:offset + 20])
+                   for offset in (0, 20, 990, 1000))
+
+    heap = TopKHeap(k=10)
+    for i, value in enumerate(values):
+        heap.push({'ts_code': str(i), 'diff_percent': value})
+    heap_ok = [abs(item['diff_percent']) for item in heap.items()] == list(np.abs(values[ranked[:10]]))
+
+    analyzer = StockAnalyzer(StockDataFetcher(pro=FakeProApi(n_stocks=40, n_days=60), store=False),
+                             state_dir=tempfile.mkdtemp())
+    df = analyzer.scan_stocks(analyzer.fetcher.get_stock_list(), DEFAULT_LONG_PERIOD, use_panel=False)
+    expected = df.sort_values('diff_percent', key=lambda x: x.abs(), ascending=False)
+    limited = analyzer.filter_results(df, 0, limit=5, offset=5)
+    filter_ok = limited['ts_code'].tolist() == expected['ts_code'].iloc[5:10].tolist()
+
+    manager = JobManager(analyzer, max_workers=1)
+    job = manager.submit(DEFAULT_LONG_PERIOD, 0)
+    manager.shutdown()
+    web.job_manager = manager
+    try:
+        board = web.app.test_client().get(f'/api/leaderboard/{job.id}').get_json()['data']['stocks']
+    finally:
+        web.job_manager = None
+    board_diff = pd.Series([stock['diff_percent'] for stock in board])
+    board_ok = [stock['ts_code'] for stock in board] == job.result['ts_code'].head(len(board)).tolist() \
+        and board_diff.abs().is_monotonic_decreasing
+
+    if pages_ok and heap_ok and filter_ok and board_ok:
+        print(f"✓ 前K名和排行正常（排行 {len(board)} 只股票）")
+        return True
+    else:
+        print(f"✗ 前K名或排行异常：分页 {pages_ok}，堆 {heap_ok}，筛选 {filter_ok}，排行接口 {board_ok}")
+        return False
+
+def test_stream_offline():
+    """离线测试：/api/stream按SSE的data:帧（format=ndjson时逐行JSON）推送股票、进度和完成事件，完成事件带状态和覆盖率"""
+    print("\n测试流式结果推送（离线数据）...")
+    import json
+    import tempfile
+    import app as web
+    from fake_tushare import FakeProApi
+    from job_manager import JobManager
+
+    api = FakeProApi(n_stocks=30, n_days=60)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    manager = JobManager(analyzer, max_workers=1)
+
+    web.analyzer, web.job_manager = analyzer, manager
+    try:
+        job = manager.submit(DEFAULT_LONG_PERIOD, 0)
+        client = web.app.test_client()
+        # 流式响应在读取时才生成，读完一个再发下一个请求
+        sse = client.get(f'/api/stream/{job.id}')
+        sse_text = sse.get_data(as_text=True)
+        ndjson = client.get(f'/api/stream/{job.id}?format=ndjson')
+        ndjson_text = ndjson.get_data(as_text=True)
+        missing = client.get('/api/stream/missing')
+    finally:
+        manager.shutdown()
+        web.analyzer, web.job_manager = None, None
+
+    # SSE每条消息是一行"data: <JSON>"，以空行结束
+    frames = sse_text.split('\n\n')
+    framed = frames[-1] == '' and all(frame.startswith('data: ') and '\n' not in frame for frame in frames[:-1])
+    sse_events = [json.loads(frame[len('data: '):]) for frame in frames[:-1]] if framed else []
+    ndjson_events = [json.loads(line) for line in ndjson_text.splitlines()]
+
+    def summary(events):
+        """股票和完成事件；进度事件的个数取决于读取时扫描进行到哪里"""
+        return [event for event in events if event['type'] in ('stock', 'done')]
+
+    types = {event['type'] for event in sse_events}
+    done = sse_events[-1] if sse_events else {}
+    stocks = [event['stock']['ts_code'] for event in sse_events if event['type'] == 'stock']
+    done_ok = done.get('type') == 'done' and done.get('status') == 'completed' and \
+        done.get('coverage', {}).get('failed_count') == 0 and done.get('count') == len(stocks) == len(job.result)
+    mimetypes_ok = sse.mimetype == 'text/event-stream' and ndjson.mimetype == 'application/x-ndjson'
+
+    if framed and {'stock', 'progress', 'done'} <= types and done_ok and mimetypes_ok \
+            and summary(ndjson_events) == summary(sse_events) and missing.status_code == 404 \
+            and any(event['type'] == 'progress' for event in ndjson_events):
+        print(f"✓ 流式推送正常（{len(stocks)} 条股票事件，完成事件覆盖率 {done['coverage']['coverage']:.1f}%）")
+        return True
+    else:
+        print(f"✗ 流式推送异常：SSE帧 {framed}，事件类型 {sorted(types)}，完成事件 {done_ok}，"
+              f"类型 {sse.mimetype}/{ndjson.mimetype}，ndjson一致 {summary(ndjson_events) == summary(sse_events)}")
+        return False
+
+def test_metrics_offline():
+    """离线测试：/api/metrics输出接口调用计数器、耗时直方图、扫描阶段和缓存命中指标"""
+    print("\n测试运行指标（离线数据）...")
+    import tempfile
+    import app as web
+    from fake_tushare import FakeProApi
+
+    def scrape():
+        text = web.app.test_client().get('/api/metrics').get_data(as_text=True)
+        samples = {}
+        for line in text.splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return text, samples
+
+    _, before = scrape()
+    api = FakeProApi(n_stocks=20, n_days=60)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    analyzer.scan_stocks(analyzer.fetcher.get_stock_list(), DEFAULT_LONG_PERIOD, use_panel=False)
+
+    web.analyzer = analyzer
+    try:
+        text, after = scrape()
+    finally:
+        web.analyzer = None
+
+    def delta(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    calls = 'tushare_api_calls_total{api="daily"}'
+    buckets = [name for name in after if name.startswith('tushare_api_latency_seconds_bucket{api="daily"')]
+    counts = [after[name] for name in buckets]
+    histogram_ok = counts == sorted(counts) and delta('tushare_api_latency_seconds_bucket{api="daily",le="+Inf"}') \
+        == delta('tushare_api_latency_seconds_count{api="daily"}') == api.call_counts['daily']
+    declared = '# TYPE tushare_api_calls_total counter' in text and \
+        '# TYPE tushare_api_latency_seconds histogram' in text
+
+    if delta(calls) == api.call_counts['daily'] and histogram_ok and declared \
+            and delta('scan_phase_seconds_count{phase="scan"}') == 1 and 'data_cache_hits_total' in after:
+        print(f"✓ 运行指标正常（daily 调用 {int(delta(calls))} 次，耗时直方图 {len(buckets)} 个分桶）")
+        return True
+    else:
+        print(f"✗ 运行指标异常：daily 计数增加 {delta(calls)}，实际调用 {api.call_counts['daily']}，"
+              f"直方图 {histogram_ok}，类型声明 {declared}")
+        return False
+
+def test_chart_offline():
+    """离线测试：图表均线在完整历史上预热，第一天起就有值且与全量计算一致；同一交易日重复查看命中缓存"""
+    print("\n测试图表数据（离线数据）...")
+    from fake_tushare import FakeProApi
+
+    api = FakeProApi(n_stocks=5, n_days=120)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False))
+    ts_code = analyzer.fetcher.get_stock_list().iloc[0]['ts_code']
+
+    details = analyzer.get_stock_details(ts_code, 60)
+    full = analyzer.fetcher.get_recent_data(ts_code, 120)
+    expected = full['close'].rolling(window=30).mean().iloc[-60:]
+    max_error = max(abs(a - b) for a, b in zip(details['ma30'], expected))
+
+    calls = sum(api.call_counts.values())
+    cached = analyzer.get_stock_details(ts_code, 60) is details and sum(api.call_counts.values()) == calls
+    # 缓存大小要计入列表中的每个元素，不能只算列表本身的指针数组
+    elements = sum(sys.getsizeof(v) for values in details.values() if isinstance(values, list) for v in values)
+    sized = analyzer.chart_cache.stats()['bytes'] >= elements
+
+    if len(details['ma30']) == 60 and None not in details['ma30'] and max_error < 1e-3 and cached and sized:
+        print(f"✓ 图表数据正确（60 天均线完整，最大误差 {max_error:.2e}）")
+        return True
+    else:
+        print(f"✗ 图表数据异常，最大误差 {max_error}，缓存命中 {cached}，缓存大小估算 {sized}")
+        return False
+
+def test_snapshot_offline():
+    """离线测试：扫描后写入的启动快照可以在新的分析器中恢复，不再获取股票列表和重新扫描"""
+    print("\n测试启动快照（离线数据）...")
+    import tempfile
+    from fake_tushare import FakeProApi
+    from snapshot import load_snapshot
+
+    api = FakeProApi(n_stocks=50, n_days=60)
+    root = tempfile.mkdtemp()
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp(), snapshot_dir=root)
+    expected = analyzer.analyze_market(DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD)
+
+    restored = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    restored.restore_snapshot(load_snapshot(root))
+    calls = dict(api.call_counts)
+    cached = restored.get_cached_results(DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD)
+    new_calls = {name: count - calls.get(name, 0) for name, count in api.call_counts.items() if count != calls.get(name, 0)}
+
+    if cached is not None and cached['ts_code'].tolist() == expected['ts_code'].tolist() and 'daily' not in new_calls \
+            and 'stock_basic' not in new_calls:
+        print(f"✓ 启动快照恢复正常（{len(cached)} 只股票符合条件，恢复后只调用 {new_calls}）")
+        return True
+    else:
+        print(f"✗ 启动快照恢复异常，恢复后调用 {new_calls}")
+        return False
+
+def test_scheduler_offline():
+    """离线测试：收盘后预计算发布各周期的结果，同一交易日再次运行时跳过；截面全部获取失败时记为出错并安排重试"""
+    print("\n测试收盘后预计算（离线数据）...")
+    import tempfile
+    from fake_tushare import FakeProApi
+    from fetch_pool import FetchPool
+    from scheduler import DailyScheduler
+
+    class OfflineProApi(FakeProApi):
+        """按交易日获取截面时一直失败"""
+
+        def daily(self, ts_code=None, trade_date=None, **kwargs):
+            if trade_date is not None:
+                raise ConnectionError('网络中断')
+            return super().daily(ts_code=ts_code, trade_date=trade_date, **kwargs)
+
+    api = FakeProApi(n_stocks=50, n_days=80)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), state_dir=tempfile.mkdtemp())
+    scheduler = DailyScheduler(analyzer, long_periods=(10, DEFAULT_LONG_PERIOD))
+
+    first = scheduler.run_once()
+    calls = sum(api.call_counts.values())
+    second = scheduler.run_once()
+    cached = analyzer.get_cached_results(DEFAULT_LONG_PERIOD, DEFAULT_DIFF_THRESHOLD)
+
+    offline = StockAnalyzer(StockDataFetcher(pro=OfflineProApi(n_stocks=200, n_days=80), store=False,
+                                             pool=FetchPool(max_retries=0)), state_dir=tempfile.mkdtemp())
+    failing = DailyScheduler(offline, long_periods=(DEFAULT_LONG_PERIOD,))
+    failed = failing.run_once()
+    retry_ok = failed['status'] == 'error' and failing.retries == 1 \
+        and offline.get_cached_results(DEFAULT_LONG_PERIOD, 0) is None
+
+    if first['status'] == 'published' and second['status'] == 'skipped' and cached is not None \
+            and sum(api.call_counts.values()) - calls <= 1 and retry_ok:
+        print(f"✓ 预计算正常（{first['trade_date']}，耗时 {first['duration']:.2f} 秒，{len(cached)} 只股票符合条件）")
+        return True
+    else:
+        print(f"✗ 预计算异常: {list(scheduler.history)}，截面获取失败时 {list(failing.history)}")
+        return False
+
+def test_single_flight_offline():
+    """离线测试：多个线程同时请求同一只股票时只调用一次接口，并拿到同一份数据"""
+    print("\n测试并发请求合并（离线数据）...")
+    from concurrent.futures import ThreadPoolExecutor
+    from fake_tushare import FakeProApi
+
+    api = FakeProApi(n_stocks=5, n_days=60, latency=0.05)
+    fetcher = StockDataFetcher(pro=api, store=False)
+    ts_code = fetcher.get_stock_list().iloc[0]['ts_code']
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: fetcher.get_recent_bars(ts_code, 30), range(8)))
+
+    if api.call_counts['daily'] == 1 and all(bars is results[0] for bars in results):
+        print(f"✓ 并发请求已合并（8 个请求，daily 调用 {api.call_counts['daily']} 次，"
+              f"{fetcher.get_cache_stats()['coalesced']} 个请求等待共享结果）")
+        return True
+    else:
+        print(f"✗ 并发请求未合并，daily 调用 {api.call_counts['daily']} 次")
+        return False
+
+def test_response_format_offline():
+    """离线测试：结果接口的格式协商、游标分页、结果更新后旧游标返回409和gzip压缩"""
+    print("\n测试结果格式和分页（离线数据）...")
+    import gzip
+    import tempfile
+    import app as web
+    from fake_tushare import FakeProApi
+    from job_manager import JobManager
+
+    analyzer = StockAnalyzer(StockDataFetcher(pro=FakeProApi(n_stocks=40, n_days=60), store=False),
+                             state_dir=tempfile.mkdtemp())
+    manager = JobManager(analyzer, max_workers=1)
+    job = manager.submit(DEFAULT_LONG_PERIOD, 0)
+    other = manager.submit(DEFAULT_LONG_PERIOD, 1)
+    manager.shutdown()
+
+    web.job_manager = manager
+    client = web.app.test_client()
+    try:
+        url = f'/api/results/{job.id}'
+        rows = client.get(url).get_json()['data']['stocks']
+        columns = client.get(url, query_string={'format': 'columns'}).get_json()['data']
+        formats_ok = [row['ts_code'] for row in rows] == columns['stocks']['ts_code'] == job.result['ts_code'].tolist() \
+            and columns['columns'] == list(job.result.columns) \
+            and client.get(url, query_string={'format': 'xml'}).status_code == 406
+
+        # 按next_cursor逐页读取，拼起来与一次取回全部结果相同
+        paged = []
+        cursor_query = {'limit': 7}
+        while True:
+            page = client.get(url, query_string=cursor_query).get_json()['data']
+            paged += page['stocks']
+            if not page['has_more']:
+                break
+            cursor_query = {'limit': 7, 'cursor': page['next_cursor']}
+        paging_ok = paged == rows
+
+        first = client.get(url, query_string={'limit': 7}).get_json()['data']
+        stale = client.get(f'/api/results/{other.id}', query_string={'cursor': first['next_cursor']})
+        invalid = [client.get(url, query_string={'limit': limit}).status_code for limit in (0, -3)]
+        cursor_ok = stale.status_code == 409 and invalid == [400, 400]
+
+        compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        plain = client.get(url)
+        gzip_ok = compressed.headers.get('Content-Encoding') == 'gzip' and \
+            gzip.decompress(compressed.get_data()) == plain.get_data() and len(compressed.get_data()) < len(plain.get_data())
+    finally:
+        web.job_manager = None
+
+    if formats_ok and paging_ok and cursor_ok and gzip_ok:
+        print(f"✓ 结果格式和分页正常（{len(rows)} 只股票，gzip后 {len(compressed.get_data())}/{len(plain.get_data())} 字节）")
+        return True
+    else:
+        print(f"✗ 结果格式或分页异常：格式 {formats_ok}，分页 {paging_ok}，游标 {cursor_ok}，压缩 {gzip_ok}")
+        return False
+
+def test_indicators_offline():
+    """离线测试：指标引擎的结果与pandas逐只计算一致，sma_5/sma_20的指标筛选与均线差异扫描结果相同，
+    成交量指标的筛选使用成交量面板，周期为0的指标和以下划线开头的中间量被拒绝"""
+    print("\n测试指标引擎（离线数据）...")
+    import numpy as np
+    import pandas as pd
+    from fake_tushare import FakeProApi
+    from indicators import IndicatorEngine, parse_spec
+
+    api = FakeProApi(n_stocks=20, n_days=120)
+    analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False))
+    stock_list = analyzer.fetcher.get_stock_list()
+
+    history = {ts_code: analyzer.fetcher.get_recent_data(ts_code, 120)['close'] for ts_code in stock_list['ts_code']}
+    close = pd.DataFrame({ts_code: series.to_numpy() for ts_code, series in history.items() if len(series) == 120})
+    engine = IndicatorEngine(close.to_numpy())
+    ema12 = close.ewm(span=12, adjust=False).mean()
+    expected = {
+        'sma_20': close.rolling(20).mean(),
+        'ema_12': ema12,
+        'macd': ema12 - close.ewm(span=26, adjust=False).mean(),
+        'boll_upper': close.rolling(20).mean() + 2 * close.rolling(20).std(ddof=0)
+    }
+    max_error = max(np.nanmax(np.abs(engine.get(spec) - values.to_numpy())) for spec, values in expected.items())
+
+    screened = analyzer.screen_indicators([('sma_5', 'sma_20')], [3], stock_list)[0]['results']
+    scanned = analyzer.analyze_market(20, 3)
+    same = set(screened['ts_code']) == set(scanned['ts_code'])
+
+    vol = api.daily().pivot(index='trade_date', columns='ts_code', values='vol').sort_index()
+    vol_screened = analyzer.screen_indicators([('vol_ma_5', 'vol_ma_20')], [0], stock_list)[0]['results']
+    vol_expected = (vol.rolling(5).mean() / vol.rolling(20).mean() - 1).iloc[-1] * 100
+    vol_error = max(abs(row['diff_percent'] - vol_expected[row['ts_code']]) for _, row in vol_screened.iterrows())
+    vol_ok = len(vol_screened) == len(stock_list) and vol_error < 1e-6
+
+    rejected = True
+    for spec in ['sma_0', '_count', '_close_sum_5']:
+        try:
+            parse_spec(spec)
+            rejected = False
+        except ValueError:
+            pass
+
+    if max_error < 1e-4 and same and vol_ok and rejected:
+        print(f"✓ 指标引擎结果正确（最大误差 {max_error:.2e}，筛选出 {len(screened)} 只股票，成交量指标误差 {vol_error:.2e}）")
+        return True
+    else:
+        print(f"✗ 指标引擎结果异常，最大误差 {max_error}，筛选结果一致 {same}，成交量指标正确 {vol_ok}，拒绝sma_0和中间量 {rejected}")
+        return False
+
+def test_backtest_offline():
+    """离线测试：回测中每天的信号与当天运行扫描的结果一致，收益统计与逐条计算一致"""
+    print("\n测试历史回测（离线数据）...")
+    import numpy as np
+    from backtest import backtest, forward_returns, ma_diff_history
+    from fake_tushare import generate_market
+    from ma_engine import compute_ma_diff
+
+    market = generate_market(n_stocks=50, n_days=200, seed=1)
+    close = market['daily'].pivot(index='trade_date', columns='ts_code', values='close').sort_index().to_numpy()
+
+    history = ma_diff_history(close, [20])[20]
+    max_error = 0.0
+    for day in range(40, len(close), 20):
+        expected = compute_ma_diff(close[:day + 1], 20)['diff_percent']
+        checked = ~np.isnan(expected) & ~np.isnan(close[day])
+        max_error = max(max_error, np.abs(history[day][checked] - expected[checked]).max())
+
+    df = backtest(close, [20], [5], [10])
+    row = df[df['side'] == 'above'].iloc[0]
+    returns = forward_returns(close, 10)
+    selected = (history > 5) & ~np.isnan(returns)
+    same = row['signals'] == selected.sum() and abs(row['mean_return'] - returns[selected].mean()) < 1e-9
+
+    # 到期日停牌时只用持有期内的最后一个收盘价，持有期内一直停牌时没有收益
+    suspended = forward_returns(np.array([[10.0], [11.0], [np.nan], [np.nan], [12.0], [np.nan]]), 2)[:, 0]
+    stale_ok = np.allclose(suspended, [10.0, np.nan, np.nan, np.nan, np.nan, np.nan], equal_nan=True)
+
+    if max_error < 1e-6 and same and stale_ok:
+        print(f"✓ 回测结果正确（最大误差 {max_error:.2e}，{row['signals']} 个信号，10日平均收益 {row['mean_return']:.2f}%）")
+        return True
+    else:
+        print(f"✗ 回测结果异常，最大误差 {max_error}，收益统计一致 {same}，停牌收益 {suspended}")
+        return False
+
+def test_stock_search_offline():
+    """离线测试：代码前缀、名称和拼音首字母搜索的排名，以及股票列表刷新后索引重建"""
+    print("\n测试股票搜索（离线数据）...")
+    import pandas as pd
+    from stock_search import get_search_index
+
+    stock_list = pd.DataFrame({
+        'ts_code': ['000001.SZ', '600036.SH', '600000.SH', '601398.SH', '000002.SZ'],
+        'name': ['平安银行', '招商银行', '浦发银行', '工商银行', '万科A']
+    })
+    index = get_search_index(stock_list, 1)
+
+    checks = [
+        (index.search('600036'), [('600036.SH', 'code')]),
+        (index.search('6000', 5), [('600000.SH', 'code_prefix'), ('600036.SH', 'code_prefix')]),
+        (index.search('招商银行'), [('600036.SH', 'name')]),
+        (index.search('payh'), [('000001.SZ', 'pinyin_prefix')]),
+        (index.search('wk'), [('000002.SZ', 'pinyin_prefix')]),
+        (index.search('银行', 2), [('000001.SZ', 'name_contains'), ('600000.SH', 'name_contains')])
+    ]
+    ranked = all([(r['ts_code'], r['match']) for r in results] == expected for results, expected in checks)
+
+    refreshed = stock_list.assign(name=stock_list['name'].replace('万科A', '万科B'))
+    rebuilt = get_search_index(refreshed, 2) is not index and get_search_index(refreshed, 2).search('000002')[0]['name'] == '万科B'
+
+    if ranked and rebuilt:
+        print("✓ 股票搜索结果正确，列表刷新后索引已重建")
+        return True
+    else:
+        print(f"✗ 股票搜索结果异常：{[results for results, _ in checks]}，索引重建 {rebuilt}")
+        return False
+
+def test_checkpoint_offline():
+    """离线测试：有股票获取失败的扫描再次运行时从断点继续，失败的股票重试后补齐，仍失败的在覆盖率中列出；
+    按交易日批量扫描时某个交易日获取失败会重试，仍失败时覆盖率为0；断点文件中损坏的行被跳过"""
+    print("\n测试断点续扫（离线数据）...")
+    import json
+    import tempfile
+    from fake_tushare import FakeProApi
+    from fetch_pool import FetchPool
+    from scan_checkpoint import ScanCheckpoint
+
+    class FlakyProApi(FakeProApi):
+        """failures中的股票（或交易日）前几次获取日线时失败"""
+
+        def __init__(self, failures=None, **kwargs):
+            super().__init__(**kwargs)
+            self.failures = dict(failures or {})
+
+        def daily(self, ts_code=None, **kwargs):
+            key = ts_code or kwargs.get('trade_date')
+            if self.failures.get(key, 0) > 0:
+                self.failures[key] -= 1
+                raise ValueError('网络抖动')
+            return super().daily(ts_code=ts_code, **kwargs)
+
+    root = tempfile.mkdtemp()
+
+    def scan(api, resume=True):
+        analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False), checkpoint_dir=root)
+        analyzer.retry_backoff = 0.01
+        return analyzer.scan_stocks(api.stock_basic(), DEFAULT_LONG_PERIOD, use_panel=False, resume=resume)
+
+    codes = FakeProApi(n_stocks=40, n_days=60).stock_basic()['ts_code'].tolist()
+
+    # 第一次扫描：15只股票一直获取失败，重试后仍失败
+    interrupted = scan(FlakyProApi(n_stocks=40, n_days=60, failures={ts_code: 10 for ts_code in codes[25:]}),
+                       resume=False).attrs['coverage']
+
+    # 再次扫描：从断点恢复25只，只获取剩下的15只，其中一只第一次失败、重试后成功
+    api = FlakyProApi(n_stocks=40, n_days=60, failures={codes[-1]: 1})
+    resumed = scan(api)
+    coverage = resumed.attrs['coverage']
+
+    reported = interrupted['failed_count'] == 15 and interrupted['coverage'] == 62.5
+    complete = (coverage['resumed'] == 25 and coverage['retried'] == 1 and coverage['coverage'] == 100
+                and api.call_counts['daily'] == 15 and set(resumed['ts_code']) == set(codes))
+
+    # 按交易日批量扫描：某个交易日失败一次时重试补齐，一直失败时全部股票计为失败
+    def scan_panel(failures):
+        api = FlakyProApi(n_stocks=40, n_days=60, failures=failures)
+        analyzer = StockAnalyzer(StockDataFetcher(pro=api, store=False, pool=FetchPool(max_retries=0)),
+                                 state_dir=tempfile.mkdtemp())
+        analyzer.retry_backoff = 0.01
+        return analyzer.scan_stocks(api.stock_basic(), DEFAULT_LONG_PERIOD, use_panel=True)
+
+    trade_date = StockDataFetcher(pro=FakeProApi(n_stocks=40, n_days=60), store=False).get_trade_dates(10)[5]
+    clean = scan_panel({})
+    recovered = scan_panel({trade_date: 1})
+    broken = scan_panel({trade_date: 10}).attrs['coverage']
+    panel_ok = (recovered.attrs['coverage']['coverage'] == 100 and recovered.attrs['coverage']['retried'] == 40
+                and recovered['diff_percent'].tolist() == clean['diff_percent'].tolist()
+                and broken['coverage'] == 0 and broken['failed_count'] == 40)
+
+    # 断点文件中间的损坏行（如并发写入交错）只丢失这一批；交易日为None时不删除其他断点
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, 'scan_20240105_20.jsonl'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'000001.SZ': None}) + '\n{"000002.SZ": nu\n' + json.dumps({'000003.SZ': None}))
+    ScanCheckpoint.open(None, 20, root)
+    checkpoint = ScanCheckpoint.open('20240105', 20, root)
+    checkpoint.add('000004.SZ', None)
+    checkpoint.flush()
+    files_ok = set(ScanCheckpoint.open('20240105', 20, root).results) == {'000001.SZ', '000003.SZ', '000004.SZ'}
+
+    if reported and complete and panel_ok and files_ok:
+        print(f"✓ 断点续扫正常（恢复 {coverage['resumed']} 只，重试 {coverage['retried']} 只，"
+              f"只调用 daily {api.call_counts['daily']} 次；按交易日扫描失败后重试补齐）")
+        return True
+    else:
+        print(f"✗ 断点续扫异常：首次 {interrupted}，续扫 {coverage}，daily 调用 {api.call_counts['daily']} 次，"
+              f"按交易日扫描 {panel_ok}，断点文件 {files_ok}")
+        return False
+
 def main():
     """主测试函数"""
     print("=" * 50)
@@ -105,7 +1102,30 @@ def main():
         ("股票数据获取", test_stock_data),
         ("股票分析功能", test_stock_analysis, {"stock_list": None}),
         ("批量分析功能", test_batch_analysis, {"stock_list": None}),
-        ("股票详情获取", test_stock_details, {"stock_list": None})
+        ("股票详情获取", test_stock_details, {"stock_list": None}),
+        ("面板模式（离线）", test_panel_offline),
+        ("本地存储（离线）", test_store_offline),
+        ("向量化均线引擎（离线）", test_vectorized_offline),
+        ("多进程分片扫描（离线）", test_parallel_scan_offline),
+        ("令牌桶限流和重试（离线）", test_rate_limit_offline),
+        ("异步获取流水线（离线）", test_async_offline),
+        ("行情缓存淘汰和过期（离线）", test_data_cache_offline),
+        ("增量均线扫描（离线）", test_incremental_offline),
+        ("多参数扫描（离线）", test_sweep_offline),
+        ("扫描结果缓存（离线）", test_result_memo_offline),
+        ("筛选任务管理（离线）", test_jobs_offline),
+        ("前K名选择和排行（离线）", test_top_k_offline),
+        ("流式结果推送（离线）", test_stream_offline),
+        ("运行指标（离线）", test_metrics_offline),
+        ("图表数据（离线）", test_chart_offline),
+        ("启动快照（离线）", test_snapshot_offline),
+        ("收盘后预计算（离线）", test_scheduler_offline),
+        ("并发请求合并（离线）", test_single_flight_offline),
+        ("结果格式和分页（离线）", test_response_format_offline),
+        ("指标引擎（离线）", test_indicators_offline),
+        ("历史回测（离线）", test_backtest_offline),
+        ("股票搜索（离线）", test_stock_search_offline),
+        ("断点续扫（离线）", test_checkpoint_offline)
     ]
 
     passed = 0
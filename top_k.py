@@ -0,0 +1,66 @@
+import heapq
+import itertools
+import threading
+import numpy as np
+from config import TOP_K_SIZE
+
+def top_k_indices(values, k, offset=0):
+    """按绝对值从大到小排名，返回第offset名开始的k个元素的下标
+
+    先用np.partition找出第offset+k名的绝对值（O(n)），只对不小于它的元素排序，不对全部结果排序。
+    绝对值相同时下标小的排在前面。
+    """
+    magnitude = np.abs(np.asarray(values, dtype=float))
+    end = min(offset + k, len(magnitude))
+    if offset >= end:
+        return np.empty(0, dtype=np.int64)
+
+    if end < len(magnitude):
+        # 与第end名绝对值并列的元素都作为候选，否则argpartition可能选中并列中下标较大的元素
+        threshold = -np.partition(-magnitude, end - 1)[end - 1]
+        candidates = np.flatnonzero(magnitude >= threshold) if not np.isnan(threshold) else np.arange(len(magnitude))
+    else:
+        candidates = np.arange(len(magnitude))
+
+    ranked = candidates[np.argsort(-magnitude[candidates], kind='stable')]
+    return ranked[offset:end]
+
+def top_k_rows(df, k, offset=0, key='diff_percent'):
+    """按key列绝对值从大到小排名，返回第offset名开始的k行"""
+    return df.iloc[top_k_indices(df[key].to_numpy(), k, offset)]
+
+class TopKHeap:
+    """增量维护差异百分比绝对值最大的K只股票
+
+    内部是大小为K的最小堆，堆顶是当前第K名；新结果只需和堆顶比较，每次插入O(log K)，
+    扫描过程中随时可以读取当前排行。
+    """
+
+    def __init__(self, k=TOP_K_SIZE, key='diff_percent'):
+        self.k = k
+        self.key = key
+        self.heap = []  # (|diff_percent|, 序号, 记录)
+        self.counter = itertools.count()  # 绝对值相同时按到达顺序比较，避免比较记录本身
+        self.lock = threading.Lock()
+
+    def push(self, record):
+        """加入一条结果，进入前K名时返回True"""
+        entry = (abs(record[self.key]), next(self.counter), record)
+
+        with self.lock:
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+                return True
+            if entry[0] > self.heap[0][0]:
+                heapq.heapreplace(self.heap, entry)
+                return True
+            return False
+
+    def items(self):
+        """当前前K名，按差异百分比绝对值从大到小排列"""
+        with self.lock:
+            entries = sorted(self.heap, key=lambda entry: (-entry[0], entry[1]))
+        return [entry[2] for entry in entries]
+
+    def __len__(self):
+        return len(self.heap)